@@ -0,0 +1,358 @@
+# ADCO - Almacén incremental de comparables
+# Un único almacén SQLite indexado por ID de anuncio de Idealista: inserta solo anuncios nuevos,
+# registra cambios de precio y fechas de primera/última aparición.
+
+import os
+import re
+import sqlite3
+from contextlib import contextmanager
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from estadisticas_robustas import resumen_robusto
+from instrumentacion import medido
+from parser_anuncios import compactar, concatenar_compactos, estado, numeros, reparar_superficie, tipar, validar_comparables
+
+RUTA_ALMACEN = os.environ.get("ADCO_ALMACEN", os.path.join("datos_adco", "comparables.sqlite"))
+
+# Columnas del almacén y su nombre en las tablas de la app
+COLUMNAS = {
+    "id_anuncio": "ID",
+    "zona": "Zona",
+    "subzona": "Subzona",
+    "titulo": "Título",
+    "precio": "Precio (€)",
+    "superficie": "Superficie (m²)",
+    "eur_m2": "€/m²",
+    "habitaciones": "Habitaciones",
+    "banos": "Baños",
+    "planta": "Planta",
+    "estado": "Estado",
+    "descripcion": "Descripción",
+    "link": "Link",
+    "primera_vez": "Primera vez",
+    "ultima_vez": "Última vez",
+    "duplicado_de": "Duplicado de",
+}
+CAMPOS_DATOS = ["zona", "subzona", "titulo", "precio", "superficie", "eur_m2",
+                "habitaciones", "banos", "planta", "estado", "descripcion", "link"]
+
+PATRON_ID = re.compile(r"/inmueble/(\d+)")
+
+
+def extraer_id_anuncio(link):
+    """ID numérico de Idealista a partir del enlace (/inmueble/<id>/), o None."""
+    m = PATRON_ID.search(str(link))
+    return m.group(1) if m else None
+
+
+def _huellas(titulos, precios):
+    """Clave de casi-duplicados de cada anuncio: mismo título normalizado y mismo precio."""
+    texto = (
+        titulos.fillna("").astype(str).str.normalize("NFKD")
+        .str.encode("ascii", "ignore").str.decode("ascii").str.lower()
+        .str.replace(r"[^a-z0-9]+", " ", regex=True).str.strip()
+    )
+    precio = precios.round().astype("Int64").astype(str)
+    return (texto + "|" + precio).where(precios.notna(), None)
+
+
+@medido("conversion.normalizar", filas=lambda resultado: len(resultado[0]) + len(resultado[1]))
+def normalizar_comparables(df, zona=None):
+    """
+    Pasa un DataFrame de comparables (columnas de la app o del CSV) al esquema del almacén.
+    Devuelve (datos, rechazados); los rechazados llevan el motivo del parser.
+    """
+    datos = df.copy()
+    if "Link" in datos.columns:
+        # Los enlaces pueden venir ya formateados como "[Ver anuncio](url)"
+        datos["Link"] = datos["Link"].astype(str).str.extract(r"(https?://[^\s)'\"]+)", expand=False)
+    if "Descripción" not in datos.columns and "Estado" in datos.columns:
+        # En los CSV exportados la descripción ocupa la columna "Estado"
+        if datos["Estado"].astype(str).str.len().gt(40).any():
+            datos = datos.rename(columns={"Estado": "Descripción"})
+    for columna in ["Precio (€)", "Superficie (m²)", "Habitaciones", "Baños", "Planta"]:
+        if columna in datos.columns:
+            datos[columna] = numeros(datos[columna])
+
+    datos = tipar(datos)
+    if zona is not None:
+        datos["Zona"] = datos["Zona"].fillna(zona)
+    if datos["Subzona"].isna().all():
+        # "Piso en calle X, Almagro, Madrid" / "Piso en Almagro, Madrid" -> "Almagro"
+        datos["Subzona"] = datos["Título"].astype(str).str.extract(
+            r"(?:,|\ben\b)\s*([^,]+),\s*Madrid\s*$", expand=False
+        ).str.strip()
+    sin_estado = datos["Estado"].isna()
+    datos.loc[sin_estado, "Estado"] = (
+        datos.loc[sin_estado, "Título"].fillna("") + " " + datos.loc[sin_estado, "Descripción"].fillna("")
+    ).map(estado)
+    datos = reparar_superficie(datos)
+    datos, rechazados = validar_comparables(datos)
+    # Sin enlace /inmueble/<id>/ no hay clave con la que guardar el anuncio
+    ids = datos["Link"].map(extraer_id_anuncio)
+    sin_id = ids.isna()
+    if sin_id.any():
+        rechazados = pd.concat([rechazados, datos[sin_id].assign(Motivo="sin ID de anuncio")], ignore_index=True)
+
+    inverso = {v: k for k, v in COLUMNAS.items()}
+    datos = datos[~sin_id].rename(columns=inverso)
+    datos["id_anuncio"] = ids[~sin_id]
+    datos = datos.drop_duplicates("id_anuncio", keep="last")
+    return datos[["id_anuncio"] + CAMPOS_DATOS].reset_index(drop=True), rechazados
+
+
+class AlmacenComparables:
+    """Almacén SQLite de anuncios con historial de precios."""
+
+    def __init__(self, ruta=None):
+        self.ruta = ruta or RUTA_ALMACEN
+        os.makedirs(os.path.dirname(self.ruta) or ".", exist_ok=True)
+        with self._conectar() as con:
+            con.executescript("""
+                CREATE TABLE IF NOT EXISTS anuncios (
+                    id_anuncio TEXT PRIMARY KEY,
+                    zona TEXT,
+                    subzona TEXT,
+                    titulo TEXT,
+                    precio REAL,
+                    superficie REAL,
+                    eur_m2 REAL,
+                    habitaciones INTEGER,
+                    banos INTEGER,
+                    planta INTEGER,
+                    estado TEXT,
+                    descripcion TEXT,
+                    link TEXT,
+                    huella TEXT,
+                    duplicado_de TEXT,
+                    primera_vez TEXT NOT NULL,
+                    ultima_vez TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_anuncios_zona ON anuncios (zona, subzona);
+                CREATE INDEX IF NOT EXISTS idx_anuncios_subzona ON anuncios (subzona);
+                CREATE INDEX IF NOT EXISTS idx_anuncios_eur_m2 ON anuncios (eur_m2);
+                CREATE INDEX IF NOT EXISTS idx_anuncios_huella ON anuncios (huella);
+                CREATE TABLE IF NOT EXISTS cambios_precio (
+                    id_anuncio TEXT NOT NULL,
+                    fecha TEXT NOT NULL,
+                    precio_anterior REAL,
+                    precio_nuevo REAL
+                );
+                CREATE INDEX IF NOT EXISTS idx_cambios_id ON cambios_precio (id_anuncio);
+            """)
+            columnas = {fila[1] for fila in con.execute("PRAGMA table_info(anuncios)")}
+            if "planta" not in columnas:
+                con.execute("ALTER TABLE anuncios ADD COLUMN planta INTEGER")
+
+    @contextmanager
+    def _conectar(self):
+        con = sqlite3.connect(self.ruta, timeout=30)
+        try:
+            con.execute("PRAGMA journal_mode=WAL")
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    @medido("almacen.actualizar", filas=lambda cambios: cambios["nuevos"] + cambios["cambios_precio"] + cambios["sin_cambios"])
+    def actualizar(self, df, zona=None, fecha=None):
+        """
+        Inserta o actualiza los anuncios de df y devuelve cuántos son nuevos,
+        cuántos han cambiado de precio y cuántos siguen igual. Solo se escriben
+        las diferencias; para el resto únicamente se actualiza la última fecha vista.
+        """
+        fecha = fecha or date.today().isoformat()
+        if "id_anuncio" in df.columns:
+            # Ya en el esquema del almacén (p. ej. bloques de la ingesta por streaming)
+            datos, rechazados = df.copy(), df.iloc[0:0]
+        else:
+            datos, rechazados = normalizar_comparables(df, zona=zona)
+        if datos.empty:
+            return {"nuevos": 0, "cambios_precio": 0, "sin_cambios": 0, "rechazados": len(rechazados)}
+        datos["huella"] = _huellas(datos["titulo"], datos["precio"])
+
+        with self._conectar() as con:
+            con.execute("CREATE TEMP TABLE entrantes (id_anuncio TEXT PRIMARY KEY)")
+            con.executemany("INSERT INTO entrantes VALUES (?)", [(i,) for i in datos["id_anuncio"]])
+            existentes = pd.read_sql_query(
+                "SELECT a.id_anuncio, a.precio FROM anuncios a JOIN entrantes e USING (id_anuncio)", con
+            ).set_index("id_anuncio")["precio"]
+
+            es_nuevo = ~datos["id_anuncio"].isin(existentes.index)
+            nuevos = datos[es_nuevo]
+            previos = datos[~es_nuevo]
+            precio_anterior = previos["id_anuncio"].map(existentes)
+            cambia = ~np.isclose(previos["precio"], precio_anterior, equal_nan=True)
+            cambiados = previos[cambia]
+
+            filas = nuevos[["id_anuncio"] + CAMPOS_DATOS + ["huella"]].astype(object)
+            filas = filas.where(filas.notna(), None).assign(primera_vez=fecha, ultima_vez=fecha)
+            registros = filas.itertuples(index=False, name=None)
+            con.executemany(
+                f"INSERT INTO anuncios (id_anuncio, {', '.join(CAMPOS_DATOS)}, huella, primera_vez, ultima_vez) "
+                f"VALUES ({', '.join(['?'] * (len(CAMPOS_DATOS) + 4))})",
+                registros,
+            )
+            con.executemany(
+                "INSERT INTO cambios_precio VALUES (?, ?, ?, ?)",
+                zip(cambiados["id_anuncio"], [fecha] * len(cambiados),
+                    precio_anterior[cambia], cambiados["precio"]),
+            )
+            con.executemany(
+                "UPDATE anuncios SET precio = ?, eur_m2 = ?, huella = ? WHERE id_anuncio = ?",
+                zip(cambiados["precio"], cambiados["eur_m2"], cambiados["huella"], cambiados["id_anuncio"]),
+            )
+            con.execute(
+                "UPDATE anuncios SET ultima_vez = ? WHERE id_anuncio IN (SELECT id_anuncio FROM entrantes)",
+                (fecha,),
+            )
+            # Casi-duplicados: mismo título y precio con otro ID; se enlazan al más antiguo
+            con.execute("""
+                UPDATE anuncios SET duplicado_de = (
+                    SELECT MIN(b.id_anuncio) FROM anuncios b
+                    WHERE b.huella = anuncios.huella AND b.id_anuncio < anuncios.id_anuncio
+                )
+                WHERE id_anuncio IN (SELECT id_anuncio FROM entrantes)
+            """)
+            con.execute("DROP TABLE entrantes")
+
+        return {
+            "nuevos": int(len(nuevos)),
+            "cambios_precio": int(cambia.sum()),
+            "sin_cambios": int(len(previos) - cambia.sum()),
+            "rechazados": int(len(rechazados)),
+        }
+
+    def importar_csv(self, ruta_csv, zona):
+        """Carga un CSV comparables_<zona>.csv del formato anterior en el almacén."""
+        return self.actualizar(pd.read_csv(ruta_csv), zona=zona)
+
+    @staticmethod
+    def _filtros(zona=None, subzona=None, eur_m2_min=None, eur_m2_max=None, incluir_duplicados=False):
+        """Cláusula WHERE y parámetros de los filtros de consulta."""
+        condiciones, params = [], []
+        for campo, valor in [("zona", zona), ("subzona", subzona)]:
+            if valor is not None:
+                condiciones.append(f"{campo} = ?")
+                params.append(valor)
+        if eur_m2_min is not None:
+            condiciones.append("eur_m2 >= ?")
+            params.append(eur_m2_min)
+        if eur_m2_max is not None:
+            condiciones.append("eur_m2 <= ?")
+            params.append(eur_m2_max)
+        if not incluir_duplicados:
+            condiciones.append("duplicado_de IS NULL")
+        return (" WHERE " + " AND ".join(condiciones)) if condiciones else "", params
+
+    @medido("almacen.consultar", filas=len)
+    def consultar(self, zona=None, subzona=None, eur_m2_min=None, eur_m2_max=None,
+                  incluir_duplicados=False, columnas=None, orden=None, limite=None, desplazamiento=0):
+        """
+        Anuncios filtrados por zona/subzona/rango de €/m² (usa los índices del almacén).
+        Con limite y desplazamiento devuelve una sola página, ordenada por `orden`
+        (columna del almacén, con "-" delante para orden descendente).
+        """
+        where, params = self._filtros(zona, subzona, eur_m2_min, eur_m2_max, incluir_duplicados)
+        # La descripción solo se lee si se pide expresamente (ver descripciones())
+        columnas = columnas or [c for c in COLUMNAS if c != "descripcion"]
+        sql = f"SELECT {', '.join(columnas)} FROM anuncios{where}"
+        if orden is not None:
+            campo = orden.lstrip("-")
+            if campo not in COLUMNAS:
+                raise ValueError(f"Columna de orden desconocida: {campo}")
+            sql += f" ORDER BY {campo} {'DESC' if orden.startswith('-') else 'ASC'}, id_anuncio"
+        if limite is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params += [int(limite), int(desplazamiento)]
+        with self._conectar() as con:
+            df = pd.read_sql_query(sql, con, params=params)
+        return df.rename(columns=COLUMNAS)
+
+    @medido("almacen.cargar_compacto", filas=len)
+    def cargar_compacto(self, zona=None, subzona=None, incluir_duplicados=False, tamano_bloque=100_000):
+        """
+        Anuncios filtrados con el ESQUEMA_COMPACTO del parser y el ID numérico como índice,
+        leídos y compactados por bloques para que el pico de memoria no sea el de la tabla
+        en texto. La descripción no se carga (ver descripciones()) y el enlace se obtiene
+        del ID con enlace_anuncio().
+        """
+        where, params = self._filtros(zona, subzona, None, None, incluir_duplicados)
+        columnas = [c for c in CAMPOS_DATOS if c not in ("descripcion", "link")]
+        with self._conectar() as con:
+            bloques = [
+                compactar(bloque.astype({"id_anuncio": "int64"}).set_index("id_anuncio").rename(columns=COLUMNAS))
+                for bloque in pd.read_sql_query(
+                    f"SELECT id_anuncio, {', '.join(columnas)} FROM anuncios{where}", con,
+                    params=params, chunksize=tamano_bloque,
+                )
+            ]
+        df = concatenar_compactos(bloques) if bloques else compactar(pd.DataFrame(columns=[COLUMNAS[c] for c in columnas]))
+        df.index.name = "ID"
+        return df
+
+    def descripciones(self, ids):
+        """Descripción de los anuncios indicados (Series por ID), leída del almacén bajo demanda."""
+        ids = [str(i) for i in ids]
+        if not ids:
+            return pd.Series(dtype=object, name="Descripción")
+        with self._conectar() as con:
+            con.execute("CREATE TEMP TABLE pedidos (id_anuncio TEXT PRIMARY KEY)")
+            con.executemany("INSERT OR IGNORE INTO pedidos VALUES (?)", [(i,) for i in ids])
+            df = pd.read_sql_query(
+                "SELECT a.id_anuncio, a.descripcion FROM anuncios a JOIN pedidos p USING (id_anuncio)", con
+            )
+            con.execute("DROP TABLE pedidos")
+        return df.set_index("id_anuncio")["descripcion"].reindex(ids).rename("Descripción")
+
+    @medido("almacen.resumen_eur_m2")
+    def resumen_eur_m2(self, zona=None, subzona=None, eur_m2_min=None, eur_m2_max=None):
+        """Número de anuncios y €/m² medio, mínimo y máximo calculados en SQLite."""
+        where, params = self._filtros(zona, subzona, eur_m2_min, eur_m2_max)
+        with self._conectar() as con:
+            n, media, minimo, maximo = con.execute(
+                f"SELECT COUNT(*), AVG(eur_m2), MIN(eur_m2), MAX(eur_m2) FROM anuncios{where}", params
+            ).fetchone()
+        return {"n": n, "media": media, "minimo": minimo, "maximo": maximo}
+
+    @medido("almacen.resumen_robusto")
+    def resumen_robusto(self, zona=None, subzona=None):
+        """
+        Estadísticos robustos de €/m² (mediana, MAD, vallas de atípicos, media recortada...)
+        y mediana por estado, leyendo solo las columnas eur_m2 y estado como arrays.
+        """
+        where, params = self._filtros(zona, subzona)
+        with self._conectar() as con:
+            filas = con.execute(f"SELECT eur_m2, estado FROM anuncios{where}", params).fetchall()
+        valores = np.fromiter((f[0] if f[0] is not None else np.nan for f in filas), dtype=np.float64, count=len(filas))
+        return resumen_robusto(valores, [f[1] for f in filas])
+
+    def historial_precios(self, id_anuncio):
+        """Cambios de precio registrados para un anuncio."""
+        with self._conectar() as con:
+            return pd.read_sql_query(
+                "SELECT fecha, precio_anterior, precio_nuevo FROM cambios_precio "
+                "WHERE id_anuncio = ? ORDER BY fecha", con, params=[str(id_anuncio)]
+            )
+
+    def version(self):
+        """Huella barata del contenido (para invalidar cálculos cacheados sobre el almacén)."""
+        with self._conectar() as con:
+            return con.execute(
+                "SELECT COUNT(*), MAX(ultima_vez), (SELECT COUNT(*) FROM cambios_precio) FROM anuncios"
+            ).fetchone()
+
+    def zonas(self):
+        """Zonas con anuncios en el almacén."""
+        with self._conectar() as con:
+            return [z for (z,) in con.execute("SELECT DISTINCT zona FROM anuncios WHERE zona IS NOT NULL ORDER BY zona")]
+
+    def contar(self, zona=None):
+        """Número de anuncios (opcionalmente de una zona)."""
+        with self._conectar() as con:
+            if zona is None:
+                return con.execute("SELECT COUNT(*) FROM anuncios").fetchone()[0]
+            return con.execute("SELECT COUNT(*) FROM anuncios WHERE zona = ?", (zona,)).fetchone()[0]
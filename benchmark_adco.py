@@ -0,0 +1,488 @@
+# ADCO - Benchmarks de rendimiento
+# Mide el motor financiero, la rejilla y la superficie de sensibilidad, el parser de páginas
+# de Idealista (sin red), el optimizador de cartera y la agregación/filtrado de €/m² sobre
+# comparables sintéticos de 50 a 1M filas, además de la memoria de los comparables con el
+# esquema de texto y con el compacto.
+# Guarda los resultados en JSON para comparar entre commits.
+#
+# Uso:
+#   python benchmark_adco.py                                  # todo, resultados en benchmarks_adco/
+#   python benchmark_adco.py --rapido --filtro parser         # sin los tamaños grandes, solo el parser
+#   python benchmark_adco.py --html-dir paginas_guardadas/    # parsea también páginas HTML reales
+#   python benchmark_adco.py --comparar benchmarks_adco/base.json --umbral 1.2
+
+import argparse
+import glob
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from almacen_comparables import COLUMNAS
+from calculo_tir import tir_flujo_simple, tir_vectorizada
+from cartera_operaciones import optimizar_cartera
+from estadisticas_robustas import agregar_robusto
+from flujo_mensual import evaluar_mensual
+from informes_inversion import datos_informe, generar_pdf
+from indice_mercado import agregar, ajustar_por_estado
+from motor_financiero import VALORES_POR_DEFECTO, evaluar_operaciones, escenarios_precio_venta
+from parser_anuncios import ESQUEMA, compactar, memoria, parsear_anuncios, validar_comparables
+from superficie_escenarios import calcular_superficie
+from valoracion_comparables import ValoradorComparables
+
+CARPETA_RESULTADOS = "benchmarks_adco"
+TAMANOS_COMPARABLES = [50, 10_000, 100_000, 1_000_000]
+TAMANOS_LOTE = [1, 1_000, 100_000, 1_000_000]
+TAMANO_MAXIMO_RAPIDO = 100_000
+
+SUBZONAS = {
+    "Chamberí": ["Almagro", "Trafalgar", "Ríos Rosas", "Vallehermoso", "Arapiles", "Gaztambide"],
+    "Salamanca": ["Recoletos", "Castellana", "Goya", "Lista", "Guindalera", "Fuente del Berro"],
+    "Retiro": ["Ibiza", "Jerónimos", "Niño Jesús", "Estrella", "Adelfas", "Pacífico"],
+}
+ESTADOS = ["Reformado", "A reformar", "Obra nueva", None]
+
+BENCHMARKS = {}
+
+
+def benchmark(nombre, tamanos=(None,)):
+    """Registra una función que prepara los datos y devuelve el callable a medir."""
+    def registrar(preparar):
+        for tamano in tamanos:
+            etiqueta = "x".join(map(str, tamano)) if isinstance(tamano, tuple) else tamano
+            clave = nombre if tamano is None else f"{nombre}[{etiqueta}]"
+            BENCHMARKS[clave] = (preparar, tamano)
+        return preparar
+    return registrar
+
+
+def medir(funcion, repeticiones=5, tiempo_minimo=0.2, rondas_maximas=1000):
+    """
+    Ejecuta funcion en rondas hasta sumar tiempo_minimo (y al menos `repeticiones` veces)
+    y devuelve min/mediana/media/desviación en segundos.
+    """
+    funcion()  # calentamiento
+    tiempos = []
+    total = 0.0
+    while len(tiempos) < repeticiones or (total < tiempo_minimo and len(tiempos) < rondas_maximas):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+        total += tiempos[-1]
+    return {
+        "min": min(tiempos),
+        "mediana": statistics.median(tiempos),
+        "media": statistics.fmean(tiempos),
+        "desviacion": statistics.stdev(tiempos) if len(tiempos) > 1 else 0.0,
+        "rondas": len(tiempos),
+    }
+
+
+# --- DATOS SINTÉTICOS ---
+
+def comparables_sinteticos(n, semilla=0):
+    """Comparables con el esquema del almacén (zona, subzona, precio, superficie, eur_m2, estado)."""
+    rng = np.random.default_rng(semilla)
+    zonas = np.array(list(SUBZONAS))
+    zona = zonas[rng.integers(0, len(zonas), n)]
+    subzona = np.array([SUBZONAS[z][i] for z, i in zip(zona, rng.integers(0, 6, n))])
+    superficie = np.round(rng.lognormal(np.log(95), 0.45, n)).clip(20, 1500)
+    eur_m2 = rng.lognormal(np.log(8500), 0.3, n)
+    precio = np.round(superficie * eur_m2, -3)
+    estado = np.array(ESTADOS, dtype=object)[rng.integers(0, len(ESTADOS), n)]
+    return pd.DataFrame({
+        "id_anuncio": np.arange(n).astype(str),
+        "zona": zona,
+        "subzona": subzona,
+        "precio": precio,
+        "superficie": superficie,
+        "eur_m2": precio / superficie,
+        "estado": estado,
+    })
+
+
+def comparables_sinteticos_tabla(n, semilla=0):
+    """Los mismos comparables con las columnas de las páginas (ESQUEMA del parser)."""
+    df = comparables_sinteticos(n, semilla)
+    tabla = pd.DataFrame({
+        "Zona": df["zona"],
+        "Subzona": df["subzona"],
+        "Título": "Piso en " + df["subzona"] + ", Madrid",
+        "Precio (€)": df["precio"],
+        "Superficie (m²)": df["superficie"],
+        "€/m²": df["eur_m2"],
+        "Estado": df["estado"],
+    })
+    for columna, tipo in ESQUEMA.items():
+        if columna not in tabla.columns:
+            tabla[columna] = pd.Series(pd.NA, index=tabla.index, dtype="Int64" if tipo == "Int64" else "object")
+    return tabla[list(ESQUEMA)]
+
+
+def operaciones_sinteticas(n, semilla=0):
+    """Lote de operaciones con compra, reforma, venta y deuda variadas."""
+    rng = np.random.default_rng(semilla)
+    superficie = rng.uniform(40, 300, n)
+    return pd.DataFrame({
+        **{campo: np.full(n, float(valor)) for campo, valor in VALORES_POR_DEFECTO.items()},
+        "superficie": superficie,
+        "superficie_reforma": superficie * rng.uniform(0.6, 1.0, n),
+        "precio_compra": superficie * rng.uniform(4000, 9000, n),
+        "precio_venta": superficie * rng.uniform(7000, 13000, n),
+        "porcentaje_prestamo": rng.choice([0.0, 50.0, 70.0], n),
+        "interes_prestamo": rng.uniform(2, 6, n),
+        "plazo_anios": rng.integers(1, 4, n).astype(float),
+    })
+
+
+def pagina_idealista(n_anuncios=30, semilla=0):
+    """HTML con la estructura de una página de resultados de Idealista (fixture sin red)."""
+    rng = np.random.default_rng(semilla)
+    fichas = []
+    for i in range(n_anuncios):
+        superficie = int(rng.integers(35, 400))
+        precio = f"{int(round(superficie * rng.uniform(5000, 14000), -3)):,}".replace(",", ".")
+        subzona = SUBZONAS["Chamberí"][i % 6]
+        fichas.append(f"""
+<article class="item">
+  <div class="item-info-container">
+    <a href="/inmueble/{100000000 + i}/" class="item-link" title="Piso en {subzona}">Piso en calle {i}, {subzona}, Madrid</a>
+    <div class="price-row"><span class="item-price h2-simulated">{precio}<span class="txt-big">€</span></span></div>
+    <div class="item-detail-char">
+      <span class="item-detail">{int(rng.integers(1, 6))} hab.</span>
+      <span class="item-detail">{superficie} m²</span>
+      <span class="item-detail">Planta {int(rng.integers(1, 9))}ª exterior con ascensor</span>
+    </div>
+    <div class="item-description description"><p class="ellipsis">Vivienda {ESTADOS[i % 3].lower()} de {superficie} m2 con mucha luz.</p></div>
+    <div class="listing-tags-container"><span class="listing-tags">{ESTADOS[i % 3]}</span></div>
+  </div>
+</article>""")
+    return f"<html><body><main class=\"listing-items\">{''.join(fichas)}</main></body></html>"
+
+
+# --- MOTOR FINANCIERO ---
+
+@benchmark("motor.operacion_individual")
+def _operacion_individual(_):
+    operacion = dict(VALORES_POR_DEFECTO)
+    return lambda: evaluar_operaciones(operacion)
+
+
+@benchmark("motor.escenarios_precio_venta")
+def _escenarios(_):
+    operacion = dict(VALORES_POR_DEFECTO)
+    return lambda: escenarios_precio_venta(operacion, range(-20, 21, 5))
+
+
+@benchmark("motor.lote", TAMANOS_LOTE)
+def _lote(n):
+    lote = operaciones_sinteticas(n)
+    return lambda: evaluar_operaciones(lote)
+
+
+@benchmark("mensual.lote", [1_000, 100_000])
+def _lote_mensual(n):
+    lote = operaciones_sinteticas(n)
+    lote["meses_venta"] = np.random.default_rng(0).integers(4, 30, n)
+    return lambda: evaluar_mensual(lote, fecha_compra="2025-01-01")
+
+
+@benchmark("tir.flujo_simple", [1_000_000])
+def _tir_simple(n):
+    rng = np.random.default_rng(0)
+    capital = rng.uniform(1e5, 1e6, n)
+    ingreso = capital * rng.uniform(0.7, 1.6, n)
+    return lambda: tir_flujo_simple(capital, ingreso, 2)
+
+
+@benchmark("tir.vectorizada_flujos_mensuales", [10_000])
+def _tir_mensual(n):
+    rng = np.random.default_rng(0)
+    flujos = np.zeros((n, 25))
+    flujos[:, 0] = -rng.uniform(1e5, 1e6, n)
+    flujos[:, 1:24] = -rng.uniform(500, 3000, (n, 23))
+    flujos[:, 24] = -flujos[:, 0] * rng.uniform(0.8, 1.6, n)
+    return lambda: tir_vectorizada(flujos)
+
+
+@benchmark("sensibilidad.rejilla", [(7, 5), (101, 101), (1001, 1001)])
+def _rejilla(dimensiones):
+    """Misma rejilla precio × reforma que el análisis de sensibilidad de la versión 2."""
+    n_precio, n_reforma = dimensiones
+    gastos_total_compra, coste_reforma, precio_venta = 108000.0, 213000.0, 1750000.0
+    iva_reforma, comision_venta = 10.0, 3.0
+    variaciones_precio = np.linspace(-0.15, 0.15, n_precio)
+    variaciones_reforma = np.linspace(-0.1, 0.1, n_reforma)
+
+    def rejilla():
+        vp, vr = np.meshgrid(variaciones_precio, variaciones_reforma, indexing="ij")
+        vp, vr = vp.ravel(), vr.ravel()
+        nuevo_precio_venta = precio_venta * (1 + vp)
+        nuevo_total = gastos_total_compra + coste_reforma * (1 + vr) * (1 + iva_reforma / 100)
+        nuevo_ingreso = nuevo_precio_venta - nuevo_precio_venta * comision_venta / 100
+        nuevo_roi = (nuevo_ingreso - nuevo_total) / nuevo_total * 100
+        nuevo_tir, _ = tir_flujo_simple(nuevo_total, nuevo_ingreso)
+        return nuevo_roi, nuevo_tir
+    return rejilla
+
+
+@benchmark("superficie.calcular")
+def _superficie(_):
+    operacion = {**VALORES_POR_DEFECTO, "porcentaje_prestamo": 70.0, "interes_prestamo": 4.0}
+    return lambda: calcular_superficie(operacion)
+
+
+@benchmark("superficie.corte_y_equilibrio")
+def _superficie_corte(_):
+    superficie = calcular_superficie({**VALORES_POR_DEFECTO, "porcentaje_prestamo": 70.0, "interes_prestamo": 4.0})
+    return lambda: (superficie.corte("roi", interes=5.1, plazo=2), superficie.equilibrio("roi", 20.0))
+
+
+# --- PARSER ---
+
+@benchmark("parser.pagina_sintetica", [30, 300])
+def _parser(n_anuncios):
+    html = pagina_idealista(n_anuncios)
+    return lambda: parsear_anuncios(html, "Almagro", "Chamberí")
+
+
+def _benchmark_paginas_guardadas(carpeta):
+    """Registra el parseo de las páginas .html guardadas en carpeta (si las hay)."""
+    paginas = []
+    for ruta in sorted(glob.glob(os.path.join(carpeta, "*.html"))):
+        with open(ruta, encoding="utf-8") as f:
+            paginas.append(f.read())
+    if not paginas:
+        return
+
+    def preparar(_):
+        return lambda: [parsear_anuncios(html, "Subzona") for html in paginas]
+    BENCHMARKS[f"parser.paginas_guardadas[{len(paginas)}]"] = (preparar, None)
+
+
+# --- ANALÍTICA DE COMPARABLES ---
+
+@benchmark("comparables.resumen_eur_m2", TAMANOS_COMPARABLES)
+def _resumen(n):
+    df = comparables_sinteticos_tabla(n)
+    return lambda: (df["€/m²"].mean(), df["€/m²"].min(), df["€/m²"].max())
+
+
+@benchmark("comparables.filtro_rango", TAMANOS_COMPARABLES)
+def _filtro(n):
+    df = comparables_sinteticos_tabla(n)
+    minimo, maximo = df["€/m²"].quantile([0.25, 0.75])
+    return lambda: df[(df["€/m²"] >= minimo) & (df["€/m²"] <= maximo)]
+
+
+@benchmark("comparables.filtro_compacto", TAMANOS_COMPARABLES)
+def _filtro_compacto(n):
+    df = compactar(comparables_sinteticos_tabla(n))
+    minimo, maximo = df["€/m²"].quantile([0.25, 0.75])
+    return lambda: df[(df["Subzona"] == "Almagro") & (df["€/m²"] >= minimo) & (df["€/m²"] <= maximo)]
+
+
+@benchmark("comparables.filtro_texto", TAMANOS_COMPARABLES)
+def _filtro_texto(n):
+    df = comparables_sinteticos_tabla(n)
+    minimo, maximo = df["€/m²"].quantile([0.25, 0.75])
+    return lambda: df[(df["Subzona"] == "Almagro") & (df["€/m²"] >= minimo) & (df["€/m²"] <= maximo)]
+
+
+@benchmark("comparables.compactar", TAMANOS_COMPARABLES)
+def _compactar(n):
+    df = comparables_sinteticos_tabla(n)
+    return lambda: compactar(df)
+
+
+@benchmark("comparables.validar", TAMANOS_COMPARABLES)
+def _validar(n):
+    df = comparables_sinteticos_tabla(n)
+    return lambda: validar_comparables(df)
+
+
+@benchmark("comparables.estadisticas_robustas", TAMANOS_COMPARABLES)
+def _estadisticas_robustas(n):
+    df = comparables_sinteticos(n)
+    return lambda: agregar_robusto(df)
+
+
+@benchmark("comparables.indice_mercado", TAMANOS_COMPARABLES)
+def _indice(n):
+    df = comparables_sinteticos(n)
+    return lambda: ajustar_por_estado(agregar(df))
+
+
+# --- VALORACIÓN POR COMPARABLES ---
+
+def _valorador(n):
+    df = comparables_sinteticos(n)
+    rng = np.random.default_rng(1)
+    df["habitaciones"] = rng.integers(1, 6, n)
+    df["banos"] = rng.integers(1, 4, n)
+    return ValoradorComparables(df), df
+
+
+@benchmark("valoracion.individual", [10_000, 100_000])
+def _valoracion_individual(n):
+    modelo, _ = _valorador(n)
+    sujeto = pd.DataFrame([{"zona": "Chamberí", "subzona": "Almagro", "superficie": 120,
+                            "habitaciones": 3, "banos": 2, "estado": "Reformado"}])
+    return lambda: modelo.valorar(sujeto)
+
+
+@benchmark("valoracion.lote_1000", [10_000, 100_000])
+def _valoracion_lote(n):
+    modelo, df = _valorador(n)
+    sujetos = df.sample(1000, random_state=0)
+    return lambda: modelo.valorar(sujetos)
+
+
+# --- CARTERA ---
+
+@benchmark("cartera.optimizar", [100, 500])
+def _cartera(n):
+    rng = np.random.default_rng(2)
+    candidatas = operaciones_sinteticas(n).assign(
+        plazo_anios=1.0, meses_venta=rng.integers(6, 19, n), mes_inicio=rng.integers(0, 12, n),
+        zona=rng.choice(list(SUBZONAS), n),
+    )
+    tope = candidatas["precio_compra"].sum() / 10
+    return lambda: optimizar_cartera(candidatas, tope, retraso_maximo=6, fecha_inicio="2025-01-01")
+
+
+# --- INFORMES ---
+
+@benchmark("informe.pdf")
+def _informe_pdf(_):
+    datos = datos_informe({**VALORES_POR_DEFECTO, "porcentaje_prestamo": 70.0, "interes_prestamo": 4.0},
+                          comparables=comparables_sinteticos(25).rename(columns=COLUMNAS))
+    return lambda: generar_pdf(datos)
+
+
+def memoria_comparables(tamanos=TAMANOS_COMPARABLES):
+    """MB de los comparables sintéticos con el esquema de texto y con el compacto, por tamaño."""
+    resultado = {}
+    for n in tamanos:
+        tabla = comparables_sinteticos_tabla(n)
+        # Como llegan del scraping: habitaciones como texto y descripción larga
+        tabla["Habitaciones"] = (np.arange(n) % 5 + 1).astype(str).astype(object) + " hab."
+        tabla["Descripción"] = "Piso exterior y luminoso, " + tabla["Subzona"] + ", con ascensor y portero. " * 3
+        texto = memoria(tabla).sum()
+        compacto = memoria(compactar(tabla)).sum()
+        resultado[str(n)] = {"texto_mb": texto, "compacto_mb": compacto, "ratio": texto / compacto}
+        print(f"{'memoria.comparables[' + str(n) + ']':<45} {texto:>10.1f} MB -> {compacto:.1f} MB ({texto / compacto:.1f}x)")
+    return resultado
+
+
+# --- EJECUCIÓN Y COMPARACIÓN ---
+
+def _tamano_total(tamano):
+    return int(np.prod(tamano)) if tamano is not None else 0
+
+
+def ejecutar(filtro=None, rapido=False, repeticiones=5, tiempo_minimo=0.2):
+    """Ejecuta los benchmarks seleccionados y devuelve {nombre: estadísticas}."""
+    resultados = {}
+    for nombre, (preparar, tamano) in BENCHMARKS.items():
+        if filtro and filtro not in nombre:
+            continue
+        if rapido and _tamano_total(tamano) > TAMANO_MAXIMO_RAPIDO:
+            continue
+        funcion = preparar(tamano)
+        resultados[nombre] = medir(funcion, repeticiones, tiempo_minimo)
+        resultados[nombre]["n"] = _tamano_total(tamano) or 1
+        print(f"{nombre:<45} {resultados[nombre]['mediana'] * 1000:>10.3f} ms  ({resultados[nombre]['rondas']} rondas)")
+    return resultados
+
+
+def entorno():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = "desconocido"
+    return {
+        "commit": commit,
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "maquina": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def guardar(resultados, ruta=None, **extra):
+    """Guarda los resultados (y las secciones extra) con los metadatos del entorno; devuelve la ruta."""
+    meta = entorno()
+    if ruta is None:
+        os.makedirs(CARPETA_RESULTADOS, exist_ok=True)
+        ruta = os.path.join(CARPETA_RESULTADOS, f"{meta['fecha'][:10]}_{meta['commit']}.json")
+    with open(ruta, "w", encoding="utf-8") as f:
+        json.dump({**meta, **extra, "resultados": resultados}, f, indent=2, ensure_ascii=False)
+    return ruta
+
+
+def comparar(base, actual, umbral=1.2):
+    """
+    Compara medianas con un JSON anterior. Devuelve un DataFrame con el ratio actual/base
+    y la marca de regresión (ratio > umbral).
+    """
+    filas = []
+    for nombre, stats in actual.items():
+        if nombre not in base:
+            continue
+        ratio = stats["mediana"] / base[nombre]["mediana"]
+        filas.append({
+            "Benchmark": nombre,
+            "Base (ms)": base[nombre]["mediana"] * 1000,
+            "Actual (ms)": stats["mediana"] * 1000,
+            "Ratio": ratio,
+            "Regresión": ratio > umbral,
+        })
+    return pd.DataFrame(filas, columns=["Benchmark", "Base (ms)", "Actual (ms)", "Ratio", "Regresión"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks de rendimiento del simulador ADCO")
+    parser.add_argument("--filtro", help="Ejecutar solo los benchmarks cuyo nombre contenga este texto")
+    parser.add_argument("--rapido", action="store_true", help=f"Omitir tamaños mayores de {TAMANO_MAXIMO_RAPIDO:,}")
+    parser.add_argument("--repeticiones", type=int, default=5, help="Rondas mínimas por benchmark")
+    parser.add_argument("--tiempo-minimo", type=float, default=0.2, help="Segundos mínimos medidos por benchmark")
+    parser.add_argument("--html-dir", help="Carpeta con páginas de resultados de Idealista guardadas (*.html)")
+    parser.add_argument("--salida", help=f"JSON de resultados (por defecto en {CARPETA_RESULTADOS}/)")
+    parser.add_argument("--comparar", help="JSON anterior con el que comparar")
+    parser.add_argument("--umbral", type=float, default=1.2, help="Ratio a partir del cual se considera regresión")
+    args = parser.parse_args(argv)
+
+    if args.html_dir:
+        _benchmark_paginas_guardadas(args.html_dir)
+    resultados = ejecutar(args.filtro, args.rapido, args.repeticiones, args.tiempo_minimo)
+    extra = {}
+    if not args.filtro or args.filtro in "memoria.comparables":
+        tamanos = [n for n in TAMANOS_COMPARABLES if not args.rapido or n <= TAMANO_MAXIMO_RAPIDO]
+        extra["memoria"] = memoria_comparables(tamanos)
+    print(f"Resultados guardados en {guardar(resultados, args.salida, **extra)}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            base = json.load(f)
+        tabla = comparar(base["resultados"], resultados, args.umbral)
+        print(f"\nComparación con {base['commit']} ({base['fecha']}):")
+        print(tabla.to_string(index=False, float_format=lambda v: f"{v:,.3f}"))
+        if tabla["Regresión"].any():
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+# ADCO - Búsqueda de objetivos sobre el motor financiero
+# Responde a preguntas inversas para lotes completos de operaciones a la vez: precio máximo
+# de compra para un ROI/TIR objetivo, precio de venta de equilibrio, presupuesto máximo de
+# reforma y porcentaje de préstamo que maximiza la TIR del capital propio.
+
+import numpy as np
+import pandas as pd
+
+from instrumentacion import medido
+from motor_financiero import CAMPOS_ENTRADA, calcular, preparar_operaciones
+
+# Precisión de la búsqueda en euros (o €/m² para la reforma)
+TOLERANCIA = 1.0
+MAX_ITERACIONES = 100
+
+
+def _entradas(operaciones):
+    df = preparar_operaciones(operaciones)
+    c = {campo: df[campo].to_numpy() for campo in CAMPOS_ENTRADA}
+    if "anios_tenencia" in df.columns:
+        c["anios_tenencia"] = df["anios_tenencia"].fillna(df["plazo_anios"]).to_numpy(dtype=float)
+    return df, c
+
+
+def _metrica(c, metrica):
+    valor = calcular(c)[metrica]
+    # Sin TIR (capital o ingreso no positivos) cuenta como el peor resultado posible
+    return np.where(np.isnan(valor), -np.inf, valor)
+
+
+@medido("objetivos.resolver", filas=lambda valores: np.size(valores))
+def resolver(c, variable, objetivo, bajo, alto, metrica="roi", tolerancia=TOLERANCIA):
+    """
+    Valor de `variable` (por fila) con el que `metrica` alcanza `objetivo`, por bisección
+    vectorizada entre bajo y alto. La métrica debe ser monótona en la variable; el sentido
+    se detecta en los extremos. Las filas sin solución en el intervalo quedan como NaN.
+    """
+    n = len(c["precio_compra"])
+    bajo = np.broadcast_to(np.asarray(bajo, dtype=float), (n,)).copy()
+    alto = np.broadcast_to(np.asarray(alto, dtype=float), (n,)).copy()
+    objetivo = np.broadcast_to(np.asarray(objetivo, dtype=float), (n,))
+    c = dict(c)
+
+    c[variable] = bajo
+    en_bajo = _metrica(c, metrica) - objetivo
+    c[variable] = alto
+    en_alto = _metrica(c, metrica) - objetivo
+    con_solucion = np.sign(en_bajo) != np.sign(en_alto)
+    creciente = en_alto > en_bajo
+
+    for _ in range(MAX_ITERACIONES):
+        if np.all(alto - bajo <= tolerancia):
+            break
+        medio = (bajo + alto) / 2
+        c[variable] = medio
+        por_debajo = _metrica(c, metrica) < objetivo
+        # Si la métrica crece con la variable y aún no llega, la solución está por encima
+        subir = por_debajo == creciente
+        bajo = np.where(subir, medio, bajo)
+        alto = np.where(subir, alto, medio)
+
+    return np.where(con_solucion, (bajo + alto) / 2, np.nan)
+
+
+def precio_compra_maximo(operaciones, roi_objetivo=20.0, tir_objetivo=None):
+    """
+    Precio de compra máximo con el que la operación alcanza el ROI (o la TIR, si se indica)
+    objetivo en %, con el resto de supuestos fijos. NaN si ni comprando a 0 se alcanza.
+    """
+    _, c = _entradas(operaciones)
+    metrica, objetivo = ("tir", tir_objetivo) if tir_objetivo is not None else ("roi", roi_objetivo)
+    return resolver(c, "precio_compra", objetivo, 0.0, c["precio_venta"], metrica)
+
+
+def precio_venta_equilibrio(operaciones):
+    """Precio de venta con el que la ganancia neta es cero."""
+    _, c = _entradas(operaciones)
+    r = calcular(c)
+    alto = np.maximum(r["inversion_total"] + r["intereses_totales"], 1.0) * 2 / (1 - c["comision_venta"] / 100)
+    return resolver(c, "precio_venta", 0.0, 0.0, alto, "roi")
+
+
+def presupuesto_reforma_maximo(operaciones, roi_objetivo=20.0):
+    """
+    Coste de reforma máximo (€/m² y total con IVA y costes adicionales) con el que se
+    mantiene el ROI objetivo. Devuelve un DataFrame con ambas columnas.
+    """
+    df, c = _entradas(operaciones)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        alto = np.where(c["superficie_reforma"] > 0, c["precio_venta"] / c["superficie_reforma"], 0.0)
+    coste_m2 = resolver(c, "coste_reforma_m2", roi_objetivo, 0.0, alto, "roi")
+    total = (c["superficie_reforma"] * coste_m2 + c["costes_adicionales"]) * (1 + c["iva_reforma"] / 100)
+    return pd.DataFrame({"coste_reforma_m2_maximo": coste_m2, "presupuesto_reforma_maximo": total}, index=df.index)
+
+
+def apalancamiento_optimo(operaciones, prestamo_maximo=80.0, intereses_maximos=None, paso=1.0):
+    """
+    Porcentaje de préstamo (sobre la inversión total) que maximiza la TIR del capital propio,
+    entre 0 y prestamo_maximo, con los intereses totales por debajo de intereses_maximos (€).
+    Devuelve un DataFrame con porcentaje_prestamo, tir, roi e intereses de la mejor opción.
+    """
+    df, c = _entradas(operaciones)
+    n = len(df)
+    mejor = {
+        "porcentaje_prestamo": np.zeros(n),
+        "tir": np.full(n, -np.inf),
+        "roi": np.full(n, np.nan),
+        "intereses_totales": np.zeros(n),
+    }
+    for porcentaje in np.arange(0.0, prestamo_maximo + paso / 2, paso):
+        c["porcentaje_prestamo"] = np.full(n, porcentaje)
+        r = calcular(c)
+        tir = np.where(np.isnan(r["tir"]), -np.inf, r["tir"])
+        admisible = True if intereses_maximos is None else r["intereses_totales"] <= intereses_maximos
+        mejora = admisible & (tir > mejor["tir"])
+        mejor["porcentaje_prestamo"] = np.where(mejora, porcentaje, mejor["porcentaje_prestamo"])
+        mejor["tir"] = np.where(mejora, tir, mejor["tir"])
+        mejor["roi"] = np.where(mejora, r["roi"], mejor["roi"])
+        mejor["intereses_totales"] = np.where(mejora, r["intereses_totales"], mejor["intereses_totales"])
+    mejor["tir"] = np.where(np.isfinite(mejor["tir"]), mejor["tir"], np.nan)
+    return pd.DataFrame(mejor, index=df.index)
+
+
+def objetivos(operaciones, roi_objetivo=20.0, prestamo_maximo=80.0, intereses_maximos=None):
+    """Todas las respuestas inversas de un lote en un único DataFrame."""
+    df = preparar_operaciones(operaciones)
+    resultado = pd.DataFrame({
+        "precio_compra_maximo": precio_compra_maximo(df, roi_objetivo),
+        "precio_venta_equilibrio": precio_venta_equilibrio(df),
+    }, index=df.index)
+    resultado = resultado.join(presupuesto_reforma_maximo(df, roi_objetivo))
+    optimo = apalancamiento_optimo(df, prestamo_maximo, intereses_maximos)
+    return resultado.join(optimo.add_suffix("_optimo"))
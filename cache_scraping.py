@@ -0,0 +1,165 @@
+# ADCO - Caché persistente de páginas scrapeadas
+# Guarda en SQLite la respuesta cruda y las filas parseadas (válidas y rechazadas) por (subzona, página, fecha),
+# con caducidad (TTL) y expulsión por tamaño, compartida entre sesiones del navegador.
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import date
+
+from instrumentacion import contar
+
+RUTA_CACHE = os.environ.get("ADCO_CACHE_DIR", ".cache_adco")
+TTL_SEGUNDOS = 24 * 3600
+TAMANO_MAXIMO = 200 * 1024 * 1024
+
+
+class CacheScraping:
+    """Caché en disco de páginas de resultados con contadores de aciertos y fallos."""
+
+    def __init__(self, ruta=None, ttl=TTL_SEGUNDOS, tamano_maximo=TAMANO_MAXIMO):
+        ruta = ruta or os.path.join(RUTA_CACHE, "scraping.sqlite")
+        os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+        self.ruta = ruta
+        self.ttl = ttl
+        self.tamano_maximo = tamano_maximo
+        self.aciertos = 0
+        self.fallos = 0
+        self._lock = threading.Lock()
+        with self._conectar() as con:
+            con.execute("""
+                CREATE TABLE IF NOT EXISTS paginas (
+                    subzona TEXT NOT NULL,
+                    pagina INTEGER NOT NULL,
+                    fecha TEXT NOT NULL,
+                    creado REAL NOT NULL,
+                    ultimo_acceso REAL NOT NULL,
+                    html BLOB,
+                    filas TEXT NOT NULL,
+                    tamano INTEGER NOT NULL,
+                    rechazadas TEXT,
+                    PRIMARY KEY (subzona, pagina, fecha)
+                )
+            """)
+            con.execute("CREATE INDEX IF NOT EXISTS idx_paginas_acceso ON paginas (ultimo_acceso)")
+            columnas = {fila[1] for fila in con.execute("PRAGMA table_info(paginas)")}
+            if "rechazadas" not in columnas:
+                con.execute("ALTER TABLE paginas ADD COLUMN rechazadas TEXT")
+
+    @contextmanager
+    def _conectar(self):
+        con = sqlite3.connect(self.ruta, timeout=30)
+        try:
+            con.execute("PRAGMA journal_mode=WAL")
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    def obtener(self, subzona, pagina):
+        """Filas parseadas de la página más reciente dentro del TTL, o None si no hay."""
+        ahora = time.time()
+        with self._lock, self._conectar() as con:
+            fila = con.execute(
+                "SELECT fecha, filas FROM paginas WHERE subzona = ? AND pagina = ? AND creado >= ? "
+                "ORDER BY creado DESC LIMIT 1",
+                (subzona, pagina, ahora - self.ttl),
+            ).fetchone()
+            if fila is None:
+                self.fallos += 1
+                contar("cache_scraping.fallos")
+                return None
+            con.execute(
+                "UPDATE paginas SET ultimo_acceso = ? WHERE subzona = ? AND pagina = ? AND fecha = ?",
+                (ahora, subzona, pagina, fila[0]),
+            )
+            self.aciertos += 1
+            contar("cache_scraping.aciertos")
+        return json.loads(fila[1])
+
+    def obtener_html(self, subzona, pagina):
+        """Respuesta cruda más reciente dentro del TTL (para volver a parsear sin descargar)."""
+        with self._conectar() as con:
+            fila = con.execute(
+                "SELECT html FROM paginas WHERE subzona = ? AND pagina = ? AND creado >= ? "
+                "ORDER BY creado DESC LIMIT 1",
+                (subzona, pagina, time.time() - self.ttl),
+            ).fetchone()
+        return zlib.decompress(fila[0]).decode("utf-8") if fila and fila[0] else None
+
+    def obtener_rechazadas(self, subzona, pagina):
+        """Filas rechazadas por el parser en la página más reciente dentro del TTL ([] si no hay)."""
+        with self._conectar() as con:
+            fila = con.execute(
+                "SELECT rechazadas FROM paginas WHERE subzona = ? AND pagina = ? AND creado >= ? "
+                "ORDER BY creado DESC LIMIT 1",
+                (subzona, pagina, time.time() - self.ttl),
+            ).fetchone()
+        return json.loads(fila[0]) if fila and fila[0] else []
+
+    def guardar(self, subzona, pagina, html, filas, rechazadas=()):
+        """Guarda la respuesta cruda (comprimida) y las filas parseadas y rechazadas de una página."""
+        ahora = time.time()
+        html_comprimido = zlib.compress(html.encode("utf-8")) if html is not None else None
+        filas_json = json.dumps(filas, ensure_ascii=False)
+        rechazadas_json = json.dumps(list(rechazadas), ensure_ascii=False)
+        tamano = len(html_comprimido or b"") + len(filas_json.encode("utf-8")) + len(rechazadas_json.encode("utf-8"))
+        with self._lock, self._conectar() as con:
+            con.execute(
+                "INSERT OR REPLACE INTO paginas (subzona, pagina, fecha, creado, ultimo_acceso, html, filas, tamano, "
+                "rechazadas) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (subzona, pagina, date.today().isoformat(), ahora, ahora, html_comprimido, filas_json, tamano,
+                 rechazadas_json),
+            )
+            self._expulsar(con, ahora)
+
+    def _expulsar(self, con, ahora):
+        """Borra lo caducado y, si se supera el tamaño máximo, lo menos usado recientemente."""
+        con.execute("DELETE FROM paginas WHERE creado < ?", (ahora - self.ttl,))
+        total = con.execute("SELECT COALESCE(SUM(tamano), 0) FROM paginas").fetchone()[0]
+        if total <= self.tamano_maximo:
+            return
+        sobrante = total - self.tamano_maximo
+        candidatos = con.execute("SELECT rowid, tamano FROM paginas ORDER BY ultimo_acceso").fetchall()
+        borrar = []
+        for rowid, tamano in candidatos:
+            if sobrante <= 0:
+                break
+            borrar.append((rowid,))
+            sobrante -= tamano
+        con.executemany("DELETE FROM paginas WHERE rowid = ?", borrar)
+
+    def limpiar(self):
+        """Vacía la caché y reinicia los contadores."""
+        with self._lock, self._conectar() as con:
+            con.execute("DELETE FROM paginas")
+            self.aciertos = 0
+            self.fallos = 0
+
+    def estadisticas(self):
+        """Aciertos, fallos, tasa de acierto, páginas guardadas y tamaño en disco."""
+        with self._conectar() as con:
+            paginas, tamano = con.execute("SELECT COUNT(*), COALESCE(SUM(tamano), 0) FROM paginas").fetchone()
+        consultas = self.aciertos + self.fallos
+        return {
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "tasa_acierto": self.aciertos / consultas if consultas else 0.0,
+            "paginas": paginas,
+            "tamano_bytes": tamano,
+        }
+
+
+_cache_por_defecto = None
+
+
+def obtener_cache():
+    """Caché compartida por todo el proceso (todas las sesiones de Streamlit)."""
+    global _cache_por_defecto
+    if _cache_por_defecto is None:
+        _cache_por_defecto = CacheScraping()
+    return _cache_por_defecto
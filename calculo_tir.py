@@ -0,0 +1,126 @@
+# ADCO - Cálculo de TIR vectorizado
+# Resuelve la TIR de miles de escenarios a la vez, sin llamar a numpy_financial.irr por celda.
+
+import numpy as np
+
+from instrumentacion import medido
+
+# Intervalo de búsqueda de la TIR por periodo (-99,99% a +1000%)
+TIR_MINIMA = -0.9999
+TIR_MAXIMA = 10.0
+
+
+@medido("tir.cerrada", filas=lambda resultado: np.size(resultado[0]))
+def tir_flujo_simple(capital, ingreso_final, periodos=1):
+    """
+    TIR de flujos con forma [-capital, 0, ..., 0, ingreso_final] (solución cerrada).
+
+    Devuelve (tir, convergida): tir es la tasa por periodo (no en %) y NaN cuando
+    no existe (capital <= 0 o ingreso_final <= 0); convergida marca las válidas.
+    """
+    capital, ingreso_final, periodos = np.broadcast_arrays(
+        np.asarray(capital, dtype=float),
+        np.asarray(ingreso_final, dtype=float),
+        np.asarray(periodos, dtype=float),
+    )
+    convergida = (capital > 0) & (ingreso_final > 0) & (periodos > 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        tir = np.where(convergida, (ingreso_final / capital) ** (1 / periodos) - 1, np.nan)
+    return tir, convergida
+
+
+# Base de días de la XIRR (convención de Excel: Actual/365)
+DIAS_ANIO = 365.0
+# Una operación de pocos meses puede anualizar muy por encima del 1000%
+XIRR_MAXIMA = 1000.0
+
+
+def _van(flujos, tasa, t=None):
+    """VAN y su derivada para cada fila de flujos con su propia tasa (t = periodo de cada columna)."""
+    if t is None:
+        t = np.arange(flujos.shape[1], dtype=float)
+    descuento = (1 + tasa[:, None]) ** -t
+    van = (flujos * descuento).sum(axis=1)
+    derivada = (-t * flujos * descuento / (1 + tasa[:, None])).sum(axis=1)
+    return van, derivada
+
+
+@medido("tir.vectorizada", filas=lambda resultado: np.size(resultado[0]))
+def tir_vectorizada(flujos, tol=1e-10, max_iter=100, tiempos=None, maxima=TIR_MAXIMA):
+    """
+    TIR de flujos generales (una fila por escenario) con Newton protegido por bisección.
+
+    tiempos indica el momento de cada columna en periodos (por defecto 0, 1, 2...);
+    con tiempos en años fraccionarios se obtiene la XIRR. maxima es el extremo superior
+    del intervalo de búsqueda.
+
+    Devuelve (tir, convergida). Las filas sin cambio de signo en el intervalo
+    [TIR_MINIMA, TIR_MAXIMA] o que no convergen en max_iter quedan como NaN y
+    convergida=False, en lugar de devolver 0 en silencio.
+    """
+    flujos = np.atleast_2d(np.asarray(flujos, dtype=float))
+    t = None if tiempos is None else np.asarray(tiempos, dtype=float)
+    n = flujos.shape[0]
+    escala = np.maximum(np.abs(flujos).max(axis=1), 1.0)
+
+    bajo = np.full(n, TIR_MINIMA)
+    alto = np.full(n, float(maxima))
+    van_bajo, _ = _van(flujos, bajo, t)
+    van_alto, _ = _van(flujos, alto, t)
+    con_raiz = np.sign(van_bajo) != np.sign(van_alto)
+
+    tasa = np.where(con_raiz, 0.1, np.nan)
+    convergida = np.zeros(n, dtype=bool)
+    activos = con_raiz.copy()
+
+    for _ in range(max_iter):
+        if not activos.any():
+            break
+        idx = np.flatnonzero(activos)
+        f = flujos[idx]
+        r = tasa[idx]
+        van, derivada = _van(f, r, t)
+
+        hecho = np.abs(van) <= tol * escala[idx]
+        convergida[idx[hecho]] = True
+
+        # Actualiza el intervalo que contiene la raíz
+        mismo_signo = np.sign(van) == np.sign(van_bajo[idx])
+        bajo[idx] = np.where(mismo_signo, r, bajo[idx])
+        van_bajo[idx] = np.where(mismo_signo, van, van_bajo[idx])
+        alto[idx] = np.where(mismo_signo, alto[idx], r)
+
+        # Paso de Newton; si sale del intervalo se usa bisección
+        with np.errstate(divide="ignore", invalid="ignore"):
+            nueva = r - van / derivada
+        fuera = ~np.isfinite(nueva) | (nueva <= bajo[idx]) | (nueva >= alto[idx])
+        nueva = np.where(fuera, (bajo[idx] + alto[idx]) / 2, nueva)
+
+        cerrado = np.abs(alto[idx] - bajo[idx]) <= tol
+        convergida[idx[cerrado]] = True
+        tasa[idx] = np.where(hecho, r, nueva)
+        activos[idx[hecho | cerrado]] = False
+
+    tasa[~convergida] = np.nan
+    return tasa, convergida
+
+
+def xirr_vectorizada(flujos, fechas, tol=1e-10, max_iter=100):
+    """
+    XIRR anual de flujos fechados: una fila por escenario y una columna por fecha
+    (fechas comunes a todas las filas). Devuelve (tir, convergida) como tir_vectorizada.
+    """
+    fechas = np.asarray(fechas, dtype="datetime64[D]")
+    anios = (fechas - fechas[0]).astype(float) / DIAS_ANIO
+    return tir_vectorizada(flujos, tol=tol, max_iter=max_iter, tiempos=anios, maxima=XIRR_MAXIMA)
+
+
+def tir(flujos):
+    """TIR de un único flujo de caja; usa la solución cerrada si el flujo tiene forma simple."""
+    flujos = np.asarray(flujos, dtype=float)
+    intermedios = flujos[1:-1]
+    if flujos.size >= 2 and not intermedios.any():
+        valor, convergida = tir_flujo_simple(-flujos[0], flujos[-1], flujos.size - 1)
+    else:
+        valor, convergida = tir_vectorizada(flujos[None, :])
+    return float(np.ravel(valor)[0]), bool(np.ravel(convergida)[0])
@@ -0,0 +1,315 @@
+# ADCO - Cartera de operaciones en paralelo
+# Evalúa N operaciones, cada una con su calendario (mes de compra dentro de la cartera),
+# con el modelo mensual y agrega las necesidades de capital mes a mes: pico de capital,
+# uso de la línea de crédito compartida, TIR de la cartera y concentración por zona.
+# El optimizador elige y secuencia operaciones bajo un tope de capital: mochila (knapsack)
+# por programación dinámica vectorizada sobre el capital máximo de cada operación y
+# relleno posterior retrasando la compra de las descartadas hasta donde quepan.
+#
+# Uso:
+#   python cartera_operaciones.py --entrada operaciones.csv --tope-capital 2000000 --retraso-maximo 6 --salida plan.csv
+
+import argparse
+import sys
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from calculo_tir import xirr_vectorizada
+from flujo_mensual import CAMPOS_MENSUALES, calcular_mensual, fechas_mensuales, preparar_mensual
+from instrumentacion import medido
+from motor_financiero import CAMPOS_ENTRADA
+
+# Pasos de capital de la mochila: el tope se discretiza en como mucho este número de tramos
+RESOLUCION_MOCHILA = 2000
+
+
+def preparar_cartera(operaciones):
+    """preparar_mensual más nombre, zona y mes de compra dentro de la cartera (0 = primer mes)."""
+    df = preparar_mensual(operaciones).reset_index(drop=True)
+    if "nombre" not in df.columns:
+        df["nombre"] = [f"Operación {i + 1}" for i in range(len(df))]
+    if "zona" not in df.columns:
+        df["zona"] = "Sin zona"
+    df["zona"] = df["zona"].fillna("Sin zona")
+    df["mes_inicio"] = df["mes_inicio"].fillna(0).clip(lower=0).round().astype(int) if "mes_inicio" in df.columns else 0
+    return df
+
+
+@medido("cartera.operaciones", filas=lambda r: len(r["pico"]))
+def calcular_operaciones(df, fecha_inicio=None):
+    """
+    Modelo mensual de todas las operaciones a la vez (meses relativos a su compra).
+    Añade la exposición de capital de cada una: lo aportado y aún no recuperado cada mes
+    (n × meses+1) y su máximo.
+    """
+    r = calcular_mensual({campo: df[campo].to_numpy() for campo in CAMPOS_ENTRADA + CAMPOS_MENSUALES}, fecha_inicio)
+    exposicion = np.maximum(-np.cumsum(r["flujos"], axis=1), 0.0)
+    return {**r, "exposicion": exposicion, "pico": exposicion.max(axis=1)}
+
+
+def _colocar(valores, inicios, horizonte):
+    """Suma por mes de cartera de filas (n × meses relativos) desplazadas a su mes de compra."""
+    columnas = inicios[:, None] + np.arange(valores.shape[1])[None, :]
+    dentro = columnas < horizonte
+    return np.bincount(columnas[dentro], weights=valores[dentro], minlength=horizonte)
+
+
+def tesoreria(flujos, linea_credito=0.0, interes_linea=0.0, fondos_propios=None):
+    """
+    Financia los flujos mensuales de la cartera con fondos propios compartidos y una línea
+    de crédito: las salidas que no cubre la caja se disponen de la línea (hasta su límite),
+    que paga intereses mensuales y se devuelve con las entradas antes de acumular caja.
+    Sin fondos_propios, todo lo que la línea no cubre lo aporta el inversor. Con fondos_propios,
+    lo que no cubren ni la caja ni la línea queda como "deficit" (la cartera no es financiable).
+    Devuelve un DataFrame mensual y los flujos del inversor (aportaciones y retiradas).
+    """
+    tasa = interes_linea / 100 / 12
+    caja = 0.0 if fondos_propios is None else float(fondos_propios)
+    saldo = 0.0
+    filas = []
+    for flujo in flujos:
+        intereses = saldo * tasa
+        neto = flujo - intereses
+        disposicion = devolucion = 0.0
+        if neto < 0:
+            falta = max(-neto - caja, 0.0)
+            disposicion = min(falta, linea_credito - saldo)
+            caja += neto + disposicion
+        else:
+            devolucion = min(neto, saldo)
+            caja += neto - devolucion
+        saldo += disposicion - devolucion
+        aportacion = max(-caja, 0.0) if fondos_propios is None else 0.0
+        caja += aportacion
+        filas.append((flujo, intereses, disposicion, devolucion, saldo, caja, aportacion, max(-caja, 0.0)))
+    df = pd.DataFrame(filas, columns=[
+        "flujo_operaciones", "intereses_linea", "disposicion_linea", "devolucion_linea",
+        "saldo_linea", "caja", "aportacion", "deficit",
+    ])
+    # Flujos del inversor: aportaciones (salidas) y la caja final (entrada)
+    inversor = -df["aportacion"].to_numpy().copy()
+    if fondos_propios is not None:
+        inversor[0] -= float(fondos_propios)
+    inversor[-1] += df["caja"].iloc[-1]
+    return df, inversor
+
+
+def concentracion(por_operacion):
+    """Capital máximo, ganancia y peso por zona, e índice Herfindahl (0-1) del capital."""
+    zonas = por_operacion.groupby("zona").agg(
+        operaciones=("nombre", "size"), capital_maximo=("capital_maximo", "sum"),
+        ganancia_neta=("ganancia_neta", "sum"),
+    ).sort_values("capital_maximo", ascending=False)
+    total = zonas["capital_maximo"].sum()
+    zonas["peso_capital"] = zonas["capital_maximo"] / total if total > 0 else 0.0
+    return zonas.reset_index(), float((zonas["peso_capital"] ** 2).sum())
+
+
+def evaluar_cartera(operaciones, fecha_inicio=None, linea_credito=0.0, interes_linea=0.0, fondos_propios=None):
+    """
+    Evalúa la cartera y devuelve un dict con las tablas "operaciones" (una fila por
+    operación), "mensual" (flujos agregados, capital comprometido y línea de crédito) y
+    "zonas" (concentración), y el "resumen" con el pico de capital, la ganancia y la TIR.
+    Si los fondos propios y la línea no alcanzan, resumen["deficit_maximo"] > 0 y la
+    ganancia y la TIR del inversor quedan en NaN.
+    """
+    df = preparar_cartera(operaciones)
+    r = calcular_operaciones(df, fecha_inicio)
+    inicios = df["mes_inicio"].to_numpy()
+    horizonte = int((inicios + r["meses_venta"]).max()) + 1 if len(df) else 1
+    fechas = fechas_mensuales(fecha_inicio or date.today(), horizonte - 1)
+
+    flujos = _colocar(r["flujos"], inicios, horizonte)
+    comprometido = _colocar(r["exposicion"], inicios, horizonte)
+    mensual, inversor = tesoreria(flujos, linea_credito, interes_linea, fondos_propios)
+    mensual.insert(0, "mes", np.arange(horizonte))
+    mensual.insert(1, "fecha", pd.to_datetime(fechas).date)
+    mensual["capital_comprometido"] = comprometido
+    mensual["necesidad_capital"] = np.maximum(-np.cumsum(flujos), 0.0)
+    activas = np.arange(r["flujos"].shape[1])[None, :] <= r["meses_venta"][:, None]
+    mensual["operaciones_activas"] = _colocar(activas.astype(float), inicios, horizonte).astype(int)
+
+    por_operacion = pd.DataFrame({
+        "nombre": df["nombre"], "zona": df["zona"], "mes_inicio": inicios,
+        "mes_venta": inicios + r["meses_venta"], "capital_maximo": r["pico"],
+        "ganancia_neta": r["ganancia_neta"], "roi": r["roi"], "tir": r["tir"],
+    })
+    zonas, hhi = concentracion(por_operacion)
+
+    tir, convergida = xirr_vectorizada(np.vstack([flujos, inversor]), fechas)
+    mes_pico = int(np.argmax(mensual["necesidad_capital"].to_numpy()))
+    deficit_maximo = float(mensual["deficit"].max())
+    financiable = deficit_maximo <= 1e-6
+    resumen = {
+        "operaciones": len(df),
+        "meses": horizonte - 1,
+        "ganancia_neta": float(flujos.sum()),
+        "ganancia_inversor": float(inversor.sum()) if financiable else np.nan,
+        "capital_maximo": float(mensual["necesidad_capital"].max()),
+        "capital_comprometido_maximo": float(comprometido.max()),
+        "mes_pico": mes_pico,
+        "fecha_pico": mensual["fecha"].iloc[mes_pico],
+        "aportacion_maxima": float(-np.minimum(np.cumsum(inversor), 0).min()),
+        "linea_maxima": float(mensual["saldo_linea"].max()),
+        "intereses_linea": float(mensual["intereses_linea"].sum()),
+        "tir": float(tir[0] * 100) if convergida[0] else np.nan,
+        "tir_inversor": float(tir[1] * 100) if convergida[1] and financiable else np.nan,
+        "deficit_maximo": deficit_maximo,
+        "mes_deficit": int(np.argmax(mensual["deficit"].to_numpy())) if not financiable else None,
+        "hhi_zonas": hhi,
+    }
+    return {"operaciones": por_operacion, "mensual": mensual, "zonas": zonas, "resumen": resumen}
+
+
+# --- OPTIMIZACIÓN BAJO TOPE DE CAPITAL ---
+
+def mochila(valores, pesos, capacidad, resolucion=RESOLUCION_MOCHILA):
+    """
+    Mochila 0/1 por programación dinámica: máscara de los elementos que maximizan la suma
+    de valores con suma de pesos ≤ capacidad. Los pesos se redondean hacia arriba a
+    capacidad/resolucion, así que la solución siempre cabe. Cada elemento es una operación
+    NumPy sobre todas las capacidades: O(n · resolucion). Con capacidad ≤ 0 no elige nada.
+    """
+    valores = np.asarray(valores, dtype=float)
+    if capacidad <= 0:
+        return np.zeros(len(valores), dtype=bool)
+    paso = capacidad / resolucion
+    pesos = np.ceil(np.asarray(pesos, dtype=float) / paso - 1e-9).astype(int)
+    n = len(valores)
+    mejor = np.zeros(resolucion + 1)
+    tomado = np.zeros((n, resolucion + 1), dtype=bool)
+    for i in range(n):
+        w = pesos[i]
+        if valores[i] <= 0 or w > resolucion:
+            continue
+        con = mejor[:resolucion + 1 - w] + valores[i]
+        mejora = con > mejor[w:]
+        tomado[i, w:] = mejora
+        mejor[w:] = np.where(mejora, con, mejor[w:])
+    elegidos = np.zeros(n, dtype=bool)
+    c = resolucion
+    for i in range(n - 1, -1, -1):
+        if tomado[i, c]:
+            elegidos[i] = True
+            c -= pesos[i]
+    return elegidos
+
+
+def _primer_hueco(ocupado, exposicion, desde, hasta, tope):
+    """Primer mes de compra en [desde, hasta] en que la exposición cabe bajo el tope, o None."""
+    largo = len(exposicion)
+    ventanas = np.lib.stride_tricks.sliding_window_view(ocupado[desde:hasta + largo], largo)
+    caben = np.flatnonzero((ventanas + exposicion).max(axis=1) <= tope + 1e-6)
+    return desde + int(caben[0]) if caben.size else None
+
+
+@medido("cartera.optimizar", filas=lambda r: len(r["plan"]))
+def optimizar_cartera(operaciones, tope_capital, retraso_maximo=0, objetivo="ganancia_neta", fecha_inicio=None,
+                      linea_credito=0.0, interes_linea=0.0, fondos_propios=None, resolucion=RESOLUCION_MOCHILA):
+    """
+    Elige y secuencia operaciones candidatas para maximizar `objetivo` (ganancia_neta o
+    cualquier resultado del modelo mensual) sin que el capital comprometido supere el tope
+    ningún mes. La restricción es conservadora: las ganancias de una venta no financian
+    compras posteriores, solo se libera el capital aportado.
+
+    1. Mochila sobre el capital máximo de cada operación: las elegidas caben juntas sea
+       cual sea su calendario, así que se compran en su mes_inicio.
+    2. Las descartadas, por orden de valor por euro y mes de capital, se compran en el
+       primer mes (hasta retraso_maximo después de su mes_inicio) en que caben.
+
+    Devuelve un dict con el "plan" (una fila por candidata: seleccionada, mes de compra y
+    retraso) y la "cartera" evaluada de las seleccionadas (None si no hay ninguna, p. ej.
+    con tope_capital ≤ 0).
+    """
+    df = preparar_cartera(operaciones)
+    r = calcular_operaciones(df, fecha_inicio)
+    valor = np.asarray(r[objetivo], dtype=float)
+    pico = r["pico"]
+    inicios = df["mes_inicio"].to_numpy()
+
+    elegidas = mochila(np.where(pico <= tope_capital, valor, 0.0), pico, tope_capital, resolucion)
+    mes_compra = np.where(elegidas, inicios, -1)
+
+    largo = r["exposicion"].shape[1]
+    horizonte = int(inicios.max()) + retraso_maximo + 2 * largo
+    ocupado = _colocar(r["exposicion"][elegidas], inicios[elegidas], horizonte)
+
+    duracion = r["meses_venta"] + 1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        densidad = valor / (pico * duracion)
+    for i in np.argsort(-densidad):
+        if elegidas[i] or valor[i] <= 0 or pico[i] > tope_capital or tope_capital <= 0:
+            continue
+        mes = _primer_hueco(ocupado, r["exposicion"][i], inicios[i], inicios[i] + retraso_maximo, tope_capital)
+        if mes is not None:
+            elegidas[i] = True
+            mes_compra[i] = mes
+            ocupado[mes:mes + largo] += r["exposicion"][i]
+
+    plan = df.assign(seleccionada=elegidas, mes_compra=np.where(elegidas, mes_compra, np.nan),
+                     retraso=np.where(elegidas, mes_compra - inicios, np.nan),
+                     capital_maximo=pico, valor_objetivo=valor)
+    seleccion = plan[elegidas].assign(mes_inicio=mes_compra[elegidas])
+    cartera = (evaluar_cartera(seleccion, fecha_inicio, linea_credito, interes_linea, fondos_propios)
+               if elegidas.any() else None)
+    return {"plan": plan, "cartera": cartera}
+
+
+def desde_ranking(ranking, supuestos, meses_venta=12, meses_reforma=6):
+    """Operaciones candidatas a partir del ranking de cribado_operaciones (todas compran en el mes 0)."""
+    superficie = ranking["Superficie (m²)"].to_numpy(dtype=float)
+    operaciones = pd.DataFrame({
+        campo: valor for campo, valor in supuestos.items() if campo != "porcentaje_superficie_reforma"
+    }, index=ranking.index)
+    operaciones["superficie"] = superficie
+    operaciones["superficie_reforma"] = superficie * supuestos.get("porcentaje_superficie_reforma", 100) / 100
+    operaciones["precio_compra"] = ranking["Precio compra (€)"].to_numpy(dtype=float)
+    operaciones["precio_venta"] = ranking["Precio venta estimado (€)"].to_numpy(dtype=float)
+    operaciones["meses_venta"] = meses_venta
+    operaciones["meses_reforma"] = meses_reforma
+    operaciones["zona"] = ranking["Zona"].to_numpy()
+    operaciones["nombre"] = ranking["Título"].fillna(ranking["ID"].astype(str)).to_numpy()
+    return operaciones.reset_index(drop=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cartera de operaciones de flipping bajo tope de capital (ADCO)")
+    parser.add_argument("--entrada", required=True, help="CSV o Parquet con una operación por fila")
+    parser.add_argument("--tope-capital", type=float, default=None, help="Sin tope, se evalúan todas las operaciones")
+    parser.add_argument("--retraso-maximo", type=int, default=0, help="Meses que se puede retrasar una compra")
+    parser.add_argument("--linea-credito", type=float, default=0.0, help="Límite de la línea de crédito (€)")
+    parser.add_argument("--interes-linea", type=float, default=0.0, help="Interés anual de la línea (%)")
+    parser.add_argument("--fondos-propios", type=float, default=None,
+                        help="Fondos propios disponibles (€); sin ellos, el inversor aporta lo que falte")
+    parser.add_argument("--fecha-inicio", default=None, help="Fecha del mes 0 (AAAA-MM-DD)")
+    parser.add_argument("--salida", default=None, help="Plan (con tope) o tabla mensual en .csv")
+    args = parser.parse_args(argv)
+
+    inicio = time.perf_counter()
+    operaciones = pd.read_parquet(args.entrada) if args.entrada.endswith(".parquet") else pd.read_csv(args.entrada)
+    if args.tope_capital is not None:
+        resultado = optimizar_cartera(operaciones, args.tope_capital, args.retraso_maximo, fecha_inicio=args.fecha_inicio,
+                                      linea_credito=args.linea_credito, interes_linea=args.interes_linea,
+                                      fondos_propios=args.fondos_propios)
+        tabla, cartera = resultado["plan"], resultado["cartera"]
+        print(f"{int(tabla['seleccionada'].sum())} de {len(tabla)} operaciones seleccionadas")
+    else:
+        cartera = evaluar_cartera(operaciones, args.fecha_inicio, args.linea_credito, args.interes_linea,
+                                  args.fondos_propios)
+        tabla = cartera["mensual"]
+    if cartera:
+        for clave, valor in cartera["resumen"].items():
+            print(f"  {clave}: {valor:,.2f}" if isinstance(valor, float) else f"  {clave}: {valor}")
+    if cartera and cartera["resumen"]["deficit_maximo"] > 0:
+        print(f"Aviso: déficit de {cartera['resumen']['deficit_maximo']:,.0f} € en el mes "
+              f"{cartera['resumen']['mes_deficit']}: la cartera no es financiable", file=sys.stderr)
+    if args.salida:
+        tabla.to_csv(args.salida, index=False)
+    print(f"Calculado en {time.perf_counter() - inicio:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
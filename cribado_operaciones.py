@@ -0,0 +1,183 @@
+# ADCO - Cribado masivo de operaciones
+# Puntúa inventarios completos de comparables con los supuestos estándar del simulador
+# y genera un ranking de oportunidades en CSV o Parquet.
+#
+# Uso:
+#   python cribado_operaciones.py --entrada comparables_chamberi.csv --zona Chamberí --salida ranking.csv
+#   python cribado_operaciones.py --almacen datos_adco/comparables.sqlite --salida ranking.parquet --procesos 4
+
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from almacen_comparables import AlmacenComparables, COLUMNAS, normalizar_comparables
+from indice_mercado import IndiceMercado, agregar, ajustar_por_estado
+from busqueda_objetivos import precio_compra_maximo
+from motor_financiero import ROI_SUGERIDO, evaluar_operaciones
+
+# Supuestos estándar (mismos valores por defecto que los inputs del simulador)
+SUPUESTOS = {
+    "coste_reforma_m2": 1600.0,
+    "porcentaje_superficie_reforma": 87.0,
+    "costes_adicionales": 5000.0,
+    "iva_reforma": 10.0,
+    "comision_compra": 0.0,
+    "gastos_legales": 3000.0,
+    "gastos_administrativos": 3000.0,
+    "itp": 2.0,
+    "ibi": 1000.0,
+    "comision_venta": 3.0,
+    "porcentaje_prestamo": 0.0,
+    "interes_prestamo": 4.0,
+    "plazo_anios": 1,
+}
+
+# A partir de este tamaño compensa repartir el cálculo entre procesos
+FILAS_MINIMAS_PARALELO = 200_000
+
+
+def eur_m2_venta(anuncios, indice=None):
+    """
+    €/m² de venta tras reforma para cada anuncio: €/m² "Reformado" de su subzona
+    (o de su zona si la subzona no tiene datos). Sin índice, se calcula con los propios anuncios.
+    """
+    if indice is None:
+        indice = agregar(anuncios)
+        indice = ajustar_por_estado(indice) if not indice.empty else indice
+    if indice.empty:
+        return pd.Series(np.nan, index=anuncios.index)
+    referencia = indice.set_index(["zona", "subzona"])["eur_m2_reformado"]
+    por_subzona = pd.MultiIndex.from_arrays([anuncios["zona"], anuncios["subzona"].fillna("")])
+    por_zona = pd.MultiIndex.from_arrays([anuncios["zona"], [""] * len(anuncios)])
+    valor = referencia.reindex(por_subzona).to_numpy()
+    valor = np.where(np.isnan(valor), referencia.reindex(por_zona).to_numpy(), valor)
+    return pd.Series(valor, index=anuncios.index)
+
+
+def preparar_lote(anuncios, supuestos, eur_m2):
+    """Convierte anuncios en operaciones de compra-reforma-venta para el motor financiero."""
+    superficie = anuncios["superficie"].to_numpy(dtype=float)
+    lote = pd.DataFrame({
+        campo: valor for campo, valor in supuestos.items() if campo != "porcentaje_superficie_reforma"
+    }, index=anuncios.index)
+    lote["superficie"] = superficie
+    lote["superficie_reforma"] = superficie * supuestos["porcentaje_superficie_reforma"] / 100
+    lote["precio_compra"] = anuncios["precio"].to_numpy(dtype=float)
+    lote["precio_venta"] = superficie * np.asarray(eur_m2, dtype=float)
+    return lote
+
+
+def _evaluar_bloque(lote):
+    return evaluar_operaciones(lote)[
+        ["inversion_total", "capital_propio", "ganancia_neta", "roi", "tir", "tir_convergida"]
+    ]
+
+
+def evaluar_en_paralelo(lote, procesos=None):
+    """Evalúa el lote con el motor vectorizado, repartido en bloques por proceso si es grande."""
+    procesos = procesos or os.cpu_count() or 1
+    if procesos <= 1 or len(lote) < FILAS_MINIMAS_PARALELO:
+        return _evaluar_bloque(lote)
+    bloques = np.array_split(np.arange(len(lote)), procesos)
+    with ProcessPoolExecutor(max_workers=procesos) as pool:
+        partes = list(pool.map(_evaluar_bloque, [lote.iloc[b] for b in bloques]))
+    return pd.concat(partes)
+
+
+def cribar(anuncios, supuestos=None, indice=None, procesos=1, roi_objetivo=ROI_SUGERIDO):
+    """
+    Puntúa anuncios en el esquema del almacén (id_anuncio, zona, subzona, precio, superficie...)
+    y devuelve el ranking de oportunidades ordenado por ROI, con el precio de oferta máximo
+    que mantiene roi_objetivo en cada anuncio.
+    """
+    supuestos = {**SUPUESTOS, **(supuestos or {})}
+    anuncios = anuncios.dropna(subset=["precio", "superficie"]).reset_index(drop=True)
+    eur_m2 = eur_m2_venta(anuncios, indice)
+    lote = preparar_lote(anuncios, supuestos, eur_m2)
+    resultado = evaluar_en_paralelo(lote, procesos)
+    oferta = precio_compra_maximo(lote, roi_objetivo)
+
+    ranking = pd.DataFrame({
+        "ID": anuncios["id_anuncio"],
+        "Zona": anuncios["zona"],
+        "Subzona": anuncios["subzona"],
+        "Título": anuncios.get("titulo"),
+        "Precio compra (€)": anuncios["precio"],
+        "Superficie (m²)": anuncios["superficie"],
+        "€/m² compra": anuncios["eur_m2"],
+        "€/m² venta estimado": eur_m2.to_numpy(),
+        "Precio venta estimado (€)": lote["precio_venta"].to_numpy(),
+        "Inversión total (€)": resultado["inversion_total"].to_numpy(),
+        "Capital propio (€)": resultado["capital_propio"].to_numpy(),
+        "Ganancia neta (€)": resultado["ganancia_neta"].to_numpy(),
+        "ROI (%)": resultado["roi"].to_numpy(),
+        "TIR (%)": resultado["tir"].to_numpy(),
+        "Precio oferta (€)": oferta,
+        "Descuento oferta (%)": (1 - oferta / anuncios["precio"].to_numpy()) * 100,
+        "Link": anuncios.get("link"),
+    })
+    ranking = ranking.dropna(subset=["Precio venta estimado (€)"])
+    return ranking.sort_values("ROI (%)", ascending=False).reset_index(drop=True)
+
+
+def leer_anuncios(ruta, zona=None):
+    """Lee un CSV o Parquet de comparables y lo pasa al esquema del almacén."""
+    df = pd.read_parquet(ruta) if ruta.endswith(".parquet") else pd.read_csv(ruta)
+    if set(COLUMNAS).intersection(df.columns) >= {"id_anuncio", "precio", "superficie"}:
+        return df
+    anuncios, _ = normalizar_comparables(df, zona=zona)
+    return anuncios
+
+
+def guardar(ranking, ruta):
+    if ruta.endswith(".parquet"):
+        ranking.to_parquet(ruta, index=False)
+    else:
+        ranking.to_csv(ruta, index=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cribado masivo de oportunidades de flipping (ADCO)")
+    origen = parser.add_mutually_exclusive_group(required=True)
+    origen.add_argument("--entrada", help="CSV o Parquet de comparables")
+    origen.add_argument("--almacen", help="Almacén SQLite de comparables")
+    parser.add_argument("--zona", help="Zona de los anuncios (o filtro de zona en el almacén)")
+    parser.add_argument("--salida", default="oportunidades.csv", help="Ranking en .csv o .parquet")
+    parser.add_argument("--procesos", type=int, default=None, help="Procesos para el cálculo (por defecto, todos los núcleos)")
+    parser.add_argument("--top", type=int, default=None, help="Guardar solo las N mejores")
+    parser.add_argument("--roi-minimo", type=float, default=None, help="Descartar operaciones con ROI inferior (%)")
+    parser.add_argument("--roi-objetivo", type=float, default=ROI_SUGERIDO, help="ROI (%) para el precio de oferta")
+    for campo, valor in SUPUESTOS.items():
+        parser.add_argument(f"--{campo.replace('_', '-')}", type=type(valor), default=valor)
+    args = parser.parse_args(argv)
+
+    inicio = time.perf_counter()
+    indice = None
+    if args.almacen:
+        almacen = AlmacenComparables(args.almacen)
+        tabla = IndiceMercado(almacen).tabla()
+        indice = tabla if not tabla.empty else None
+        anuncios = almacen.consultar(zona=args.zona, columnas=[
+            "id_anuncio", "zona", "subzona", "titulo", "precio", "superficie", "eur_m2", "estado", "link"
+        ]).rename(columns={v: k for k, v in COLUMNAS.items()})
+    else:
+        anuncios = leer_anuncios(args.entrada, zona=args.zona)
+
+    supuestos = {campo: getattr(args, campo) for campo in SUPUESTOS}
+    ranking = cribar(anuncios, supuestos, indice=indice, procesos=args.procesos, roi_objetivo=args.roi_objetivo)
+    if args.roi_minimo is not None:
+        ranking = ranking[ranking["ROI (%)"] >= args.roi_minimo]
+    if args.top:
+        ranking = ranking.head(args.top)
+    guardar(ranking, args.salida)
+
+    print(f"{len(anuncios):,} anuncios analizados, {len(ranking):,} oportunidades en "
+          f"{time.perf_counter() - inicio:.2f} s -> {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
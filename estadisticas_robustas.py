@@ -0,0 +1,145 @@
+# ADCO - Estadísticas robustas de €/m²
+# Mediana, MAD, cuantiles, vallas de Tukey (IQR), media recortada y marcas de atípicos por grupo
+# en una sola ordenación de arrays NumPy (grupo, valor): todos los grupos a la vez, sin bucles
+# de Python ni un groupby de pandas por estadístico. Un anuncio mal parseado (p. ej. 2.066.666 €/m²)
+# no mueve la mediana ni las vallas, así que sirven como límites por defecto de los filtros.
+
+import numpy as np
+import pandas as pd
+
+RECORTE = 0.1        # fracción descartada por cada cola en la media recortada
+K_IQR = 1.5          # vallas de Tukey: [p25 - K·IQR, p75 + K·IQR]
+K_IQR_EXTREMO = 3.0  # vallas "extremas", para el recorrido de los sliders
+CUANTILES = {"p10": 0.10, "p25": 0.25, "p75": 0.75, "p90": 0.90}
+ESTADISTICOS = ["n", "media", "mediana", "mad", *CUANTILES, "iqr", "limite_inferior", "limite_superior",
+                "media_recortada", "minimo", "maximo", "n_atipicos"]
+
+
+def _cuantil(ordenados, inicio, n, q):
+    """Cuantil q de cada grupo (interpolación lineal, como NumPy y pandas) sobre los valores ordenados."""
+    posicion = inicio + q * (n - 1)
+    abajo = np.floor(posicion).astype(np.int64)
+    arriba = np.minimum(abajo + 1, inicio + n - 1)
+    return ordenados[abajo] + (posicion - abajo) * (ordenados[arriba] - ordenados[abajo])
+
+
+def _ordenar(valores, codigos):
+    """
+    Permutación que ordena por grupo y, dentro de cada grupo, por valor: una ordenación de los
+    floats y otra estable de los códigos (radix si caben en 16 bits), mucho más rápido que np.lexsort.
+    """
+    por_valor = np.argsort(valores)
+    codigos = codigos[por_valor]
+    if len(codigos) and codigos.max() < np.iinfo(np.int16).max:
+        codigos = codigos.astype(np.int16)
+    return por_valor[np.argsort(codigos, kind="stable")]
+
+
+def _agregar(valores, codigos, n_grupos, recorte=RECORTE, k=K_IQR):
+    """
+    Estadísticos de cada grupo 0..n_grupos-1 (todos con al menos un valor) y marca de atípico
+    de cada valor en su orden original.
+    """
+    orden = _ordenar(valores, codigos)
+    ordenados = valores[orden]
+    n = np.bincount(codigos, minlength=n_grupos)
+    inicio = np.concatenate([[0], np.cumsum(n)[:-1]])
+
+    stats = {"n": n, "media": np.bincount(codigos, weights=valores, minlength=n_grupos) / n}
+    stats["mediana"] = _cuantil(ordenados, inicio, n, 0.5)
+    for nombre, q in CUANTILES.items():
+        stats[nombre] = _cuantil(ordenados, inicio, n, q)
+    stats["iqr"] = stats["p75"] - stats["p25"]
+    stats["limite_inferior"] = stats["p25"] - k * stats["iqr"]
+    stats["limite_superior"] = stats["p75"] + k * stats["iqr"]
+    stats["minimo"] = ordenados[inicio]
+    stats["maximo"] = ordenados[inicio + n - 1]
+
+    # MAD: mediana de las desviaciones absolutas; los códigos ya están ordenados
+    grupo = codigos[orden]
+    desviaciones = np.abs(ordenados - stats["mediana"][grupo])
+    stats["mad"] = _cuantil(desviaciones[_ordenar(desviaciones, grupo)], inicio, n, 0.5)
+
+    # Media recortada con sumas acumuladas: descarta floor(RECORTE·n) valores por cada cola
+    acumulado = np.concatenate([[0.0], np.cumsum(ordenados)])
+    desde = np.floor(recorte * n + 1e-9).astype(np.int64)
+    hasta = n - desde
+    cuantos = hasta - desde
+    with np.errstate(invalid="ignore", divide="ignore"):
+        recortada = (acumulado[inicio + hasta] - acumulado[inicio + desde]) / cuantos
+    stats["media_recortada"] = np.where(cuantos > 0, recortada, stats["mediana"])
+
+    atipico_ordenado = (ordenados < stats["limite_inferior"][grupo]) | (ordenados > stats["limite_superior"][grupo])
+    stats["n_atipicos"] = np.bincount(grupo, weights=atipico_ordenado, minlength=n_grupos).astype(np.int64)
+    atipico = np.empty(len(valores), dtype=bool)
+    atipico[orden] = atipico_ordenado
+    return stats, atipico
+
+
+def _codigos(df, claves, columna):
+    """Valores válidos (float64), código de grupo de cada uno y claves de cada grupo."""
+    valores = pd.to_numeric(df[columna], errors="coerce").to_numpy(dtype=np.float64)
+    validos = np.isfinite(valores)
+    if claves:
+        validos &= df[claves].notna().all(axis=1).to_numpy()
+        datos = df[claves] if validos.all() else df.loc[validos, claves]
+        # ngroup numera los grupos por orden de aparición: el primero de cada código da sus claves
+        codigos = datos.groupby(claves, sort=False).ngroup().to_numpy()
+        grupos = datos.iloc[pd.Series(codigos).drop_duplicates().index].reset_index(drop=True)
+    else:
+        codigos = np.zeros(int(validos.sum()), dtype=np.int64)
+        grupos = pd.DataFrame(index=[0])
+    valores = valores[validos]
+    return valores, codigos, grupos, validos
+
+
+def agregar_robusto(df, claves=("zona", "subzona"), columna="eur_m2", recorte=RECORTE, k=K_IQR):
+    """
+    Estadísticos robustos de `columna` por grupo (una fila por combinación de `claves` con datos;
+    filas con clave o valor nulo se ignoran). Con claves vacías, una sola fila para todo df.
+    """
+    claves = list(claves)
+    valores, codigos, grupos, _ = _codigos(df, claves, columna)
+    if not len(valores):
+        return pd.DataFrame(columns=claves + ESTADISTICOS)
+    stats, _ = _agregar(valores, codigos, len(grupos), recorte, k)
+    return pd.concat([grupos, pd.DataFrame({nombre: stats[nombre] for nombre in ESTADISTICOS})], axis=1)
+
+
+def marcar_atipicos(df, claves=("zona", "subzona"), columna="eur_m2", k=K_IQR):
+    """Serie booleana (índice de df): True si el valor cae fuera de las vallas de Tukey de su grupo."""
+    claves = list(claves)
+    valores, codigos, grupos, validos = _codigos(df, claves, columna)
+    marcas = np.zeros(len(df), dtype=bool)
+    if len(valores):
+        marcas[validos] = _agregar(valores, codigos, len(grupos), k=k)[1]
+    return pd.Series(marcas, index=df.index)
+
+
+def resumen_robusto(valores, estados=None, recorte=RECORTE, k=K_IQR):
+    """
+    Estadísticos de un conjunto de valores (dict, con n = 0 si no hay ninguno válido) y, si se
+    pasan los estados de cada valor, mediana y recuento por estado en "por_estado".
+    """
+    df = pd.DataFrame({"valor": valores, "estado": estados})
+    stats = agregar_robusto(df, (), "valor", recorte, k)
+    resumen = stats.to_dict("records")[0] if len(stats) else {"n": 0}
+    if estados is not None:
+        por_estado = agregar_robusto(df, ["estado"], "valor", recorte, k)
+        resumen["por_estado"] = {f["estado"]: {"n": f["n"], "mediana": f["mediana"]}
+                                 for f in por_estado.to_dict("records")}
+    return resumen
+
+
+def limites_filtro(resumen, incluir_atipicos=False):
+    """
+    Recorrido y valor por defecto de un filtro de rango: vallas extremas y vallas de Tukey,
+    recortadas al mínimo y máximo reales (o el rango completo si se incluyen los atípicos).
+    """
+    minimo, maximo = resumen["minimo"], resumen["maximo"]
+    if incluir_atipicos:
+        return (minimo, maximo), (minimo, maximo)
+    extremo = (K_IQR_EXTREMO - K_IQR) * resumen["iqr"]
+    recorrido = (max(minimo, resumen["limite_inferior"] - extremo), min(maximo, resumen["limite_superior"] + extremo))
+    defecto = (max(minimo, resumen["limite_inferior"]), min(maximo, resumen["limite_superior"]))
+    return recorrido, defecto
@@ -0,0 +1,213 @@
+# ADCO - Flujo de caja mensual de una operación de flipping
+# Modela mes a mes la compra, las disposiciones de la reforma, el préstamo (solo intereses
+# o amortizable), los costes de tenencia y la venta, y calcula la XIRR sobre flujos fechados.
+# Vectorizado: una fila por operación, una columna por mes.
+
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from calculo_tir import xirr_vectorizada
+from instrumentacion import medido
+from motor_financiero import CAMPOS_ENTRADA, preparar_operaciones
+
+# Parámetros propios del modelo mensual (se añaden a los de motor_financiero)
+VALORES_MENSUALES = {
+    "meses_venta": 12,            # mes de la escritura de venta, contado desde la compra
+    "mes_inicio_reforma": 1,      # primer mes con pagos de reforma
+    "meses_reforma": 6,           # duración de la obra (pagos repartidos por igual)
+    "prestamo_amortizable": 0,    # 0 = solo intereses y devolución a la venta, 1 = cuota francesa
+    "comunidad_mensual": 0.0,
+    "seguro_anual": 0.0,
+    "suministros_mensual": 0.0,
+}
+
+CAMPOS_MENSUALES = list(VALORES_MENSUALES.keys())
+
+
+def preparar_mensual(operaciones):
+    """Como preparar_operaciones, completando también los campos del modelo mensual."""
+    df = preparar_operaciones(operaciones)
+    for campo, valor in VALORES_MENSUALES.items():
+        if campo not in df.columns:
+            df[campo] = valor
+        else:
+            df[campo] = df[campo].fillna(valor)
+    df[CAMPOS_MENSUALES] = df[CAMPOS_MENSUALES].astype(float)
+    df["meses_venta"] = df["meses_venta"].clip(lower=1).round()
+    df["mes_inicio_reforma"] = df["mes_inicio_reforma"].clip(lower=0).round()
+    df["meses_reforma"] = df["meses_reforma"].clip(lower=1).round()
+    return df
+
+
+def fechas_mensuales(fecha_compra, meses):
+    """Fechas de los meses 0..meses a partir de la fecha de compra (mismo día de cada mes)."""
+    inicio = pd.Timestamp(fecha_compra or date.today())
+    return np.array([(inicio + pd.DateOffset(months=m)).date() for m in range(meses + 1)], dtype="datetime64[D]")
+
+
+def _calendario_reforma(c, meses, calendario=None):
+    """
+    Pagos de reforma por mes (n × meses+1). Por defecto repartidos por igual durante
+    meses_reforma desde mes_inicio_reforma; con calendario (fracciones por mes de obra)
+    se usa ese reparto para todas las filas. Lo pendiente a la venta se paga ese mes.
+    """
+    mes = np.arange(meses + 1)
+    desde = mes - c["mes_inicio_reforma"][:, None]
+    if calendario is None:
+        peso = ((desde >= 0) & (desde < c["meses_reforma"][:, None])) / c["meses_reforma"][:, None]
+    else:
+        fracciones = np.asarray(calendario, dtype=float)
+        fracciones = fracciones / fracciones.sum()
+        dentro = (desde >= 0) & (desde < len(fracciones))
+        peso = np.where(dentro, fracciones[np.clip(desde, 0, len(fracciones) - 1).astype(int)], 0.0)
+
+    pagos = peso * c["coste_reforma_iva"][:, None]
+    venta = c["meses_venta"].astype(int)
+    pagado = np.cumsum(pagos, axis=1)
+    filas = np.arange(len(venta))
+    pagos[filas, venta] += c["coste_reforma_iva"] - pagado[filas, venta]
+    pagos[mes[None, :] > venta[:, None]] = 0.0
+    return pagos
+
+
+@medido("flujo_mensual.calcular", filas=lambda r: np.size(r["roi"]))
+def calcular_mensual(c, fecha_compra=None, calendario_reforma=None):
+    """
+    Núcleo del modelo mensual sobre arrays NumPy. Recibe un dict con CAMPOS_ENTRADA y
+    CAMPOS_MENSUALES y devuelve un dict de arrays, los flujos del inversor (n × meses+1)
+    y sus fechas.
+
+    El préstamo financia porcentaje_prestamo de cada pago de compra y de reforma según se
+    produce (disposiciones); los intereses se pagan cada mes sobre el saldo dispuesto y,
+    si es amortizable, con cuota francesa a plazo_anios. El saldo pendiente se cancela
+    con la venta. El IBI (anual), el seguro, la comunidad y los suministros son costes de
+    tenencia mensuales hasta la venta.
+    """
+    n = len(c["precio_compra"])
+    venta = c["meses_venta"].astype(int)
+    meses = int(venta.max())
+    mes = np.arange(meses + 1)
+    activo = mes[None, :] <= venta[:, None]
+
+    coste_reforma = c["superficie_reforma"] * c["coste_reforma_m2"] + c["costes_adicionales"]
+    c = {**c, "coste_reforma_iva": coste_reforma * (1 + c["iva_reforma"] / 100)}
+    comision_compra_eur = c["precio_compra"] * c["comision_compra"] / 100
+    itp_eur = c["precio_compra"] * c["itp"] / 100
+    compra = c["precio_compra"] + comision_compra_eur + itp_eur + c["gastos_legales"] + c["gastos_administrativos"]
+
+    pagos = _calendario_reforma(c, meses, calendario_reforma)
+    pagos[:, 0] += compra
+
+    tenencia_mensual = c["ibi"] / 12 + c["seguro_anual"] / 12 + c["comunidad_mensual"] + c["suministros_mensual"]
+    tenencia = np.where(activo & (mes[None, :] >= 1), tenencia_mensual[:, None], 0.0)
+
+    financiado = c["porcentaje_prestamo"][:, None] / 100
+    disposiciones = pagos * financiado
+    tasa = c["interes_prestamo"] / 100 / 12
+    plazo = c["plazo_anios"] * 12
+    amortizable = c["prestamo_amortizable"] > 0
+
+    intereses = np.zeros((n, meses + 1))
+    amortizacion = np.zeros((n, meses + 1))
+    saldo = disposiciones[:, 0].copy()
+    for m in range(1, meses + 1):
+        en_curso = m <= venta
+        intereses[:, m] = np.where(en_curso, saldo * tasa, 0.0)
+        restantes = np.maximum(plazo - (m - 1), 1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cuota = np.where(tasa > 0, saldo * tasa / (1 - (1 + tasa) ** -restantes), saldo / restantes)
+        amortizacion[:, m] = np.where(en_curso & amortizable, np.minimum(cuota - intereses[:, m], saldo), 0.0)
+        saldo = saldo - amortizacion[:, m] + np.where(en_curso, disposiciones[:, m], 0.0)
+
+    # Saldo pendiente en la venta (todo lo dispuesto menos lo amortizado)
+    cancelacion = disposiciones.sum(axis=1) - amortizacion.sum(axis=1)
+    comision_venta_eur = c["precio_venta"] * c["comision_venta"] / 100
+    ingreso_venta = np.zeros((n, meses + 1))
+    ingreso_venta[np.arange(n), venta] = c["precio_venta"] - comision_venta_eur - cancelacion
+
+    flujos = ingreso_venta - pagos + disposiciones - tenencia - intereses - amortizacion
+    fechas = fechas_mensuales(fecha_compra, meses)
+
+    aportado = np.where(flujos < 0, -flujos, 0.0).sum(axis=1)
+    acumulado = np.cumsum(flujos, axis=1)
+    ganancia_neta = flujos.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        roi = np.where(aportado > 0, ganancia_neta / aportado * 100, 0.0)
+    tir, tir_convergida = xirr_vectorizada(flujos, fechas)
+
+    return {
+        "coste_reforma_iva": c["coste_reforma_iva"],
+        "inversion_total": compra + c["coste_reforma_iva"],
+        "monto_prestamo": disposiciones.sum(axis=1),
+        "intereses_totales": intereses.sum(axis=1),
+        "costes_tenencia": tenencia.sum(axis=1),
+        "comision_venta_eur": comision_venta_eur,
+        "cancelacion_prestamo": cancelacion,
+        "capital_aportado": aportado,
+        "capital_maximo": np.maximum(-acumulado.min(axis=1), 0.0),
+        "ganancia_neta": ganancia_neta,
+        "roi": roi,
+        "tir": tir * 100,
+        "tir_convergida": tir_convergida,
+        "meses_venta": venta,
+        "flujos": flujos,
+        "fechas": fechas,
+        "detalle": {
+            "compra_y_reforma": -pagos,
+            "disposiciones": disposiciones,
+            "intereses": -intereses,
+            "amortizacion": -amortizacion,
+            "tenencia": -tenencia,
+            "venta": ingreso_venta,
+        },
+    }
+
+
+def _arrays(df):
+    return {campo: df[campo].to_numpy() for campo in CAMPOS_ENTRADA + CAMPOS_MENSUALES}
+
+
+def evaluar_mensual(operaciones, fecha_compra=None, calendario_reforma=None):
+    """
+    Evalúa un lote de operaciones con el modelo mensual y devuelve un DataFrame con
+    ganancia, ROI sobre el capital aportado, capital máximo expuesto y XIRR anual (%).
+    """
+    df = preparar_mensual(operaciones)
+    r = calcular_mensual(_arrays(df), fecha_compra, calendario_reforma)
+    return pd.DataFrame(
+        {k: v for k, v in r.items() if k not in ("flujos", "fechas", "detalle")}, index=df.index
+    )
+
+
+def tabla_flujos(operacion, fecha_compra=None, calendario_reforma=None):
+    """Flujo de caja mes a mes de una operación, con el desglose por concepto y el acumulado."""
+    df = preparar_mensual(operacion).iloc[[0]]
+    r = calcular_mensual(_arrays(df), fecha_compra, calendario_reforma)
+    meses = int(r["meses_venta"][0])
+    tabla = pd.DataFrame({
+        "Mes": np.arange(meses + 1),
+        "Fecha": pd.to_datetime(r["fechas"][:meses + 1]).date,
+        "Compra y reforma (€)": r["detalle"]["compra_y_reforma"][0, :meses + 1],
+        "Préstamo dispuesto (€)": r["detalle"]["disposiciones"][0, :meses + 1],
+        "Intereses (€)": r["detalle"]["intereses"][0, :meses + 1],
+        "Amortización (€)": r["detalle"]["amortizacion"][0, :meses + 1],
+        "Tenencia (€)": r["detalle"]["tenencia"][0, :meses + 1],
+        "Venta neta (€)": r["detalle"]["venta"][0, :meses + 1],
+        "Flujo inversor (€)": r["flujos"][0, :meses + 1],
+    })
+    tabla["Acumulado (€)"] = tabla["Flujo inversor (€)"].cumsum()
+    return tabla
+
+
+def escenarios_mensuales(operacion, variaciones, fecha_compra=None):
+    """Modelo mensual de una operación con el precio de venta variado en los porcentajes indicados."""
+    base = preparar_mensual(operacion).iloc[[0]]
+    variaciones = np.asarray(list(variaciones), dtype=float)
+    lote = base.loc[base.index.repeat(len(variaciones))].reset_index(drop=True)
+    lote["precio_venta"] = lote["precio_venta"] * (1 + variaciones / 100)
+    resultado = evaluar_mensual(lote, fecha_compra)
+    resultado.insert(0, "variacion", variaciones)
+    resultado.insert(1, "precio_venta", lote["precio_venta"])
+    return resultado
@@ -0,0 +1,197 @@
+# ADCO - Índice de mercado por zona y subzona
+# Agrega el almacén de comparables en estadísticas de €/m² precalculadas (mediana, media recortada,
+# cuantiles, MAD, vallas de atípicos, recuentos y €/m² por estado) que las páginas consultan en O(1).
+
+import sqlite3
+from contextlib import contextmanager
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from almacen_comparables import AlmacenComparables
+from estadisticas_robustas import agregar_robusto
+
+ESTADO_REFORMADO = "Reformado"
+ESTADO_A_REFORMAR = "A reformar"
+
+# Clave de la fila agregada a nivel de zona
+TODAS = ""
+
+
+def agregar(df):
+    """
+    Estadísticas de €/m² por (zona, subzona) y por zona completa (subzona = TODAS).
+    df necesita columnas zona, subzona, eur_m2 y estado.
+    """
+    df = df.dropna(subset=["eur_m2"])
+    if df.empty:
+        return pd.DataFrame()
+    # Zona completa y subzonas por separado: sin duplicar los anuncios en memoria
+    datos = df.assign(subzona=df["subzona"].fillna(TODAS))
+    niveles = [datos.assign(subzona=TODAS), datos[datos["subzona"] != TODAS]]
+    stats = pd.concat([agregar_robusto(d) for d in niveles], ignore_index=True)
+    stats = stats.drop(columns=["iqr", "minimo", "maximo"])
+
+    por_estado = pd.concat([agregar_robusto(d, ["zona", "subzona", "estado"]) for d in niveles], ignore_index=True)
+    clave = pd.MultiIndex.from_frame(stats[["zona", "subzona"]])
+    for estado, sufijo in [(ESTADO_REFORMADO, "reformado"), (ESTADO_A_REFORMAR, "a_reformar")]:
+        del_estado = por_estado[por_estado["estado"] == estado].set_index(["zona", "subzona"])
+        stats[f"mediana_{sufijo}"] = del_estado["mediana"].reindex(clave).to_numpy()
+        stats[f"n_{sufijo}"] = del_estado["n"].reindex(clave).fillna(0).to_numpy()
+    return stats
+
+
+def ajustar_por_estado(stats, prima_por_defecto=1.25):
+    """
+    €/m² ajustado por estado: si un grupo no tiene anuncios de un estado se estima
+    con la mediana del grupo y la prima de reforma (reformado / a reformar) global.
+    """
+    stats = stats.copy()
+    ambos = stats.dropna(subset=["mediana_reformado", "mediana_a_reformar"])
+    prima = (ambos["mediana_reformado"] / ambos["mediana_a_reformar"]).median() if not ambos.empty else np.nan
+    prima = prima if np.isfinite(prima) and prima > 0 else prima_por_defecto
+    raiz = np.sqrt(prima)
+    stats["eur_m2_reformado"] = stats["mediana_reformado"].fillna(stats["mediana"] * raiz)
+    stats["eur_m2_a_reformar"] = stats["mediana_a_reformar"].fillna(stats["mediana"] / raiz)
+    stats["prima_reforma"] = stats["eur_m2_reformado"] / stats["eur_m2_a_reformar"]
+    return stats
+
+
+class IndiceMercado:
+    """
+    Índice precalculado guardado junto al almacén y servido desde memoria. La copia en memoria
+    se recarga cuando cambia la revisión en SQLite (p. ej. la actualiza el proceso trabajador).
+    """
+
+    def __init__(self, almacen=None):
+        self.almacen = almacen or AlmacenComparables()
+        self._indice = None
+        self._revision = None
+        with self._conectar() as con:
+            con.executescript("""
+                CREATE TABLE IF NOT EXISTS indice_mercado (
+                    zona TEXT NOT NULL,
+                    subzona TEXT NOT NULL,
+                    n INTEGER,
+                    mediana REAL,
+                    media REAL,
+                    media_recortada REAL,
+                    p10 REAL, p25 REAL, p75 REAL, p90 REAL,
+                    mad REAL,
+                    limite_inferior REAL,
+                    limite_superior REAL,
+                    n_atipicos INTEGER,
+                    mediana_reformado REAL,
+                    mediana_a_reformar REAL,
+                    n_reformado INTEGER,
+                    n_a_reformar INTEGER,
+                    eur_m2_reformado REAL,
+                    eur_m2_a_reformar REAL,
+                    prima_reforma REAL,
+                    actualizado TEXT,
+                    PRIMARY KEY (zona, subzona)
+                );
+                CREATE TABLE IF NOT EXISTS indice_meta (clave TEXT PRIMARY KEY, valor TEXT);
+            """)
+            columnas = {fila[1] for fila in con.execute("PRAGMA table_info(indice_mercado)")}
+            nuevas = [("mad", "REAL"), ("limite_inferior", "REAL"), ("limite_superior", "REAL"), ("n_atipicos", "INTEGER")]
+            for columna, tipo in nuevas:
+                if columna not in columnas:
+                    con.execute(f"ALTER TABLE indice_mercado ADD COLUMN {columna} {tipo}")
+            if any(columna not in columnas for columna, _ in nuevas):
+                # Índice anterior sin estadísticas robustas: la próxima actualización lo recalcula entero
+                con.execute("DELETE FROM indice_meta WHERE clave = 'ultima_actualizacion'")
+
+    @contextmanager
+    def _conectar(self):
+        con = sqlite3.connect(self.almacen.ruta, timeout=30)
+        try:
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    def actualizar(self, completo=False):
+        """
+        Recalcula solo las zonas con anuncios vistos o con cambios de precio desde la
+        última actualización (o todas si completo=True). Devuelve las zonas recalculadas.
+        """
+        hoy = date.today().isoformat()
+        with self._conectar() as con:
+            fila = con.execute("SELECT valor FROM indice_meta WHERE clave = 'ultima_actualizacion'").fetchone()
+            desde = None if completo or fila is None else fila[0]
+            if desde is None:
+                zonas = [z for (z,) in con.execute("SELECT DISTINCT zona FROM anuncios WHERE zona IS NOT NULL")]
+            else:
+                zonas = [z for (z,) in con.execute(
+                    "SELECT DISTINCT zona FROM anuncios WHERE zona IS NOT NULL AND (ultima_vez >= ? OR id_anuncio IN "
+                    "(SELECT id_anuncio FROM cambios_precio WHERE fecha >= ?))", (desde, desde)
+                )]
+            if not zonas:
+                return []
+
+            marcadores = ", ".join("?" * len(zonas))
+            df = pd.read_sql_query(
+                f"SELECT zona, subzona, eur_m2, estado FROM anuncios "
+                f"WHERE duplicado_de IS NULL AND zona IN ({marcadores})", con, params=zonas
+            )
+            stats = agregar(df)
+            # La prima de reforma se estima con todo el índice, no solo con lo recalculado
+            previas = pd.read_sql_query(
+                f"SELECT * FROM indice_mercado WHERE zona NOT IN ({marcadores})", con, params=zonas
+            )
+            completas = ajustar_por_estado(pd.concat([previas.drop(columns=["actualizado"]), stats], ignore_index=True))
+            stats = completas[completas["zona"].isin(zonas)].copy()
+            stats["actualizado"] = hoy
+
+            con.execute(f"DELETE FROM indice_mercado WHERE zona IN ({marcadores})", zonas)
+            columnas = list(stats.columns)
+            con.executemany(
+                f"INSERT INTO indice_mercado ({', '.join(columnas)}) VALUES ({', '.join('?' * len(columnas))})",
+                [tuple(None if pd.isna(v) else (v.item() if hasattr(v, "item") else v) for v in fila)
+                 for fila in stats.itertuples(index=False)],
+            )
+            con.execute("INSERT OR REPLACE INTO indice_meta VALUES ('ultima_actualizacion', ?)", (hoy,))
+            con.execute(
+                "INSERT INTO indice_meta VALUES ('revision', '1') "
+                "ON CONFLICT (clave) DO UPDATE SET valor = CAST(valor AS INTEGER) + 1"
+            )
+        return zonas
+
+    def version(self):
+        """Revisión del índice guardado: cambia en cada actualización, en cualquier proceso."""
+        with self._conectar() as con:
+            fila = con.execute("SELECT valor FROM indice_meta WHERE clave = 'revision'").fetchone()
+        return int(fila[0]) if fila else 0
+
+    def _cargar(self):
+        revision = self.version()
+        if self._indice is None or revision != self._revision:
+            with self._conectar() as con:
+                df = pd.read_sql_query("SELECT * FROM indice_mercado", con)
+            self._indice = {(f["zona"], f["subzona"]): f for f in df.to_dict("records")}
+            self._revision = revision
+        return self._indice
+
+    def obtener(self, zona, subzona=None):
+        """Estadísticas de una zona o subzona (dict) o None si no hay datos."""
+        return self._cargar().get((zona, subzona or TODAS))
+
+    def eur_m2(self, zona, subzona=None, estado=None):
+        """€/m² de referencia: por estado si se indica, si no la mediana; la subzona cae a la zona."""
+        stats = self.obtener(zona, subzona) or self.obtener(zona)
+        if stats is None:
+            return None
+        if estado == ESTADO_REFORMADO:
+            return stats["eur_m2_reformado"]
+        if estado == ESTADO_A_REFORMAR:
+            return stats["eur_m2_a_reformar"]
+        return stats["mediana"]
+
+    def tabla(self, zona=None):
+        """Índice completo (o de una zona) como DataFrame."""
+        df = pd.DataFrame(list(self._cargar().values()))
+        if zona is not None and not df.empty:
+            df = df[df["zona"] == zona]
+        return df
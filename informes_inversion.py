@@ -0,0 +1,406 @@
+# ADCO - Informes de inversión en PDF y Excel
+# Plantilla fija de páginas A4 dibujada con matplotlib (PdfPages, sin navegador): Resumen
+# Ejecutivo con métricas y gráfico, escenarios de precio de venta, flujo de caja mensual y
+# comparables. El Excel (openpyxl, opcional) lleva las mismas tablas en hojas. El logo, la
+# fuente y el estilo se cargan una vez por proceso. El modo por lotes genera los informes de
+# cientos de operaciones cribadas repartidos entre procesos.
+#
+# Uso:
+#   python informes_inversion.py --almacen datos_adco/comparables.sqlite --top 200 --salida informes/ --formatos pdf xlsx
+#   python informes_inversion.py --entrada operaciones.csv --salida informes/ --procesos 8
+#
+# Fuente propia (TTF) para los PDF: ADCO_FUENTE_INFORMES=/ruta/fuente.ttf
+
+import argparse
+import functools
+import io
+import os
+import re
+import textwrap
+import time
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from flujo_mensual import escenarios_mensuales, tabla_flujos
+from instrumentacion import medido
+from motor_financiero import ROI_SUGERIDO, escenarios_precio_venta, formatear_tir, resumen_ejecutivo
+
+CARPETA_RECURSOS = os.path.dirname(os.path.abspath(__file__))
+RUTA_LOGO = os.path.join(CARPETA_RECURSOS, "ADCO LOGO SIMPLE.png")
+RUTA_FUENTE = os.environ.get("ADCO_FUENTE_INFORMES")
+PIE = "ADCO Investments – andres@adco.es"
+
+VARIACIONES_ESCENARIOS = list(range(-20, 21, 5))
+MAX_FILAS_FLUJO = 37
+MAX_FILAS_COMPARABLES = 25
+COLUMNAS_COMPARABLES = ["Subzona", "Título", "Precio (€)", "Superficie (m²)", "€/m²", "Estado"]
+
+A4 = (8.27, 11.69)
+AZUL_ADCO = "#1f3b57"
+ESTILO = {
+    "font.size": 8,
+    "axes.titlesize": 10,
+    "axes.spines.top": False,
+    "axes.spines.right": False,
+    "pdf.compression": 6,
+}
+
+
+@functools.lru_cache(maxsize=1)
+def recursos():
+    """Logo, fuente y estilo de la plantilla, cargados una vez por proceso."""
+    import matplotlib
+    matplotlib.use("Agg")
+    from matplotlib import font_manager, image
+
+    fuente = "DejaVu Sans"
+    if RUTA_FUENTE and os.path.exists(RUTA_FUENTE):
+        font_manager.fontManager.addfont(RUTA_FUENTE)
+        fuente = font_manager.FontProperties(fname=RUTA_FUENTE).get_name()
+    logo = None
+    if os.path.exists(RUTA_LOGO):
+        # Reducido a ~160 px (lo que ocupa en la cabecera) para no remuestrearlo en cada página
+        logo = image.imread(RUTA_LOGO)
+        paso = max(1, logo.shape[0] // 160)
+        logo = np.ascontiguousarray(logo[::paso, ::paso])
+    return {"logo": logo, "estilo": {**ESTILO, "font.family": fuente}}
+
+
+def _texto(valor):
+    """Texto sin emojis (la fuente de los PDF no los tiene)."""
+    return "".join(c for c in str(valor) if unicodedata.category(c) not in ("So", "Cs", "Cn", "Mn")).strip()
+
+
+# --- CONTENIDO ---
+
+@medido("informe.datos")
+def datos_informe(operacion, titulo=None, fecha_compra=None, comparables=None):
+    """Cifras y tablas del informe de una operación (las mismas que muestra el simulador)."""
+    # El escenario sin variación es la propia operación: un solo lote por modelo
+    escenarios = escenarios_precio_venta(operacion, VARIACIONES_ESCENARIOS)
+    mensuales = escenarios_mensuales(operacion, VARIACIONES_ESCENARIOS, fecha_compra)
+    escenarios["xirr"] = mensuales["tir"].to_numpy()
+    base = VARIACIONES_ESCENARIOS.index(0)
+    resultado = escenarios.iloc[[base]]
+    r, mensual = resultado.iloc[0], mensuales.iloc[base]
+    if comparables is not None:
+        comparables = comparables[[c for c in COLUMNAS_COMPARABLES if c in comparables.columns]]
+    return {
+        "titulo": titulo or "Operación de flipping",
+        "fecha": date.today(),
+        "metricas": {
+            "Inversión total": f"{r['inversion_total']:,.0f} €",
+            "Capital propio": f"{r['capital_propio']:,.0f} €",
+            "Ganancia neta": f"{r['ganancia_neta']:,.0f} €",
+            "ROI": f"{r['roi']:.2f}%",
+            "TIR": formatear_tir(r["tir"], "%"),
+            "XIRR mensual": formatear_tir(mensual["tir"], "%"),
+            "Capital máximo expuesto": f"{mensual['capital_maximo']:,.0f} €",
+            f"Precio con {ROI_SUGERIDO:.0f}% ROI": f"{r['precio_venta_sugerido']:,.0f} €",
+        },
+        "interpretacion": r["interpretacion"],
+        "barras": {"Capital Propio": r["capital_propio"], "Ganancia Neta": r["ganancia_neta"]},
+        "resumen": resumen_ejecutivo(operacion, resultado),
+        "escenarios": pd.DataFrame({
+            "Variación Precio Venta (%)": escenarios["variacion"],
+            "Precio de Venta (€)": escenarios["precio_venta"],
+            "ROI (%)": escenarios["roi"],
+            "TIR (%)": escenarios["tir"],
+            "XIRR mensual (%)": escenarios["xirr"],
+        }),
+        "flujos": tabla_flujos(operacion, fecha_compra),
+        "comparables": comparables,
+    }
+
+
+# --- PLANTILLA PDF ---
+
+def _nueva_pagina(datos, numero):
+    """Página A4 con la cabecera (logo, título, fecha) y el pie de la plantilla."""
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=A4)
+    logo = recursos()["logo"]
+    if logo is not None:
+        fig.add_axes([0.06, 0.925, 0.12, 0.06]).imshow(logo, interpolation="none")
+        fig.axes[-1].axis("off")
+    fig.text(0.21, 0.955, _texto(datos["titulo"]), fontsize=13, fontweight="bold", color=AZUL_ADCO, va="center")
+    fig.text(0.21, 0.935, f"Informe de inversión · {datos['fecha']:%d/%m/%Y}", fontsize=8, color="gray", va="center")
+    fig.add_artist(_linea(fig, 0.915))
+    fig.text(0.06, 0.025, PIE, fontsize=7, color="gray")
+    fig.text(0.94, 0.025, f"Página {numero}", fontsize=7, color="gray", ha="right")
+    return fig
+
+
+def _linea(fig, y, desde=0.06, hasta=0.94, grosor=1.0):
+    from matplotlib.lines import Line2D
+
+    return Line2D([desde, hasta], [y, y], transform=fig.transFigure, color=AZUL_ADCO, linewidth=grosor)
+
+
+def _tabla(fig, x, y, ancho, df, titulo=None, formatos=None, tamano=7):
+    """
+    Tabla de un DataFrame desde (x, y), esquina superior izquierda en coordenadas de página.
+    Cada columna es un único texto de varias líneas (no una celda por valor como
+    matplotlib.table), que es lo que hace rápido el dibujo de las páginas.
+    """
+    formatos = formatos or {}
+    punto = 1 / (A4[1] * 72)  # un punto tipográfico en coordenadas de página
+    if titulo:
+        fig.text(x, y, titulo, fontsize=10, fontweight="bold", color=AZUL_ADCO, va="top")
+        y -= 18 * punto
+
+    columnas = []
+    for columna in df.columns:
+        valores = [_texto(formatos[columna](v)) if columna in formatos and pd.notna(v)
+                   else ("–" if pd.isna(v) else _texto(v)) for v in df[columna]]
+        largo = max([len(v) for v in valores] + [6])
+        cabecera = textwrap.fill(_texto(columna), width=max(largo, 10))
+        numerica = columna in formatos or pd.api.types.is_numeric_dtype(df[columna])
+        columnas.append((cabecera, valores, max(largo, *map(len, cabecera.split("\n"))), numerica))
+
+    escala = ancho / sum(c[2] + 2 for c in columnas)
+    lineas_cabecera = max(c[0].count("\n") + 1 for c in columnas)
+    y_cuerpo = y - (lineas_cabecera * 1.25 + 0.6) * tamano * punto
+    fig.add_artist(_linea(fig, y_cuerpo + 0.3 * tamano * punto, x, x + ancho, 0.6))
+    izquierda = x
+    for cabecera, valores, largo, numerica in columnas:
+        derecha = izquierda + (largo + 2) * escala
+        posicion, alineacion = (derecha - escala, "right") if numerica else (izquierda, "left")
+        fig.text(posicion, y, cabecera, fontsize=tamano, fontweight="bold", color=AZUL_ADCO, va="top",
+                 ha=alineacion, multialignment=alineacion, linespacing=1.1)
+        fig.text(posicion, y_cuerpo, "\n".join(valores), fontsize=tamano, va="top", ha=alineacion,
+                 multialignment=alineacion, linespacing=1.45)
+        izquierda = derecha
+
+
+def _pagina_resumen(fig, datos):
+    metricas = list(datos["metricas"].items())
+    for i, (nombre, valor) in enumerate(metricas):
+        x, y = 0.06 + (i % 4) * 0.22, 0.87 - (i // 4) * 0.06
+        fig.text(x, y, nombre, fontsize=7, color="gray")
+        fig.text(x, y - 0.022, valor, fontsize=11, fontweight="bold", color=AZUL_ADCO)
+    fig.text(0.06, 0.74, _texto(datos["interpretacion"]), fontsize=9, style="italic")
+
+    _tabla(fig, 0.06, 0.7, 0.5, datos["resumen"], "Resumen Ejecutivo")
+    ax = fig.add_axes([0.64, 0.42, 0.3, 0.26])
+    ax.bar(list(datos["barras"]), list(datos["barras"].values()), color=["gray", "green"])
+    ax.set_title("Capital vs ganancia")
+    ax.yaxis.set_major_formatter(lambda v, _: f"{v / 1000:,.0f}k")
+
+
+def _pagina_escenarios(fig, datos):
+    df = datos["escenarios"]
+    _tabla(fig, 0.06, 0.89, 0.88, df, "Escenarios de precio de venta", {
+        "Variación Precio Venta (%)": lambda v: f"{v:+.0f}%",
+        "Precio de Venta (€)": lambda v: f"{v:,.0f}",
+        "ROI (%)": lambda v: f"{v:.2f}",
+        "TIR (%)": formatear_tir,
+        "XIRR mensual (%)": formatear_tir,
+    })
+    ax = fig.add_axes([0.1, 0.1, 0.8, 0.38])
+    for columna, color in [("ROI (%)", AZUL_ADCO), ("TIR (%)", "green"), ("XIRR mensual (%)", "orange")]:
+        ax.plot(df["Variación Precio Venta (%)"], df[columna], marker="o", color=color, label=columna)
+    ax.axhline(ROI_SUGERIDO, color="gray", linestyle="--", linewidth=0.8)
+    ax.set_xlabel("Variación del precio de venta (%)")
+    ax.set_title("Rentabilidad según el precio de venta")
+    ax.legend()
+
+
+def _pagina_flujo(fig, datos):
+    flujos = datos["flujos"]
+    ax = fig.add_axes([0.1, 0.66, 0.8, 0.22])
+    ax.bar(flujos["Mes"], flujos["Flujo inversor (€)"], color=np.where(flujos["Flujo inversor (€)"] >= 0, "green", "gray"))
+    ax.plot(flujos["Mes"], flujos["Acumulado (€)"], color=AZUL_ADCO, marker=".", label="Acumulado")
+    ax.set_title("Flujo de caja mensual del inversor")
+    ax.set_xlabel("Mes")
+    ax.yaxis.set_major_formatter(lambda v, _: f"{v / 1000:,.0f}k")
+    ax.legend()
+    columnas = ["Mes", "Fecha", "Compra y reforma (€)", "Intereses (€)", "Tenencia (€)", "Venta neta (€)",
+                "Flujo inversor (€)", "Acumulado (€)"]
+    euros = lambda v: f"{v:,.0f}"
+    _tabla(fig, 0.06, 0.6, 0.88, flujos[columnas].head(MAX_FILAS_FLUJO), None,
+           {c: euros for c in columnas[2:]}, tamano=6)
+
+
+def _pagina_comparables(fig, datos):
+    comparables = datos["comparables"].head(MAX_FILAS_COMPARABLES).copy()
+    if "Título" in comparables:
+        comparables["Título"] = comparables["Título"].astype(str).str.slice(0, 45)
+    _tabla(fig, 0.06, 0.89, 0.88, comparables, "Comparables de la zona", {
+        "Precio (€)": lambda v: f"{v:,.0f}",
+        "Superficie (m²)": lambda v: f"{v:,.0f}",
+        "€/m²": lambda v: f"{v:,.0f}",
+    }, tamano=6)
+
+
+# Páginas de la plantilla en orden; las de comparables se omiten si no hay datos
+PLANTILLA = {
+    "resumen": _pagina_resumen,
+    "escenarios": _pagina_escenarios,
+    "flujo": _pagina_flujo,
+    "comparables": _pagina_comparables,
+}
+
+
+@medido("informe.pdf")
+def generar_pdf(datos, destino=None, paginas=tuple(PLANTILLA)):
+    """Informe PDF en destino (ruta o fichero abierto); sin destino devuelve los bytes."""
+    from matplotlib import rc_context
+    from matplotlib.backends.backend_pdf import PdfPages
+
+    salida = destino if destino is not None else io.BytesIO()
+    if datos["comparables"] is None or datos["comparables"].empty:
+        paginas = [p for p in paginas if p != "comparables"]
+    with rc_context(recursos()["estilo"]), PdfPages(salida, metadata={
+        "Title": _texto(datos["titulo"]), "Author": "ADCO Investments",
+    }) as pdf:
+        for numero, pagina in enumerate(paginas, start=1):
+            fig = _nueva_pagina(datos, numero)
+            PLANTILLA[pagina](fig, datos)
+            pdf.savefig(fig)
+    return salida.getvalue() if destino is None else destino
+
+
+# --- EXCEL ---
+
+@medido("informe.xlsx")
+def generar_xlsx(datos, destino=None):
+    """Informe Excel (una hoja por tabla) en destino; sin destino devuelve los bytes. Necesita openpyxl."""
+    try:
+        from openpyxl.styles import Font
+    except ImportError as error:
+        raise ImportError("La exportación a Excel necesita openpyxl: pip install openpyxl") from error
+
+    salida = destino if destino is not None else io.BytesIO()
+    hojas = {
+        "Resumen": pd.concat([
+            pd.DataFrame({"Concepto": list(datos["metricas"]), "Valor": list(datos["metricas"].values())}),
+            datos["resumen"],
+        ], ignore_index=True),
+        "Escenarios": datos["escenarios"].round(2),
+        "Flujo mensual": datos["flujos"].round(2),
+    }
+    if datos["comparables"] is not None and not datos["comparables"].empty:
+        hojas["Comparables"] = datos["comparables"]
+    with pd.ExcelWriter(salida, engine="openpyxl") as writer:
+        for nombre, df in hojas.items():
+            df.to_excel(writer, sheet_name=nombre, index=False, startrow=2)
+            hoja = writer.sheets[nombre]
+            hoja["A1"] = f"{datos['titulo']} – {nombre} ({datos['fecha']:%d/%m/%Y})"
+            hoja["A1"].font = Font(bold=True, size=13)
+            hoja.freeze_panes = "A4"
+            for i, columna in enumerate(df.columns, start=1):
+                ancho = max(len(str(columna)), *(len(str(v)) for v in df[columna].head(200))) if len(df) else len(str(columna))
+                hoja.column_dimensions[hoja.cell(row=3, column=i).column_letter].width = min(ancho + 2, 60)
+    return salida.getvalue() if destino is None else destino
+
+
+GENERADORES = {"pdf": generar_pdf, "xlsx": generar_xlsx}
+
+
+# --- LOTES ---
+
+def nombre_fichero(numero, nombre):
+    """Nombre de fichero seguro y ordenado para el informe `numero`."""
+    ascii_ = unicodedata.normalize("NFKD", str(nombre)).encode("ascii", "ignore").decode()
+    return f"{numero:04d}_{re.sub(r'[^A-Za-z0-9]+', '_', ascii_).strip('_')[:60] or 'operacion'}"
+
+
+def _generar_uno(tarea):
+    numero, nombre, operacion, comparables, carpeta, formatos, fecha_compra = tarea
+    inicio = time.perf_counter()
+    datos = datos_informe(operacion, nombre, fecha_compra, comparables)
+    base = os.path.join(carpeta, nombre_fichero(numero, nombre))
+    rutas = []
+    for formato in formatos:
+        GENERADORES[formato](datos, f"{base}.{formato}")
+        rutas.append(f"{base}.{formato}")
+    return {"nombre": nombre, "ficheros": rutas, "ms": (time.perf_counter() - inicio) * 1000}
+
+
+@medido("informe.lote", filas=len)
+def generar_lote(operaciones, carpeta, formatos=("pdf",), procesos=None, comparables=None, fecha_compra=None):
+    """
+    Un informe por fila de `operaciones` (columna "nombre" opcional) en `carpeta`, repartidos
+    entre procesos. comparables: DataFrame común o lista con uno por operación (o None).
+    Devuelve un DataFrame con los ficheros generados y el tiempo de cada informe.
+    """
+    os.makedirs(carpeta, exist_ok=True)
+    operaciones = operaciones.reset_index(drop=True)
+    nombres = operaciones["nombre"] if "nombre" in operaciones else [f"Operación {i + 1}" for i in range(len(operaciones))]
+    if comparables is None or isinstance(comparables, pd.DataFrame):
+        comparables = [comparables] * len(operaciones)
+    tareas = [
+        (i + 1, nombre, operaciones.iloc[[i]], comparables[i], carpeta, tuple(formatos), fecha_compra)
+        for i, nombre in enumerate(nombres)
+    ]
+    procesos = min(procesos or os.cpu_count() or 1, len(tareas))
+    if procesos <= 1:
+        return pd.DataFrame([_generar_uno(t) for t in tareas])
+    # Cada proceso carga el logo y la fuente una sola vez y recibe los informes en bloques
+    with ProcessPoolExecutor(max_workers=procesos, initializer=recursos) as pool:
+        return pd.DataFrame(list(pool.map(_generar_uno, tareas, chunksize=max(1, len(tareas) // (procesos * 4)))))
+
+
+def comparables_por_operacion(anuncios, operaciones, n=MAX_FILAS_COMPARABLES):
+    """Para cada operación, los anuncios de su subzona (o zona) de superficie más parecida."""
+    from almacen_comparables import COLUMNAS
+
+    anuncios = anuncios.rename(columns=COLUMNAS)
+    grupos = dict(list(anuncios.groupby(anuncios["Subzona"].fillna(anuncios["Zona"]))))
+    resultado = []
+    for _, op in operaciones.iterrows():
+        clave = op.get("subzona") if pd.notna(op.get("subzona")) else op.get("zona")
+        grupo = grupos.get(clave)
+        if grupo is None:
+            resultado.append(None)
+            continue
+        distancia = (grupo["Superficie (m²)"] - op["superficie"]).abs()
+        resultado.append(grupo.loc[distancia.nsmallest(n).index, COLUMNAS_COMPARABLES])
+    return resultado
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Informes de inversión en PDF y Excel por lotes (ADCO)")
+    origen = parser.add_mutually_exclusive_group(required=True)
+    origen.add_argument("--entrada", help="CSV o Parquet con una operación por fila (columna nombre opcional)")
+    origen.add_argument("--almacen", help="Almacén SQLite: informes de las mejores oportunidades del cribado")
+    parser.add_argument("--zona", help="Filtro de zona en el almacén")
+    parser.add_argument("--top", type=int, default=100, help="Oportunidades del cribado a documentar")
+    parser.add_argument("--salida", default="informes", help="Carpeta de los informes")
+    parser.add_argument("--formatos", nargs="+", default=["pdf"], choices=sorted(GENERADORES))
+    parser.add_argument("--procesos", type=int, default=None, help="Procesos (por defecto, todos los núcleos)")
+    parser.add_argument("--fecha-compra", default=None, help="Fecha de compra del flujo mensual (AAAA-MM-DD)")
+    args = parser.parse_args(argv)
+
+    inicio = time.perf_counter()
+    comparables = None
+    if args.almacen:
+        from almacen_comparables import COLUMNAS, AlmacenComparables
+        from cartera_operaciones import desde_ranking
+        from cribado_operaciones import SUPUESTOS, cribar
+        from indice_mercado import IndiceMercado
+
+        almacen = AlmacenComparables(args.almacen)
+        anuncios = almacen.consultar(zona=args.zona, columnas=[
+            "id_anuncio", "zona", "subzona", "titulo", "precio", "superficie", "eur_m2", "estado", "link"
+        ]).rename(columns={v: k for k, v in COLUMNAS.items()})
+        tabla = IndiceMercado(almacen).tabla()
+        ranking = cribar(anuncios, indice=tabla if not tabla.empty else None).head(args.top)
+        operaciones = desde_ranking(ranking, SUPUESTOS).assign(subzona=ranking["Subzona"].to_numpy())
+        comparables = comparables_por_operacion(anuncios, operaciones)
+    else:
+        operaciones = pd.read_parquet(args.entrada) if args.entrada.endswith(".parquet") else pd.read_csv(args.entrada)
+
+    informes = generar_lote(operaciones, args.salida, args.formatos, args.procesos, comparables, args.fecha_compra)
+    print(f"{len(informes):,} informes ({', '.join(args.formatos)}) en {time.perf_counter() - inicio:.1f} s "
+          f"(mediana {informes['ms'].median():.0f} ms por informe) -> {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
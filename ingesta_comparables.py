@@ -0,0 +1,192 @@
+# ADCO - Ingesta por bloques de exportaciones grandes de comparables
+# Lee CSV o Parquet de millones de filas en bloques, convierte los números de cada bloque
+# (los valores ilegibles se rechazan fila a fila, no abortan la carga), normaliza cada bloque,
+# lo guarda en el almacén y va acumulando las estadísticas de €/m² por subzona, de modo que
+# la memoria no depende del tamaño del fichero.
+#
+# Uso:
+#   python ingesta_comparables.py exportacion_madrid.csv --zona Chamberí
+#   python ingesta_comparables.py exportacion.parquet --bloque 200000 --sin-almacen
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from almacen_comparables import AlmacenComparables, normalizar_comparables
+from parser_anuncios import EUR_M2_MAXIMO, EUR_M2_MINIMO
+
+TAMANO_BLOQUE = 100_000
+
+# Columnas numéricas: se leen como texto y se convierten en cada bloque, porque un precio
+# formateado ("1.250.000 €") puede aparecer en cualquier fila del fichero, no solo al principio
+COLUMNAS_NUMERICAS = ["Precio (€)", "Superficie (m²)", "€/m²"]
+COLUMNAS_TEXTO_LARGO = ["Descripción"]
+
+# Histograma logarítmico de €/m² para cuantiles aproximados (≈0,5 % de resolución)
+BORDES_EUR_M2 = np.geomspace(EUR_M2_MINIMO, EUR_M2_MAXIMO, 741)
+
+
+def _columnas_csv(fuente):
+    """Cabecera del CSV (sin leer datos)."""
+    columnas = list(pd.read_csv(fuente, nrows=0).columns)
+    if hasattr(fuente, "seek"):
+        fuente.seek(0)
+    return columnas
+
+
+def _convertir_numeros(bloque):
+    """
+    Columnas numéricas del bloque a float64 si todo su texto es numérico; si no, los valores
+    numéricos ya convertidos y el resto como texto para que normalizar_comparables los
+    interprete o los rechace fila a fila.
+    """
+    for columna in COLUMNAS_NUMERICAS:
+        if columna not in bloque.columns or pd.api.types.is_numeric_dtype(bloque[columna]):
+            continue
+        convertida = pd.to_numeric(bloque[columna], errors="coerce")
+        if convertida.notna().sum() == bloque[columna].notna().sum():
+            bloque[columna] = convertida
+        else:
+            bloque[columna] = convertida.astype(object).where(convertida.notna(), bloque[columna])
+    return bloque
+
+
+def leer_por_bloques(fuente, tamano_bloque=TAMANO_BLOQUE, formato=None, descartar=()):
+    """
+    Generador de DataFrames de como máximo tamano_bloque filas de un CSV o Parquet
+    (ruta o fichero abierto). Las columnas de `descartar` no llegan a leerse.
+    """
+    nombre = fuente if isinstance(fuente, str) else getattr(fuente, "name", "")
+    formato = formato or ("parquet" if str(nombre).endswith(".parquet") else "csv")
+    if formato == "parquet":
+        import pyarrow.parquet as pq
+
+        fichero = pq.ParquetFile(fuente)
+        columnas = [c for c in fichero.schema_arrow.names if c not in descartar]
+        for lote in fichero.iter_batches(batch_size=tamano_bloque, columns=columnas):
+            yield _convertir_numeros(lote.to_pandas())
+        return
+
+    columnas = [c for c in _columnas_csv(fuente) if c not in descartar]
+    for bloque in pd.read_csv(fuente, chunksize=tamano_bloque, usecols=columnas, dtype=object):
+        yield _convertir_numeros(bloque)
+
+
+class AgregadoIncremental:
+    """
+    Estadísticas de €/m² por (zona, subzona) que se actualizan bloque a bloque:
+    recuento, media, desviación, mínimo, máximo e histograma para la mediana y P10/P90.
+    """
+
+    def __init__(self):
+        self._grupos = {}
+
+    def anadir(self, df):
+        """Suma un bloque en el esquema del almacén (zona, subzona, eur_m2)."""
+        df = df.dropna(subset=["eur_m2"])
+        if df.empty:
+            return
+        claves = df[["zona", "subzona"]].fillna("").astype(str)
+        for (zona, subzona), valores in df["eur_m2"].groupby([claves["zona"], claves["subzona"]]):
+            v = valores.to_numpy(dtype=float)
+            grupo = self._grupos.setdefault((zona, subzona), {
+                "n": 0, "suma": 0.0, "suma2": 0.0, "minimo": np.inf, "maximo": -np.inf,
+                "histograma": np.zeros(len(BORDES_EUR_M2) + 1, dtype=np.int64),
+            })
+            grupo["n"] += len(v)
+            grupo["suma"] += v.sum()
+            grupo["suma2"] += (v ** 2).sum()
+            grupo["minimo"] = min(grupo["minimo"], v.min())
+            grupo["maximo"] = max(grupo["maximo"], v.max())
+            grupo["histograma"] += np.bincount(np.searchsorted(BORDES_EUR_M2, v), minlength=len(BORDES_EUR_M2) + 1)
+
+    @staticmethod
+    def _cuantil(histograma, q):
+        acumulado = np.cumsum(histograma)
+        i = int(np.searchsorted(acumulado, q * acumulado[-1]))
+        # Centro geométrico del intervalo del histograma
+        bajo = BORDES_EUR_M2[max(i - 1, 0)]
+        alto = BORDES_EUR_M2[min(i, len(BORDES_EUR_M2) - 1)]
+        return float(np.sqrt(bajo * alto))
+
+    def resultado(self):
+        """DataFrame con una fila por (zona, subzona)."""
+        filas = []
+        for (zona, subzona), g in sorted(self._grupos.items()):
+            media = g["suma"] / g["n"]
+            filas.append({
+                "zona": zona,
+                "subzona": subzona,
+                "n": g["n"],
+                "media": media,
+                "desviacion": float(np.sqrt(max(g["suma2"] / g["n"] - media ** 2, 0.0))),
+                "minimo": g["minimo"],
+                "p10": self._cuantil(g["histograma"], 0.10),
+                "mediana": self._cuantil(g["histograma"], 0.50),
+                "p90": self._cuantil(g["histograma"], 0.90),
+                "maximo": g["maximo"],
+            })
+        return pd.DataFrame(filas)
+
+
+def ingerir(fuente, almacen=None, zona=None, tamano_bloque=TAMANO_BLOQUE, formato=None,
+            guardar=True, sin_descripcion=False, progreso=None):
+    """
+    Ingiere una exportación bloque a bloque: normaliza, guarda en el almacén (si guardar)
+    y acumula las estadísticas. Con sin_descripcion no se lee el texto largo de los anuncios
+    (el estado y la superficie se deducen solo del título). progreso(filas_leidas) se llama
+    tras cada bloque.
+    Devuelve (estadisticas, resumen) con los totales de filas, nuevos, rechazados...
+    """
+    almacen = almacen or (AlmacenComparables() if guardar else None)
+    agregado = AgregadoIncremental()
+    resumen = {"filas": 0, "validas": 0, "rechazados": 0, "nuevos": 0, "cambios_precio": 0, "bloques": 0}
+    inicio = time.perf_counter()
+
+    descartar = COLUMNAS_TEXTO_LARGO if sin_descripcion else ()
+    for bloque in leer_por_bloques(fuente, tamano_bloque, formato, descartar):
+        datos, rechazados = normalizar_comparables(bloque, zona=zona)
+        agregado.anadir(datos)
+        if guardar and not datos.empty:
+            cambios = almacen.actualizar(datos)
+            resumen["nuevos"] += cambios["nuevos"]
+            resumen["cambios_precio"] += cambios["cambios_precio"]
+        resumen["filas"] += len(bloque)
+        resumen["validas"] += len(datos)
+        resumen["rechazados"] += len(rechazados)
+        resumen["bloques"] += 1
+        if progreso is not None:
+            progreso(resumen["filas"])
+
+    resumen["segundos"] = time.perf_counter() - inicio
+    return agregado.resultado(), resumen
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingesta por bloques de comparables (ADCO)")
+    parser.add_argument("entrada", help="CSV o Parquet de comparables")
+    parser.add_argument("--zona", help="Zona de los anuncios si el fichero no la incluye")
+    parser.add_argument("--almacen", help="Almacén SQLite de destino (por defecto el de la app)")
+    parser.add_argument("--bloque", type=int, default=TAMANO_BLOQUE, help="Filas por bloque")
+    parser.add_argument("--sin-almacen", action="store_true", help="Solo calcular estadísticas, sin guardar")
+    parser.add_argument("--sin-descripcion", action="store_true", help="No leer ni guardar el texto de los anuncios")
+    parser.add_argument("--estadisticas", help="Guardar las estadísticas por subzona en este CSV")
+    args = parser.parse_args(argv)
+
+    almacen = None if args.sin_almacen else AlmacenComparables(args.almacen)
+    estadisticas, resumen = ingerir(
+        args.entrada, almacen, zona=args.zona, tamano_bloque=args.bloque, guardar=not args.sin_almacen,
+        sin_descripcion=args.sin_descripcion,
+        progreso=lambda filas: print(f"\r{filas:,} filas leídas", end="", flush=True),
+    )
+    print(f"\n{resumen['validas']:,} válidas, {resumen['rechazados']:,} rechazadas, "
+          f"{resumen['nuevos']:,} nuevas en el almacén ({resumen['segundos']:.1f} s)")
+    print(estadisticas.round(0).to_string(index=False))
+    if args.estadisticas:
+        estadisticas.to_csv(args.estadisticas, index=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+# ADCO - Instrumentación de rendimiento
+# Tramos cronometrados (context manager o decorador) y contadores alrededor de los puntos
+# calientes: peticiones a ScraperAPI, parseo, conversiones de DataFrames, TIR, gráficos...
+# Se acumulan por proceso (para exportar a un registro JSON por línea o a un fichero de
+# texto de Prometheus) y por rerun de Streamlit (para el panel de rendimiento).
+# Coste: unos microsegundos por tramo.
+#
+# Configuración por entorno:
+#   ADCO_METRICAS_PROMETHEUS=/var/lib/node_exporter/textfile/adco.prom
+#   ADCO_REGISTRO_RENDIMIENTO=datos_adco/rendimiento.jsonl
+
+import atexit
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import pandas as pd
+
+RUTA_PROMETHEUS = os.environ.get("ADCO_METRICAS_PROMETHEUS")
+RUTA_REGISTRO = os.environ.get("ADCO_REGISTRO_RENDIMIENTO")
+INTERVALO_EXPORTACION = 10.0  # segundos entre escrituras del fichero de Prometheus
+PREFIJO = "adco"
+
+registro = logging.getLogger("adco.rendimiento")
+
+
+class Metricas:
+    """Acumulado de tramos (llamadas, segundos, máximo y filas) y de contadores."""
+
+    def __init__(self):
+        self.tramos = {}
+        self.contadores = {}
+        self.inicio = time.time()
+        self._lock = threading.Lock()
+
+    def anadir_tramo(self, nombre, segundos, filas=None):
+        with self._lock:
+            tramo = self.tramos.get(nombre)
+            if tramo is None:
+                tramo = self.tramos[nombre] = {"llamadas": 0, "segundos": 0.0, "maximo": 0.0, "filas": 0}
+            tramo["llamadas"] += 1
+            tramo["segundos"] += segundos
+            tramo["maximo"] = max(tramo["maximo"], segundos)
+            if filas is not None:
+                tramo["filas"] += int(filas)
+
+    def contar(self, nombre, valor=1):
+        with self._lock:
+            self.contadores[nombre] = self.contadores.get(nombre, 0) + valor
+
+    def tabla_tramos(self):
+        """Tramos ordenados por tiempo total, con milisegundos y filas por segundo."""
+        with self._lock:
+            filas = [{"tramo": nombre, **valores} for nombre, valores in self.tramos.items()]
+        df = pd.DataFrame(filas, columns=["tramo", "llamadas", "segundos", "maximo", "filas"])
+        df["total_ms"] = df["segundos"] * 1000
+        df["medio_ms"] = df["total_ms"] / df["llamadas"]
+        df["maximo_ms"] = df["maximo"] * 1000
+        df["filas_por_s"] = (df["filas"] / df["segundos"]).where(df["filas"] > 0)
+        return df.sort_values("total_ms", ascending=False)[
+            ["tramo", "llamadas", "total_ms", "medio_ms", "maximo_ms", "filas", "filas_por_s"]
+        ].reset_index(drop=True)
+
+    def tasas_cache(self):
+        """
+        Aciertos de cada caché a partir de los contadores "<caché>.llamadas" y "<caché>.fallos"
+        (o "<caché>.aciertos" y "<caché>.fallos").
+        """
+        with self._lock:
+            contadores = dict(self.contadores)
+        caches = {nombre.rsplit(".", 1)[0] for nombre in contadores
+                  if nombre.endswith((".llamadas", ".aciertos", ".fallos"))}
+        filas = []
+        for cache in sorted(caches):
+            fallos = contadores.get(f"{cache}.fallos", 0)
+            llamadas = contadores.get(f"{cache}.llamadas", fallos + contadores.get(f"{cache}.aciertos", 0))
+            filas.append({"cache": cache, "llamadas": llamadas, "aciertos": llamadas - fallos,
+                          "tasa_acierto": (llamadas - fallos) / llamadas if llamadas else None})
+        return pd.DataFrame(filas, columns=["cache", "llamadas", "aciertos", "tasa_acierto"])
+
+
+# Métricas de todo el proceso (exportación) y del rerun en curso (panel)
+PROCESO = Metricas()
+_captura = ContextVar("captura_rendimiento", default=None)
+_ultima_exportacion = [0.0]
+
+
+def iniciar_captura():
+    """Empieza a acumular aparte los tramos de este rerun (o de este hilo) y devuelve sus Metricas."""
+    metricas = Metricas()
+    _captura.set(metricas)
+    return metricas
+
+
+def captura_actual():
+    return _captura.get()
+
+
+def _registrar(nombre, segundos, filas):
+    PROCESO.anadir_tramo(nombre, segundos, filas)
+    captura = _captura.get()
+    if captura is not None:
+        captura.anadir_tramo(nombre, segundos, filas)
+    if registro.isEnabledFor(logging.INFO):
+        registro.info(json.dumps({"ts": round(time.time(), 3), "pid": os.getpid(), "tramo": nombre,
+                                  "ms": round(segundos * 1000, 3), "filas": filas}))
+    if RUTA_PROMETHEUS and time.monotonic() - _ultima_exportacion[0] > INTERVALO_EXPORTACION:
+        _ultima_exportacion[0] = time.monotonic()
+        exportar_prometheus(RUTA_PROMETHEUS)
+
+
+@contextmanager
+def tramo(nombre, filas=None):
+    """
+    Cronometra un bloque. El dict que devuelve admite "filas" para registrar cuántas
+    filas se procesaron: `with tramo("parser.pagina") as t: ...; t["filas"] = len(df)`.
+    """
+    datos = {"filas": filas}
+    inicio = time.perf_counter()
+    try:
+        yield datos
+    finally:
+        _registrar(nombre, time.perf_counter() - inicio, datos["filas"])
+
+
+def medido(nombre, filas=None):
+    """Decorador: cronometra cada llamada; filas(resultado) da las filas procesadas."""
+    def decorar(funcion):
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            inicio = time.perf_counter()
+            resultado = funcion(*args, **kwargs)
+            _registrar(nombre, time.perf_counter() - inicio, filas(resultado) if filas is not None else None)
+            return resultado
+        return envoltura
+    return decorar
+
+
+def contar(nombre, valor=1):
+    """Suma valor al contador (p. ej. "cache_scraping.aciertos")."""
+    PROCESO.contar(nombre, valor)
+    captura = _captura.get()
+    if captura is not None:
+        captura.contar(nombre, valor)
+
+
+# --- EXPORTACIÓN ---
+
+def _etiqueta(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"')
+
+
+def texto_prometheus(metricas=None):
+    """Métricas en el formato de texto de Prometheus."""
+    metricas = metricas or PROCESO
+    with metricas._lock:
+        tramos = {nombre: dict(valores) for nombre, valores in metricas.tramos.items()}
+        contadores = dict(metricas.contadores)
+    lineas = []
+    series = [
+        ("tramo_segundos_total", "counter", "Tiempo acumulado por tramo", "segundos"),
+        ("tramo_llamadas_total", "counter", "Llamadas por tramo", "llamadas"),
+        ("tramo_filas_total", "counter", "Filas procesadas por tramo", "filas"),
+        ("tramo_segundos_maximo", "gauge", "Duración máxima de una llamada", "maximo"),
+    ]
+    for serie, tipo, ayuda, clave in series:
+        lineas += [f"# HELP {PREFIJO}_{serie} {ayuda}", f"# TYPE {PREFIJO}_{serie} {tipo}"]
+        lineas += [f'{PREFIJO}_{serie}{{tramo="{_etiqueta(nombre)}"}} {valores[clave]}'
+                   for nombre, valores in sorted(tramos.items())]
+    lineas += [f"# HELP {PREFIJO}_contador_total Contadores de eventos", f"# TYPE {PREFIJO}_contador_total counter"]
+    lineas += [f'{PREFIJO}_contador_total{{nombre="{_etiqueta(nombre)}"}} {valor}'
+               for nombre, valor in sorted(contadores.items())]
+    lineas.append(f"# HELP {PREFIJO}_inicio_segundos Arranque del proceso")
+    lineas.append(f"# TYPE {PREFIJO}_inicio_segundos gauge")
+    lineas.append(f'{PREFIJO}_inicio_segundos{{pid="{os.getpid()}"}} {metricas.inicio}')
+    return "\n".join(lineas) + "\n"
+
+
+def exportar_prometheus(ruta, metricas=None):
+    """Escribe las métricas para el textfile collector de node_exporter (reemplazo atómico)."""
+    os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        f.write(texto_prometheus(metricas))
+    os.replace(temporal, ruta)
+
+
+def configurar_registro(ruta):
+    """Añade un registro estructurado (una línea JSON por tramo) en `ruta`."""
+    os.makedirs(os.path.dirname(ruta) or ".", exist_ok=True)
+    manejador = logging.FileHandler(ruta, encoding="utf-8")
+    manejador.setFormatter(logging.Formatter("%(message)s"))
+    registro.addHandler(manejador)
+    registro.setLevel(logging.INFO)
+    registro.propagate = False
+
+
+if RUTA_REGISTRO:
+    configurar_registro(RUTA_REGISTRO)
+if RUTA_PROMETHEUS:
+    atexit.register(lambda: exportar_prometheus(RUTA_PROMETHEUS))
+
+
+# --- PANEL DE STREAMLIT ---
+
+def mostrar_panel(metricas=None, titulo="⚙️ Rendimiento"):
+    """Panel con la latencia por tramo, las filas procesadas y la tasa de acierto de las cachés."""
+    import streamlit as st
+
+    metricas = metricas or captura_actual() or PROCESO
+    with st.expander(titulo, expanded=True):
+        tramos = metricas.tabla_tramos()
+        if tramos.empty:
+            st.caption("Sin tramos medidos en este rerun (todo servido desde caché).")
+        else:
+            st.dataframe(tramos.round({"total_ms": 1, "medio_ms": 2, "maximo_ms": 1, "filas_por_s": 0}),
+                         hide_index=True)
+        caches = metricas.tasas_cache()
+        if not caches.empty:
+            st.dataframe(caches, column_config={"tasa_acierto": st.column_config.ProgressColumn(
+                "tasa_acierto", min_value=0, max_value=1, format="percent")}, hide_index=True)
@@ -2,6 +2,11 @@
 import streamlit as st
 import pandas as pd
 
+from indice_mercado import IndiceMercado
+from instrumentacion import iniciar_captura, mostrar_panel, tramo
+
+captura = iniciar_captura()
+
 st.set_page_config(page_title="Módulo de Mercado - ADCO", layout="centered")
 
 st.title("Inteligencia de Mercado - Flipping ADCO")
@@ -16,7 +21,7 @@ zonas_m30 = [
 
 zona_seleccionada = st.selectbox("Selecciona una zona", zonas_m30)
 
-# Simulación de base de datos de precios por zona (ejemplo estático)
+# Precios de respaldo por zona cuando el índice aún no tiene datos
 precios_m2 = {
     "Chamberí": 5280,
     "Salamanca": 6830,
@@ -50,8 +55,19 @@ comparables = {
     ]
 }
 
-precio_zona = precios_m2.get(zona_seleccionada, None)
-comparables_zona = comparables.get(zona_seleccionada, [])
+# Índice precalculado a partir del almacén de comparables (consulta directa, sin reagregar)
+indice = IndiceMercado()
+with tramo("indice.obtener"):
+    stats_zona = indice.obtener(zona_seleccionada)
+precio_zona = stats_zona["mediana"] if stats_zona else precios_m2.get(zona_seleccionada, None)
+
+comparables_zona = indice.almacen.consultar(zona=zona_seleccionada, columnas=[
+    "subzona", "titulo", "precio", "superficie", "eur_m2", "estado"
+])
+if comparables_zona.empty:
+    comparables_zona = pd.DataFrame(comparables.get(zona_seleccionada, []))
+    if not comparables_zona.empty:
+        comparables_zona["€/m²"] = comparables_zona["Precio"] / comparables_zona["Superficie"]
 
 st.markdown("---")
 st.subheader("Resultado del análisis")
@@ -59,15 +75,40 @@ st.subheader("Resultado del análisis")
 if precio_zona:
     st.markdown(f"**Precio medio por m² en {zona_seleccionada}:** €{precio_zona:,.2f}/m²")
 
-    if comparables_zona:
-        df = pd.DataFrame(comparables_zona)
-        df["€/m²"] = df["Precio"] / df["Superficie"]
+    if stats_zona:
+        col1, col2, col3 = st.columns(3)
+        col1.metric("Media recortada €/m²", f"{stats_zona['media_recortada']:,.0f} €")
+        col2.metric("Reformado €/m²", f"{stats_zona['eur_m2_reformado']:,.0f} €")
+        col3.metric("A reformar €/m²", f"{stats_zona['eur_m2_a_reformar']:,.0f} €")
+        st.caption(
+            f"{stats_zona['n']} anuncios · P25 {stats_zona['p25']:,.0f} € · P75 {stats_zona['p75']:,.0f} € · "
+            f"actualizado {stats_zona['actualizado']}"
+        )
+        if stats_zona.get("mad") is not None:
+            st.caption(
+                f"MAD {stats_zona['mad']:,.0f} € · {stats_zona['n_atipicos']} atípicos fuera de "
+                f"[{stats_zona['limite_inferior']:,.0f}, {stats_zona['limite_superior']:,.0f}] €/m²"
+            )
+        df_subzonas = indice.tabla(zona_seleccionada)
+        df_subzonas = df_subzonas[df_subzonas["subzona"] != ""][
+            ["subzona", "n", "mediana", "media_recortada", "p25", "p75", "n_atipicos", "eur_m2_reformado", "eur_m2_a_reformar"]
+        ]
+        st.markdown("**Por subzona:**")
+        st.dataframe(df_subzonas.round(0), hide_index=True)
+
+    if not comparables_zona.empty:
         st.markdown("**Comparables activos:**")
-        st.dataframe(df)
+        st.dataframe(comparables_zona)
     else:
-        st.info("No hay comparables simulados para esta zona todavía.")
+        st.info("No hay comparables para esta zona todavía.")
 else:
     st.warning("No se encontró información para esta zona.")
 
 st.markdown("---")
-st.caption("Datos simulados - versión de desarrollo para scraping Idealista")
+st.caption(
+    "Datos del almacén de comparables" if stats_zona
+    else "Datos simulados - versión de desarrollo para scraping Idealista"
+)
+
+if st.sidebar.checkbox("⚙️ Panel de rendimiento"):
+    mostrar_panel(captura)
@@ -0,0 +1,219 @@
+# ADCO - Motor financiero de operaciones de flipping
+# Cálculos vectorizados (sin Streamlit) para evaluar una o miles de operaciones a la vez.
+
+import numpy as np
+import pandas as pd
+
+from calculo_tir import tir_flujo_simple
+from instrumentacion import medido
+
+# Campos de entrada de una operación (mismos que la barra lateral del simulador)
+VALORES_POR_DEFECTO = {
+    "superficie": 150.0,
+    "superficie_reforma": 130.0,
+    "coste_reforma_m2": 1600.0,
+    "costes_adicionales": 5000.0,
+    "iva_reforma": 10.0,
+    "precio_compra": 100000.0,
+    "comision_compra": 0.0,
+    "gastos_legales": 3000.0,
+    "gastos_administrativos": 3000.0,
+    "itp": 2.0,
+    "ibi": 1000.0,
+    "precio_venta": 1750000.0,
+    "comision_venta": 3.0,
+    "porcentaje_prestamo": 0.0,
+    "interes_prestamo": 0.0,
+    "plazo_anios": 1,
+}
+
+CAMPOS_ENTRADA = list(VALORES_POR_DEFECTO.keys())
+
+# Parte de la ganancia que queda tras impuestos en el resumen ejecutivo
+FACTOR_GANANCIA_NETA = 0.75
+
+# ROI objetivo del precio de venta sugerido (%)
+ROI_SUGERIDO = 20.0
+
+
+def preparar_operaciones(operaciones):
+    """Normaliza la entrada (DataFrame, dict o lista de dicts) a un DataFrame con todos los campos."""
+    if isinstance(operaciones, pd.DataFrame):
+        df = operaciones.copy()
+    elif isinstance(operaciones, dict):
+        df = pd.DataFrame({k: np.atleast_1d(v) for k, v in operaciones.items()})
+    else:
+        df = pd.DataFrame(list(operaciones))
+
+    for campo, valor in VALORES_POR_DEFECTO.items():
+        if campo not in df.columns:
+            df[campo] = valor
+        else:
+            df[campo] = df[campo].fillna(valor)
+    df[CAMPOS_ENTRADA] = df[CAMPOS_ENTRADA].astype(float)
+    df["plazo_anios"] = df["plazo_anios"].clip(lower=1).round()
+    return df
+
+
+def interpretar_roi(roi):
+    """Devuelve la interpretación del resumen ejecutivo para cada ROI."""
+    roi = np.asarray(roi, dtype=float)
+    return np.select(
+        [roi < 10, roi <= 20],
+        ["⚠️ Rentabilidad baja", "✅ Rentabilidad aceptable"],
+        default="🚀 Rentabilidad excelente",
+    )
+
+
+@medido("motor.calcular", filas=lambda r: np.size(r["roi"]))
+def calcular(c):
+    """
+    Núcleo del cálculo sobre arrays NumPy (un valor por operación) sin pasar por pandas.
+
+    Recibe un dict con los CAMPOS_ENTRADA y devuelve un dict de arrays. La tenencia
+    (años hasta la venta) es plazo_anios salvo que se indique anios_tenencia; los
+    intereses se pagan por todo el plazo del préstamo y, si la venta se retrasa,
+    también por el tiempo adicional.
+    """
+    plazo = c["plazo_anios"]
+    tenencia = c.get("anios_tenencia", plazo)
+
+    coste_reforma = c["superficie_reforma"] * c["coste_reforma_m2"] + c["costes_adicionales"]
+    coste_reforma_iva = coste_reforma * (1 + c["iva_reforma"] / 100)
+    comision_compra_eur = c["precio_compra"] * c["comision_compra"] / 100
+    itp_eur = c["precio_compra"] * c["itp"] / 100
+    gastos_total_compra = (
+        c["precio_compra"] + comision_compra_eur + itp_eur +
+        c["gastos_legales"] + c["gastos_administrativos"] + c["ibi"]
+    )
+    inversion_total = gastos_total_compra + coste_reforma_iva
+    comision_venta_eur = c["precio_venta"] * c["comision_venta"] / 100
+
+    monto_prestamo = inversion_total * c["porcentaje_prestamo"] / 100
+    intereses_totales = monto_prestamo * c["interes_prestamo"] / 100 * np.maximum(plazo, tenencia)
+    capital_propio = inversion_total - monto_prestamo
+    devolucion_prestamo = monto_prestamo
+
+    ingreso_final = c["precio_venta"] - comision_venta_eur - intereses_totales - devolucion_prestamo
+    ganancia_neta = ingreso_final - capital_propio
+
+    con_capital = capital_propio > 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        roi = np.where(con_capital, ganancia_neta / capital_propio * 100, 0.0)
+
+    # Flujo [-capital, 0, ..., ingreso_final]: la TIR tiene solución cerrada
+    tir, tir_convergida = tir_flujo_simple(capital_propio, ingreso_final, tenencia)
+
+    return {
+        "coste_reforma": coste_reforma,
+        "coste_reforma_iva": coste_reforma_iva,
+        "comision_compra_eur": comision_compra_eur,
+        "itp_eur": itp_eur,
+        "gastos_total_compra": gastos_total_compra,
+        "inversion_total": inversion_total,
+        "comision_venta_eur": comision_venta_eur,
+        "monto_prestamo": monto_prestamo,
+        "intereses_totales": intereses_totales,
+        "capital_propio": capital_propio,
+        "devolucion_prestamo": devolucion_prestamo,
+        "ingreso_final": ingreso_final,
+        "ganancia_neta": ganancia_neta,
+        "roi": roi,
+        "tir": tir * 100,
+        "tir_convergida": tir_convergida,
+    }
+
+
+def evaluar_operaciones(operaciones):
+    """
+    Evalúa un lote de operaciones (una fila por inmueble) y devuelve un DataFrame
+    con las cifras del análisis financiero y del resumen ejecutivo.
+    """
+    df = preparar_operaciones(operaciones)
+    c = {campo: df[campo].to_numpy() for campo in CAMPOS_ENTRADA}
+    if "anios_tenencia" in df.columns:
+        c["anios_tenencia"] = df["anios_tenencia"].fillna(df["plazo_anios"]).to_numpy(dtype=float)
+    r = calcular(c)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precio_venta_m2 = np.where(c["superficie"] > 0, c["precio_venta"] / c["superficie"], 0.0)
+    # Precio con el que ROI = ROI_SUGERIDO: la comisión de venta depende del propio precio
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precio_venta_sugerido = (
+            r["capital_propio"] * (1 + ROI_SUGERIDO / 100) + r["intereses_totales"] + r["devolucion_prestamo"]
+        ) / (1 - c["comision_venta"] / 100)
+
+    resultado = pd.DataFrame(r, index=df.index)
+    resultado.insert(
+        resultado.columns.get_loc("roi"), "ganancia_neta_impuestos",
+        r["ganancia_neta"] * FACTOR_GANANCIA_NETA,
+    )
+    resultado["precio_venta_sugerido"] = precio_venta_sugerido
+    resultado["precio_venta_m2"] = precio_venta_m2
+    resultado["interpretacion"] = interpretar_roi(r["roi"])
+    return resultado
+
+
+def formatear_tir(tir, sufijo=""):
+    """Formatea una TIR en %; "n/d" cuando no tiene solución."""
+    return f"{tir:.2f}{sufijo}" if np.isfinite(tir) else "n/d"
+
+
+def escenarios_precio_venta(operacion, variaciones):
+    """Evalúa una operación con el precio de venta variado en los porcentajes indicados."""
+    base = preparar_operaciones(operacion).iloc[[0]]
+    variaciones = np.asarray(list(variaciones), dtype=float)
+    lote = base.loc[base.index.repeat(len(variaciones))].reset_index(drop=True)
+    lote["precio_venta"] = lote["precio_venta"] * (1 + variaciones / 100)
+    resultado = evaluar_operaciones(lote)
+    resultado.insert(0, "variacion", variaciones)
+    resultado.insert(1, "precio_venta", lote["precio_venta"])
+    return resultado
+
+
+def resumen_ejecutivo(operacion, resultado):
+    """Construye la tabla del Resumen Ejecutivo para una operación evaluada."""
+    op = preparar_operaciones(operacion).iloc[0]
+    r = resultado.iloc[0]
+    return pd.DataFrame({
+        "Concepto": [
+            "🏠 Precio de compra",
+            "🏠 Comisión de compra",
+            "🏠 ITP / IVA de compra",
+            "🏠 Gastos legales",
+            "🏠 Gastos administrativos",
+            "🏠 IBI",
+            "🛠️ Coste de reforma (con IVA)",
+            "💼 Inversión total",
+            "🏦 Préstamo solicitado",
+            "💸 Intereses del préstamo",
+            "💼 Capital propio invertido",
+            "📈 Precio de venta",
+            "📈 Comisión de venta",
+            "📊 Ganancia Bruta esperada",
+            "📊 Ganancia Neta esperada",
+            "📊 ROI real (%)",
+            "📊 TIR real (%)",
+            "💸 Precio Venta m/2"
+        ],
+        "Valor estimado (€)": [
+            f"{op['precio_compra']:,.0f}",
+            f"{r['comision_compra_eur']:,.0f}",
+            f"{r['itp_eur']:,.0f}",
+            f"{op['gastos_legales']:,.0f}",
+            f"{op['gastos_administrativos']:,.0f}",
+            f"{op['ibi']:,.0f}",
+            f"{r['coste_reforma_iva']:,.0f}",
+            f"{r['inversion_total']:,.0f}",
+            f"{r['monto_prestamo']:,.0f}",
+            f"{r['intereses_totales']:,.0f}",
+            f"{r['capital_propio']:,.0f}",
+            f"{op['precio_venta']:,.0f}",
+            f"{r['comision_venta_eur']:,.0f}",
+            f"{r['ganancia_neta']:,.0f}",
+            f"{r['ganancia_neta_impuestos']:.0f}",
+            f"{r['roi']:.2f}",
+            formatear_tir(r["tir"]),
+            f"{r['precio_venta_m2']:,.0f}"
+        ]
+    })
@@ -0,0 +1,255 @@
+# ADCO - Parser de anuncios de Idealista
+# Extrae precio, superficie, habitaciones, baños, planta y estado de las fichas de resultados
+# con lxml y devuelve columnas numéricas tipadas, separando las filas rechazadas con su motivo.
+
+import re
+
+import lxml.html
+import numpy as np
+import pandas as pd
+
+from instrumentacion import medido
+
+URL_BASE = "https://www.idealista.com"
+
+# Tipos de las columnas de comparables (una sola conversión al ingerir)
+ESQUEMA = {
+    "Zona": "object",
+    "Subzona": "object",
+    "Título": "object",
+    "Precio (€)": "float64",
+    "Superficie (m²)": "float64",
+    "€/m²": "float64",
+    "Habitaciones": "Int64",
+    "Baños": "Int64",
+    "Planta": "Int64",
+    "Estado": "object",
+    "Descripción": "object",
+    "Link": "object",
+}
+
+# Rangos plausibles para una vivienda dentro de la M-30
+SUPERFICIE_MINIMA = 15
+SUPERFICIE_MAXIMA = 2000
+EUR_M2_MINIMO = 1000
+EUR_M2_MAXIMO = 40000
+
+_NUMERO = re.compile(r"\d[\d.]*(?:,\d+)?")
+_SUPERFICIE_TEXTO = re.compile(r"(\d[\d.]*(?:,\d+)?)\s*(?:m2|m²|metros)", re.IGNORECASE)
+_PLANTA = re.compile(r"planta\s*(-?\d+)", re.IGNORECASE)
+
+ESTADOS = [
+    ("A reformar", re.compile(r"\b(a reformar|para reformar|necesita reforma)\b", re.IGNORECASE)),
+    ("Obra nueva", re.compile(r"\bobra nueva\b", re.IGNORECASE)),
+    ("Reformado", re.compile(r"\b(reformad[oa]|a estrenar|rehabilitad[oa])\b", re.IGNORECASE)),
+]
+
+
+def _clase(nombre):
+    return f'contains(concat(" ", normalize-space(@class), " "), " {nombre} ")'
+
+
+def numero(texto):
+    """Primer número de un texto en formato español ("1.250.000 €", "80,5 m²") o NaN."""
+    m = _NUMERO.search(texto or "")
+    if not m:
+        return np.nan
+    return float(m.group(0).replace(".", "").replace(",", "."))
+
+
+def superficie_desde_texto(texto):
+    """Mayor superficie plausible mencionada en un texto libre ("... de 344 m2 ..."), o NaN."""
+    valores = [numero(v) for v in _SUPERFICIE_TEXTO.findall(texto or "")]
+    valores = [v for v in valores if SUPERFICIE_MINIMA <= v <= SUPERFICIE_MAXIMA]
+    return max(valores) if valores else np.nan
+
+
+def planta(texto):
+    """Planta como entero: bajo/entreplanta = 0, sótano/semisótano = -1."""
+    texto = (texto or "").lower()
+    if "sótano" in texto:
+        return -1
+    if "bajo" in texto or "entreplanta" in texto:
+        return 0
+    m = _PLANTA.search(texto)
+    return int(m.group(1)) if m else None
+
+
+def estado(texto):
+    """Estado de conservación deducido del texto del anuncio, o None."""
+    for nombre, patron in ESTADOS:
+        if patron.search(texto or ""):
+            return nombre
+    return None
+
+
+@medido("conversion.tipar", filas=len)
+def tipar(df):
+    """Asegura las columnas y tipos de ESQUEMA en un DataFrame de comparables."""
+    df = df.copy()
+    for columna, tipo in ESQUEMA.items():
+        if columna not in df.columns:
+            df[columna] = None
+        if tipo == "float64":
+            df[columna] = pd.to_numeric(df[columna], errors="coerce").astype("float64")
+        elif tipo == "Int64":
+            df[columna] = pd.to_numeric(df[columna], errors="coerce").round().astype("Int64")
+    return df[list(ESQUEMA)]
+
+
+# Esquema compacto para tener varias instantáneas completas en memoria: textos repetidos
+# como categorías, enteros pequeños y float32 (precio exacto hasta 16 M€). La descripción
+# y el enlace no forman parte del esquema: la primera se lee aparte del almacén cuando hace
+# falta y el segundo se reconstruye con el ID del anuncio.
+ESQUEMA_COMPACTO = {
+    "Zona": "category",
+    "Subzona": "category",
+    "Título": "category",
+    "Precio (€)": "float32",
+    "Superficie (m²)": "float32",
+    "€/m²": "float32",
+    "Habitaciones": "Int8",
+    "Baños": "Int8",
+    "Planta": "Int8",
+    "Estado": pd.CategoricalDtype([nombre for nombre, _ in ESTADOS]),
+}
+
+
+def numeros(serie):
+    """numero() de cada texto de una columna ("5 hab.", "2 baños"), convirtiendo cada valor distinto una vez."""
+    if pd.api.types.is_numeric_dtype(serie):
+        return serie
+    conversion = {v: numero(v) if isinstance(v, str) else v for v in serie.dropna().unique()}
+    return serie.map(conversion)
+
+
+def enlace_anuncio(id_anuncio):
+    """URL de la ficha de un anuncio de Idealista a partir de su ID."""
+    return f"{URL_BASE}/inmueble/{id_anuncio}/"
+
+
+@medido("conversion.compactar", filas=len)
+def compactar(df):
+    """Pasa un DataFrame de comparables (columnas de ESQUEMA) al ESQUEMA_COMPACTO."""
+    compacto = {}
+    for columna, tipo in ESQUEMA_COMPACTO.items():
+        serie = df[columna] if columna in df.columns else pd.Series(None, index=df.index, dtype=object)
+        if tipo in ("float32", "Int8"):
+            serie = pd.to_numeric(numeros(serie), errors="coerce")
+            compacto[columna] = serie.round().astype(tipo) if tipo == "Int8" else serie.astype(tipo)
+        else:
+            compacto[columna] = serie.astype(tipo)
+    return pd.DataFrame(compacto, index=df.index)
+
+
+def concatenar_compactos(bloques):
+    """Une bloques compactados por separado sin que las categorías distintas vuelvan a texto."""
+    bloques = list(bloques)
+    df = pd.concat(bloques)
+    for columna in df.columns:
+        if isinstance(bloques[0][columna].dtype, pd.CategoricalDtype) and df[columna].dtype == object:
+            unidas = pd.api.types.union_categoricals([b[columna] for b in bloques])
+            df[columna] = pd.Categorical.from_codes(unidas.codes, unidas.categories)
+    return df
+
+
+def memoria(df):
+    """Memoria real (MB) de cada columna de un DataFrame y el total, contando los textos."""
+    por_columna = df.memory_usage(index=True, deep=True) / 1e6
+    return por_columna.rename({"Index": "(índice)"})
+
+
+def validar_comparables(df):
+    """
+    Separa filas válidas y rechazadas de un DataFrame tipado. Las rechazadas llevan
+    una columna "Motivo" (sin precio, superficie fuera de rango, €/m² fuera de rango...).
+    """
+    precio = df["Precio (€)"]
+    superficie = df["Superficie (m²)"]
+    eur_m2 = df["€/m²"]
+    motivo = np.select(
+        [
+            precio.isna() | (precio <= 0),
+            superficie.isna() | (superficie <= 0),
+            (superficie < SUPERFICIE_MINIMA) | (superficie > SUPERFICIE_MAXIMA),
+            (eur_m2 < EUR_M2_MINIMO) | (eur_m2 > EUR_M2_MAXIMO),
+        ],
+        ["sin precio", "sin superficie", "superficie fuera de rango", "€/m² fuera de rango"],
+        default="",
+    )
+    rechazada = motivo != ""
+    rechazados = df[rechazada].copy()
+    rechazados["Motivo"] = motivo[rechazada]
+    return df[~rechazada].reset_index(drop=True), rechazados.reset_index(drop=True)
+
+
+@medido("parser.pagina", filas=lambda resultado: len(resultado[0]) + len(resultado[1]))
+def parsear_anuncios(html, subzona=None, zona=None):
+    """
+    Extrae las fichas de una página de resultados de Idealista.
+    Devuelve (validos, rechazados) como DataFrames con los tipos de ESQUEMA.
+    """
+    filas = []
+    if html and html.strip():
+        doc = lxml.html.fromstring(html)
+        for item in doc.xpath(f"//*[{_clase('item-info-container')}]"):
+            enlace = item.xpath(f".//a[{_clase('item-link')}]")
+            if not enlace:
+                continue
+            precio_tag = item.xpath(f".//*[{_clase('item-price')}]")
+            detalles = [d.text_content().strip() for d in item.xpath(f".//*[{_clase('item-detail')}]")]
+            descripcion_tag = item.xpath(f".//*[{_clase('item-description')}]")
+            etiquetas = " ".join(t.text_content() for t in item.xpath(f".//*[{_clase('listing-tags')}]"))
+            titulo = enlace[0].text_content().strip()
+            descripcion = descripcion_tag[0].text_content().strip() if descripcion_tag else None
+
+            fila = {
+                "Zona": zona,
+                "Subzona": subzona,
+                "Título": titulo,
+                "Precio (€)": numero(precio_tag[0].text_content()) if precio_tag else np.nan,
+                "Superficie (m²)": np.nan,
+                "Habitaciones": None,
+                "Baños": None,
+                "Planta": None,
+                "Estado": estado(" ".join([etiquetas, titulo, descripcion or ""])),
+                "Descripción": descripcion,
+                "Link": URL_BASE + enlace[0].get("href", ""),
+            }
+            for detalle in detalles:
+                texto = detalle.lower()
+                if "m²" in texto or "m2" in texto:
+                    fila["Superficie (m²)"] = numero(texto)
+                elif "hab" in texto:
+                    fila["Habitaciones"] = numero(texto)
+                elif "baño" in texto:
+                    fila["Baños"] = numero(texto)
+                elif "planta" in texto or "bajo" in texto or "sótano" in texto:
+                    fila["Planta"] = planta(texto)
+            filas.append(fila)
+
+    df = tipar(pd.DataFrame(filas))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        df["€/m²"] = (df["Precio (€)"] / df["Superficie (m²)"]).where(df["Superficie (m²)"] > 0)
+    return validar_comparables(df)
+
+
+def reparar_superficie(df):
+    """
+    Corrige exportaciones antiguas en las que "Superficie (m²)" contiene el número de
+    habitaciones: toma la superficie de la descripción cuando la hay y recalcula €/m².
+    """
+    df = df.copy()
+    sospechosa = df["Superficie (m²)"].isna() | (df["Superficie (m²)"] < SUPERFICIE_MINIMA)
+    if "Habitaciones" in df.columns:
+        sospechosa |= df["Superficie (m²)"].eq(df["Habitaciones"].astype("float64")).fillna(False)
+    desde_texto = df.loc[sospechosa, "Descripción"].map(superficie_desde_texto)
+    df.loc[sospechosa, "Superficie (m²)"] = desde_texto.astype("float64")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        df["€/m²"] = (df["Precio (€)"] / df["Superficie (m²)"]).where(df["Superficie (m²)"] > 0)
+    return df
+
+
+def registros(df):
+    """Filas de un DataFrame tipado como dicts serializables a JSON (NA -> None)."""
+    return df.astype(object).where(df.notna(), None).to_dict("records")
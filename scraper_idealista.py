@@ -0,0 +1,188 @@
+# ADCO - Scraper de comparables de Idealista
+# Descarga concurrente de subzonas con sesión HTTP compartida, limitador de tasa por host
+# y reintentos con espera exponencial.
+
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
+
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+
+from instrumentacion import contar, medido, tramo
+from parser_anuncios import parsear_anuncios, registros, tipar
+
+# Servicio intermedio (ScraperAPI o un servidor local de pruebas con la misma interfaz)
+URL_API = os.environ.get("ADCO_SCRAPER_URL", "http://api.scraperapi.com")
+SCRAPERAPI_KEY = os.environ.get("SCRAPERAPI_KEY", "c21a8e492547f96ed694f796c0355091")
+
+HEADERS_LIST = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64)",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7)",
+    "Mozilla/5.0 (X11; Linux x86_64)"
+]
+
+# Subzonas y URLs
+SUBZONAS_M30 = {
+    "Chamberí": {
+        "Almagro": "https://www.idealista.com/venta-viviendas/madrid/chamberi/almagro/",
+        "Trafalgar": "https://www.idealista.com/venta-viviendas/madrid/chamberi/trafalgar/",
+        "Ríos Rosas": "https://www.idealista.com/venta-viviendas/madrid/chamberi/rios-rosas/",
+        "Arapiles": "https://www.idealista.com/venta-viviendas/madrid/chamberi/arapiles/",
+        "Vallehermoso": "https://www.idealista.com/venta-viviendas/madrid/chamberi/vallehermoso/",
+        "Gaztambide": "https://www.idealista.com/venta-viviendas/madrid/chamberi/gaztambide/"
+    },
+    "Salamanca": {
+        "Recoletos": "https://www.idealista.com/venta-viviendas/madrid/barrio-de-salamanca/recoletos/",
+        "Castellana": "https://www.idealista.com/venta-viviendas/madrid/barrio-de-salamanca/castellana/",
+        "Lista": "https://www.idealista.com/venta-viviendas/madrid/barrio-de-salamanca/lista/",
+        "Goya": "https://www.idealista.com/venta-viviendas/madrid/barrio-de-salamanca/goya/",
+        "Fuente del Berro": "https://www.idealista.com/venta-viviendas/madrid/barrio-de-salamanca/fuente-del-berro/",
+        "Guindalera": "https://www.idealista.com/venta-viviendas/madrid/barrio-de-salamanca/guindalera/"
+    },
+    "Centro": {
+        "Sol": "https://www.idealista.com/venta-viviendas/madrid/centro/sol/",
+        "Chueca Justicia": "https://www.idealista.com/venta-viviendas/madrid/centro/chueca-justicia/",
+        "Malasaña-Universidad": "https://www.idealista.com/venta-viviendas/madrid/centro/malasana-universidad/",
+        "Lavapiés Embajadores": "https://www.idealista.com/venta-viviendas/madrid/centro/lavapies-embajadores/",
+        "Huertas Cortes": "https://www.idealista.com/venta-viviendas/madrid/centro/huertas-cortes/",
+        "Palacio": "https://www.idealista.com/venta-viviendas/madrid/centro/palacio/"
+    }
+}
+
+
+class LimitadorTasa:
+    """Cubo de fichas por host: como máximo `tasa` peticiones/segundo con ráfagas de `rafaga`."""
+
+    def __init__(self, tasa=2.0, rafaga=4):
+        self.tasa = tasa
+        self.rafaga = rafaga
+        self._fichas = {}
+        self._lock = threading.Lock()
+
+    def esperar(self, host):
+        """Bloquea hasta que haya una ficha disponible para el host."""
+        while True:
+            with self._lock:
+                ahora = time.monotonic()
+                fichas, ultimo = self._fichas.get(host, (self.rafaga, ahora))
+                fichas = min(self.rafaga, fichas + (ahora - ultimo) * self.tasa)
+                if fichas >= 1:
+                    self._fichas[host] = (fichas - 1, ahora)
+                    return
+                self._fichas[host] = (fichas, ahora)
+                espera = (1 - fichas) / self.tasa
+            time.sleep(espera)
+
+
+def crear_sesion(max_conexiones=8):
+    """Sesión HTTP con conexiones reutilizables (keep-alive) para todas las descargas."""
+    sesion = requests.Session()
+    adaptador = HTTPAdapter(pool_connections=max_conexiones, pool_maxsize=max_conexiones)
+    sesion.mount("http://", adaptador)
+    sesion.mount("https://", adaptador)
+    return sesion
+
+
+def descargar_pagina(sesion, url, limitador, url_api=None, reintentos=3, espera_base=1.0, timeout=20):
+    """
+    Descarga una página de resultados a través del servicio intermedio.
+    Reintenta errores de red y respuestas 429/5xx con espera exponencial y jitter; el
+    resto de 4xx (401, 403, 404...) se propaga sin reintentar para no gastar créditos.
+    """
+    url_api = url_api or URL_API
+    params = {"api_key": SCRAPERAPI_KEY, "url": url}
+    host = urlparse(url_api).netloc
+
+    for intento in range(reintentos + 1):
+        limitador.esperar(host)
+        headers = {
+            "User-Agent": random.choice(HEADERS_LIST),
+            "Accept-Language": "es-ES,es;q=0.9"
+        }
+        try:
+            with tramo("scraperapi.peticion"):
+                response = sesion.get(url_api, params=params, headers=headers, timeout=timeout)
+            if response.status_code == 429 or response.status_code >= 500:
+                raise requests.HTTPError(f"HTTP {response.status_code}", response=response)
+            response.raise_for_status()
+            return response.text
+        except requests.RequestException as error:
+            contar("scraperapi.errores")
+            estado = error.response.status_code if error.response is not None else None
+            if intento == reintentos or (estado is not None and 400 <= estado < 500 and estado != 429):
+                raise
+            contar("scraperapi.reintentos")
+            time.sleep(espera_base * 2 ** intento * random.uniform(0.5, 1.5))
+
+
+def parsear_pagina(html, nombre, zona=None):
+    """Extrae los anuncios de una página de resultados: (filas válidas, filas rechazadas)."""
+    validos, rechazados = parsear_anuncios(html, subzona=nombre, zona=zona)
+    return registros(validos), registros(rechazados)
+
+
+@medido("scraper.scrapear", filas=lambda resultado: len(resultado[0]))
+def scrapear(tareas, paginas=2, max_concurrencia=8, limitador=None, url_api=None, cache=None, progreso=None):
+    """
+    Descarga en paralelo todas las páginas de las subzonas indicadas.
+
+    tareas: lista de (zona, subzona, url_base). Devuelve (DataFrame, errores), donde
+    errores es una lista de (subzona, página, mensaje); las filas rechazadas por el
+    parser quedan en df.attrs["rechazados"]. La duración queda acotada
+    por el limitador de tasa, no por la latencia de cada petición. Si se pasa una
+    CacheScraping, las páginas vigentes se sirven desde disco sin consumir créditos.
+    progreso(hechas, total) se llama cada vez que termina una página.
+    """
+    limitador = limitador or LimitadorTasa()
+    sesion = crear_sesion(max_concurrencia)
+    propiedades, rechazos, errores = [], [], []
+
+    def trabajo(zona, nombre, url_base, page):
+        filas = cache.obtener(nombre, page) if cache is not None else None
+        if filas is not None:
+            return filas, cache.obtener_rechazadas(nombre, page)
+        html = descargar_pagina(sesion, f"{url_base}pagina-{page}.htm", limitador, url_api=url_api)
+        filas, rechazadas = parsear_pagina(html, nombre, zona)
+        if cache is not None:
+            cache.guardar(nombre, page, html, filas, rechazadas)
+        return filas, rechazadas
+
+    with sesion, ThreadPoolExecutor(max_workers=max_concurrencia) as pool:
+        futuros = {
+            pool.submit(trabajo, zona, nombre, url_base, page): (nombre, page)
+            for zona, nombre, url_base in tareas
+            for page in range(1, paginas + 1)
+        }
+        for hechas, futuro in enumerate(as_completed(futuros), 1):
+            nombre, page = futuros[futuro]
+            try:
+                filas, rechazadas = futuro.result()
+                propiedades.extend(filas)
+                rechazos.extend(rechazadas)
+            except Exception as e:
+                errores.append((nombre, page, str(e)))
+            if progreso is not None:
+                progreso(hechas, len(futuros))
+
+    df = tipar(pd.DataFrame(propiedades))
+    # Filas descartadas por el parser, con su motivo (también las de páginas servidas desde la caché)
+    df.attrs["rechazados"] = pd.DataFrame(rechazos)
+    return df, errores
+
+
+def scrapear_subzona(nombre, url_base, paginas=2, **kwargs):
+    """Descarga las páginas de una subzona (compatibilidad con la versión secuencial)."""
+    zona = next((z for z, subzonas in SUBZONAS_M30.items() if nombre in subzonas), None)
+    return scrapear([(zona, nombre, url_base)], paginas=paginas, **kwargs)
+
+
+def scrapear_m30(subzonas=None, paginas=2, **kwargs):
+    """Descarga todas las subzonas de la M-30 (o el subconjunto {zona: {subzona: url}} indicado)."""
+    subzonas = subzonas or SUBZONAS_M30
+    tareas = [(zona, nombre, url) for zona, urls in subzonas.items() for nombre, url in urls.items()]
+    return scrapear(tareas, paginas=paginas, **kwargs)
@@ -1,20 +1,199 @@
-import streamlit as st
-import pandas as pd
+import time
+
+INICIO_RERUN = time.perf_counter()
+
+import functools
+import io
+
 import numpy as np
-import matplotlib.pyplot as plt
-import os
-from numpy_financial import irr
 import streamlit as st
 import pandas as pd
-import requests
-import random
-import time
-from bs4 import BeautifulSoup
+
+from instrumentacion import contar, iniciar_captura, medido, mostrar_panel, tramo
+
+# Tramos y contadores de este rerun (panel de rendimiento)
+captura = iniciar_captura()
+
+from motor_financiero import ROI_SUGERIDO, evaluar_operaciones, resumen_ejecutivo, formatear_tir
+from flujo_mensual import evaluar_mensual, escenarios_mensuales, tabla_flujos
+from cache_scraping import obtener_cache
+from almacen_comparables import AlmacenComparables, COLUMNAS
+from estadisticas_robustas import limites_filtro
+from indice_mercado import IndiceMercado
+from scraper_idealista import SUBZONAS_M30
+from superficie_escenarios import obtener_superficie
 
 st.set_page_config(page_title="Comparador por Subzona – ADCO", layout="centered")
 st.title("🏘️ Simulador de Flipping Inmobiliario – Versión Avanzada")
 st.caption("Desarrollado por ADCO Investments – andres@adco.es")
 
+
+# --- RECURSOS Y CÁLCULOS CACHEADOS ---
+# Las funciones puras se cachean por sus entradas: un rerun sin cambios no recalcula nada.
+
+def cacheado(nombre, **opciones):
+    """
+    st.cache_data que cuenta llamadas y fallos ("cache.<nombre>.llamadas/fallos") y
+    cronometra como tramo `nombre` solo los cálculos que no salen de la caché.
+    """
+    def decorar(funcion):
+        @functools.wraps(funcion)
+        def calculo(*args, **kwargs):
+            contar(f"cache.{nombre}.fallos")
+            with tramo(nombre):
+                return funcion(*args, **kwargs)
+
+        cacheada = st.cache_data(**opciones)(calculo)
+
+        @functools.wraps(funcion)
+        def llamada(*args, **kwargs):
+            contar(f"cache.{nombre}.llamadas")
+            return cacheada(*args, **kwargs)
+
+        llamada.clear = cacheada.clear
+        return llamada
+    return decorar
+
+
+@st.cache_resource
+def recursos():
+    """Caché de scraping, almacén e índice de mercado compartidos por todas las sesiones."""
+    almacen = AlmacenComparables()
+    return obtener_cache(), almacen, IndiceMercado(almacen)
+
+
+@cacheado("motor.evaluar", max_entries=256)
+def evaluar(operacion):
+    resultado = evaluar_operaciones(operacion)
+    return resultado, resumen_ejecutivo(operacion, resultado)
+
+
+@cacheado("flujo_mensual.evaluar", max_entries=256)
+def evaluar_flujo_mensual(operacion, fecha_compra):
+    return evaluar_mensual(operacion, fecha_compra).iloc[0], tabla_flujos(operacion, fecha_compra)
+
+
+@cacheado("motor.escenarios", max_entries=256)
+def escenarios_xirr(operacion, fecha_compra):
+    """XIRR mensual de -30% a +30% del precio de venta en pasos de 1%: el slider solo filtra."""
+    return escenarios_mensuales(operacion, range(-30, 31), fecha_compra).set_index("variacion")["tir"]
+
+
+@cacheado("objetivos.calcular", max_entries=256)
+def calcular_objetivos(operacion, roi_objetivo, prestamo_maximo, intereses_maximos):
+    from busqueda_objetivos import objetivos
+
+    return objetivos(operacion, roi_objetivo, prestamo_maximo, intereses_maximos).iloc[0]
+
+
+@cacheado("montecarlo", max_entries=16)
+def simulacion_montecarlo(operacion, dispersion_venta, dispersion_reforma, n_tiradas, semilla, mensual):
+    from simulacion_montecarlo import distribuciones_por_defecto, simular
+
+    distribuciones = distribuciones_por_defecto(operacion, dispersion_venta, dispersion_reforma)
+    simulacion = simular(operacion, distribuciones, n=n_tiradas, semilla=semilla, mensual=mensual)
+    simulacion.pop("muestras")
+    return simulacion
+
+
+@cacheado("grafico.barras", max_entries=256)
+def grafico_barras(etiquetas, valores, colores):
+    """PNG de un gráfico de barras (matplotlib solo se importa la primera vez que hace falta)."""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots()
+    ax.bar(list(etiquetas), list(valores), color=list(colores))
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", bbox_inches="tight")
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+@cacheado("grafico.tornado", max_entries=16)
+def grafico_tornado(df_tornado):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots()
+    ax.barh(df_tornado["Variable"], df_tornado["ROI alto (%)"] - df_tornado["ROI base (%)"], color="green")
+    ax.barh(df_tornado["Variable"], df_tornado["ROI bajo (%)"] - df_tornado["ROI base (%)"], color="gray")
+    ax.invert_yaxis()
+    ax.set_xlabel("Variación del ROI (pp) entre P10 y P90")
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", bbox_inches="tight")
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+@cacheado("almacen.resumen_robusto", max_entries=64)
+def estadisticas_subzona(version_almacen, zona, subzona):
+    _, almacen, _ = recursos()
+    return almacen.resumen_robusto(zona, subzona)
+
+
+@cacheado("informe.generar", max_entries=16)
+def generar_informe(operacion, titulo, fecha_compra, version_almacen, zona, subzona, formato):
+    """Bytes del informe PDF o Excel; se regenera solo si cambian la operación o el almacén."""
+    from informes_inversion import GENERADORES, MAX_FILAS_COMPARABLES, datos_informe
+
+    _, almacen, _ = recursos()
+    comparables = almacen.consultar(zona=zona, subzona=subzona, orden="-ultima_vez", limite=MAX_FILAS_COMPARABLES)
+    datos = datos_informe(operacion, titulo, fecha_compra, comparables if not comparables.empty else None)
+    return GENERADORES[formato](datos)
+
+
+@cacheado("cribado.almacen", max_entries=32)
+def cribar_almacen(version_almacen, version_indice, supuestos):
+    """Ranking del almacén con los supuestos dados; se invalida cuando cambia el almacén o el índice."""
+    from cribado_operaciones import cribar
+
+    _, almacen, indice = recursos()
+    anuncios = almacen.consultar(columnas=[
+        "id_anuncio", "zona", "subzona", "titulo", "precio", "superficie", "eur_m2", "estado", "link", "primera_vez"
+    ]).rename(columns={v: k for k, v in COLUMNAS.items()})
+    tabla_indice = indice.tabla()
+    ranking = cribar(anuncios, supuestos, indice=tabla_indice if not tabla_indice.empty else None)
+    ranking["Primera vez"] = ranking["ID"].map(anuncios.set_index("id_anuncio")["primera_vez"])
+    return ranking
+
+
+@st.cache_resource(max_entries=2)
+def valorador(version_almacen):
+    """Índice de vecinos del almacén; se reconstruye solo cuando cambia el almacén."""
+    from valoracion_comparables import ValoradorComparables
+
+    _, almacen, _ = recursos()
+    return ValoradorComparables.desde_almacen(almacen)
+
+
+@cacheado("valoracion.inmueble", max_entries=256)
+def valorar_inmueble(version_almacen, sujeto):
+    """Valoración por comparables del inmueble reformado y sus vecinos más parecidos."""
+    modelo = valorador(version_almacen)
+    if not len(modelo):
+        return None, None
+    valoracion = modelo.valorar(pd.DataFrame([sujeto])).iloc[0]
+    if pd.isna(valoracion["eur_m2_estimado"]):
+        return None, None
+    vecinos = modelo.vecinos(sujeto).rename(columns=COLUMNAS)
+    return valoracion, vecinos
+
+
+@cacheado("cartera.optimizar", max_entries=16)
+def planificar_cartera(candidatas, tope_capital, retraso_maximo, linea_credito, interes_linea, fecha_inicio,
+                       fondos_propios=None):
+    """Selección y calendario de operaciones bajo el tope de capital, con la cartera resultante."""
+    from cartera_operaciones import optimizar_cartera
+
+    return optimizar_cartera(candidatas, tope_capital, retraso_maximo, fecha_inicio=fecha_inicio,
+                             linea_credito=linea_credito, interes_linea=interes_linea, fondos_propios=fondos_propios)
+
+
+cache, almacen, indice = recursos()
+
 st.header("📥 Datos del Proyecto")
 
 # --- INPUTS ---
@@ -27,7 +206,8 @@ with st.expander("🏗️ Detalles del Proyecto"):
         coste_reforma_m2 = st.number_input("Coste por m² de reforma (€)", value=1600)
         costes_adicionales = st.number_input("Costes adicionales de reforma (€)", value=5000)
         iva_reforma = st.number_input("IVA en reforma (%)", value=10.0)
-        zona = st.selectbox("Zona del piso", ["Chamberí", "Salamanca", "Retiro"])
+        zona = st.selectbox("Zona del piso", list(SUBZONAS_M30.keys()))
+        subzona_piso = st.selectbox("Subzona del piso", ["Toda la zona"] + list(SUBZONAS_M30[zona].keys()))
 
     with col2:
         precio_compra = st.number_input("Precio de compra (€)", value=100000)
@@ -36,10 +216,46 @@ with st.expander("🏗️ Detalles del Proyecto"):
         gastos_administrativos = st.number_input("Gastos administrativos (€)", value=3000)
         itp = st.number_input("ITP o IVA de compra (%)", value=2.0)
         ibi = st.number_input("IBI (€)", value=1000)
+        habitaciones = st.number_input("Habitaciones", value=3, min_value=0)
+        banos = st.number_input("Baños", value=2, min_value=0)
 
 # Venta
 st.subheader("💰 Precio de Venta y Comisión")
-precio_venta = st.number_input("Precio de venta esperado (€)", value=1750000)
+
+# Valoración del inmueble ya reformado a partir de los comparables más parecidos
+sujeto = {
+    "zona": zona,
+    "subzona": None if subzona_piso == "Toda la zona" else subzona_piso,
+    "superficie": superficie,
+    "habitaciones": habitaciones or None,
+    "banos": banos or None,
+    "estado": "Reformado",
+}
+valoracion, vecinos = valorar_inmueble(almacen.version(), sujeto)
+precio_valorado = int(round(valoracion["precio_estimado"], -3)) if valoracion is not None else 1750000
+precio_venta = st.number_input("Precio de venta esperado (€)", value=precio_valorado)
+if valoracion is not None:
+    st.caption(
+        f"Valoración por comparables: {valoracion['eur_m2_estimado']:,.0f} €/m² "
+        f"({valoracion['precio_bajo']:,.0f} € – {valoracion['precio_alto']:,.0f} €, "
+        f"{int(valoracion['n_comparables'])} comparables)"
+    )
+    with st.expander("🏘️ Comparables más parecidos"):
+        st.dataframe(
+            vecinos[["Subzona", "Título", "Precio (€)", "Superficie (m²)", "€/m²", "Habitaciones", "Baños",
+                     "Estado", "distancia"]].round(2),
+            hide_index=True,
+        )
+        # Las descripciones no están en la instantánea en memoria: se leen del almacén al pedirlas
+        if st.checkbox("Mostrar descripciones"):
+            for id_anuncio, descripcion in almacen.descripciones(vecinos["ID"]).items():
+                st.markdown(f"**{id_anuncio}** · {descripcion or 'Sin descripción'}")
+        instantanea = valorador(almacen.version()).comparables
+        memoria_mb = instantanea.memory_usage(deep=True).sum() / 1e6
+        st.caption(
+            f"Instantánea compacta en memoria: {len(instantanea):,} anuncios, {memoria_mb:,.1f} MB "
+            f"({memoria_mb * 1e6 / max(len(instantanea), 1):,.0f} bytes por anuncio)"
+        )
 comision_venta = st.number_input("Comisión de venta (%)", value=3.0)
 
 # Financiamiento
@@ -55,322 +271,576 @@ else:
     interes_prestamo = 0.0
     plazo_anios = 1
 
-# --- CÁLCULOS ---
-st.header("📊 Análisis Financiero")
+# Calendario mensual
+with st.expander("📅 Calendario y costes de tenencia"):
+    colt1, colt2 = st.columns(2)
 
-coste_reforma = superficie_reforma * coste_reforma_m2 + costes_adicionales
-coste_reforma_iva = coste_reforma * (1 + iva_reforma / 100)
-gastos_total_compra = (
-    precio_compra * (1 + comision_compra / 100) +
-    precio_compra * (itp / 100) +
-    gastos_legales + gastos_administrativos + ibi
-)
-inversion_total = gastos_total_compra + coste_reforma_iva
-comision_venta_eur = precio_venta * comision_venta / 100
+    with colt1:
+        fecha_compra = st.date_input("Fecha de compra")
+        meses_venta = st.number_input("Mes de la venta", value=12, min_value=1, max_value=120)
+        mes_inicio_reforma = st.number_input("Mes de inicio de la reforma", value=1, min_value=0, max_value=120)
+        meses_reforma = st.number_input("Duración de la reforma (meses)", value=6, min_value=1, max_value=60)
+
+    with colt2:
+        comunidad_mensual = st.number_input("Comunidad (€/mes)", value=150)
+        seguro_anual = st.number_input("Seguro (€/año)", value=300)
+        suministros_mensual = st.number_input("Suministros (€/mes)", value=60)
+        prestamo_amortizable = st.radio("Tipo de préstamo", ["Solo intereses", "Amortizable"]) == "Amortizable"
 
-monto_prestamo = inversion_total * porcentaje_prestamo / 100
-intereses_totales = monto_prestamo * interes_prestamo / 100 * plazo_anios
-capital_propio = inversion_total - monto_prestamo
-devolucion_prestamo = monto_prestamo
+# --- CÁLCULOS ---
+st.header("📊 Análisis Financiero")
 
-flujo_neto = [-capital_propio] + [0] * (plazo_anios - 1) + [
-    precio_venta - comision_venta_eur - intereses_totales - devolucion_prestamo
-]
-ganancia_neta = flujo_neto[-1] - capital_propio
-roi = (ganancia_neta / capital_propio) * 100 if capital_propio > 0 else 0
-tir = irr(flujo_neto) * 100 if flujo_neto[-1] > 0 else 0
+operacion = {
+    "superficie": superficie,
+    "superficie_reforma": superficie_reforma,
+    "coste_reforma_m2": coste_reforma_m2,
+    "costes_adicionales": costes_adicionales,
+    "iva_reforma": iva_reforma,
+    "precio_compra": precio_compra,
+    "comision_compra": comision_compra,
+    "gastos_legales": gastos_legales,
+    "gastos_administrativos": gastos_administrativos,
+    "itp": itp,
+    "ibi": ibi,
+    "precio_venta": precio_venta,
+    "comision_venta": comision_venta,
+    "porcentaje_prestamo": porcentaje_prestamo,
+    "interes_prestamo": interes_prestamo,
+    "plazo_anios": plazo_anios,
+    "meses_venta": meses_venta,
+    "mes_inicio_reforma": mes_inicio_reforma,
+    "meses_reforma": meses_reforma,
+    "prestamo_amortizable": int(prestamo_amortizable),
+    "comunidad_mensual": comunidad_mensual,
+    "seguro_anual": seguro_anual,
+    "suministros_mensual": suministros_mensual,
+}
+resultado, df_resumen = evaluar(operacion)
+r = resultado.iloc[0]
 
-precio_venta_sugerido = capital_propio * 1.2 + comision_venta_eur + intereses_totales + devolucion_prestamo
+capital_propio = r["capital_propio"]
+monto_prestamo = r["monto_prestamo"]
+ganancia_neta = r["ganancia_neta"]
+roi = r["roi"]
+tir = r["tir"]
 
 st.metric("💰 ROI real", f"{roi:.2f}%")
-st.metric("📈 TIR real", f"{tir:.2f}%")
-st.metric("💡 Precio sugerido con 20% ROI", f"{precio_venta_sugerido:,.0f} €")
+st.metric("📈 TIR real", formatear_tir(tir, "%"))
+st.metric(f"💡 Precio sugerido con {ROI_SUGERIDO:.0f}% ROI", f"{r['precio_venta_sugerido']:,.0f} €")
 
-fig, ax = plt.subplots()
-ax.bar(["Capital Propio", "Ganancia Neta"], [capital_propio, ganancia_neta], color=["gray", "green"])
-st.pyplot(fig)
+st.image(grafico_barras(("Capital Propio", "Ganancia Neta"), (capital_propio, ganancia_neta), ("gray", "green")))
 
 # --- RESUMEN EJECUTIVO ---
 st.subheader("📋 Resumen Ejecutivo de la Inversión")
 
-if roi < 10:
-    interpretacion = "⚠️ Rentabilidad baja"
-elif 10 <= roi <= 20:
-    interpretacion = "✅ Rentabilidad aceptable"
-else:
-    interpretacion = "🚀 Rentabilidad excelente"
-
 frase_inversion = (
-    f"💬 Este proyecto proyecta una rentabilidad del **{roi:.2f}%** y una TIR del **{tir:.2f}%**. "
+    f"💬 Este proyecto proyecta una rentabilidad del **{roi:.2f}%** y una TIR del **{formatear_tir(tir, '%')}**. "
     f"Requiere un capital propio estimado de **{capital_propio:,.0f} €** con un préstamo de "
-    f"**{monto_prestamo:,.0f} €**. {interpretacion} para inversiones de corto plazo en Madrid."
+    f"**{monto_prestamo:,.0f} €**. {r['interpretacion']} para inversiones de corto plazo en Madrid."
 )
 
-resumen_data = {
-    "Concepto": [
-        "🏠 Precio de compra",
-        "🏠 Comisión de compra",
-        "🏠 ITP / IVA de compra",
-        "🏠 Gastos legales",
-        "🏠 Gastos administrativos",
-        "🏠 IBI",
-        "🛠️ Coste de reforma (con IVA)",
-        "💼 Inversión total",
-        "🏦 Préstamo solicitado",
-        "💸 Intereses del préstamo",
-        "💼 Capital propio invertido",
-        "📈 Precio de venta",
-        "📈 Comisión de venta",
-        "📊 Ganancia Bruta esperada",
-        "📊 Ganancia Neta esperada",
-        "📊 ROI real (%)",
-        "📊 TIR real (%)",
-        "💸 Precio Venta m/2"
-    ],
-    "Valor estimado (€)": [
-        f"{precio_compra:,.0f}",
-        f"{precio_compra * comision_compra / 100:,.0f}",
-        f"{precio_compra * itp / 100:,.0f}",
-        f"{gastos_legales:,.0f}",
-        f"{gastos_administrativos:,.0f}",
-        f"{ibi:,.0f}",
-        f"{coste_reforma_iva:,.0f}",
-        f"{inversion_total:,.0f}",
-        f"{monto_prestamo:,.0f}",
-        f"{intereses_totales:,.0f}",
-        f"{capital_propio:,.0f}",
-        f"{precio_venta:,.0f}",
-        f"{comision_venta_eur:,.0f}",
-        f"{ganancia_neta:,.0f}",
-        f"{ganancia_neta *.75:.0f}",
-        f"{roi:.2f}",
-        f"{tir:.2f}",
-        f"{precio_venta / superficie:,.0F}"
-    ]
-}
-df_resumen = pd.DataFrame(resumen_data)
 st.dataframe(df_resumen, hide_index=True)
 st.markdown(frase_inversion)
 
+# --- FLUJO DE CAJA MENSUAL ---
+st.subheader("📅 Flujo de Caja Mensual")
+
+mensual, df_flujos = evaluar_flujo_mensual(operacion, fecha_compra)
+colx1, colx2, colx3, colx4 = st.columns(4)
+colx1.metric("XIRR anual", formatear_tir(mensual["tir"], "%"))
+colx2.metric("Capital máximo expuesto", f"{mensual['capital_maximo']:,.0f} €")
+colx3.metric("Intereses", f"{mensual['intereses_totales']:,.0f} €")
+colx4.metric("Costes de tenencia", f"{mensual['costes_tenencia']:,.0f} €")
+st.caption(
+    f"Venta en el mes {int(mensual['meses_venta'])}: ganancia neta {mensual['ganancia_neta']:,.0f} € "
+    f"({mensual['roi']:.2f}% sobre el capital aportado)"
+)
+with st.expander("Ver flujo mes a mes"):
+    st.dataframe(df_flujos.round(0), hide_index=True)
+
+
 # --- ESCENARIOS DE PRECIO DE VENTA ---
-st.subheader("🎯 Escenarios: ¿Qué pasa si vendes por más o menos?")
-
-delta_precio = st.slider("Variación en el precio de venta (%)", -20, 20, (-10, 10), step=5)
-
-escenarios_resultados = []
-for variacion in range(delta_precio[0], delta_precio[1] + 1, 5):
-    factor = 1 + variacion / 100
-    nuevo_precio_venta = precio_venta * factor
-    nueva_comision_venta = nuevo_precio_venta * comision_venta / 100
-    ingreso_final = nuevo_precio_venta - nueva_comision_venta - intereses_totales - devolucion_prestamo
-    nueva_ganancia_neta = ingreso_final - capital_propio
-    nuevo_roi = (nueva_ganancia_neta / capital_propio * 100) if capital_propio > 0 else 0
-    flujo = [-capital_propio] + [0] * (plazo_anios - 1) + [ingreso_final]
-    nuevo_tir = irr(flujo) * 100 if ingreso_final > 0 else 0
-
-    escenarios_resultados.append({
-        "Variación Precio Venta": f"{variacion:+d}%",
-        "Precio de Venta (€)": f"{nuevo_precio_venta:,.0f}",
-        "ROI (%)": f"{nuevo_roi:.2f}",
-        "TIR (%)": f"{nuevo_tir:.2f}"
+@st.fragment
+@medido("seccion.escenarios")
+def seccion_escenarios(operacion, fecha_compra):
+    st.subheader("🎯 Escenarios: ¿Qué pasa si vendes por más o menos?")
+
+    delta_precio = st.slider("Variación en el precio de venta (%)", -20, 20, (-10, 10), step=5)
+
+    # Lecturas de la superficie precalculada y de la XIRR ya calculada: mover el slider no recalcula
+    superficie = obtener_superficie(operacion)
+    variaciones = np.arange(delta_precio[0], delta_precio[1] + 1, 5)
+    xirr = escenarios_xirr(operacion, fecha_compra).reindex(variaciones).to_numpy()
+    df_escenarios = pd.DataFrame({
+        "Variación Precio Venta": [f"{int(v):+d}%" for v in variaciones],
+        "Precio de Venta (€)": [f"{p:,.0f}" for p in operacion["precio_venta"] * (1 + variaciones / 100)],
+        "ROI (%)": [f"{v:.2f}" for v in superficie.valor("roi", precio=variaciones)],
+        "TIR (%)": [formatear_tir(v) for v in superficie.valor("tir", precio=variaciones)],
+        "XIRR mensual (%)": [formatear_tir(v) for v in xirr],
     })
+    st.table(df_escenarios)
+
+
+# --- MAPA DE SENSIBILIDAD ---
+METRICAS_MAPA = {"ROI (%)": "roi", "TIR (%)": "tir", "Ganancia neta (€)": "ganancia_neta"}
+
+
+@st.fragment
+@medido("seccion.mapa_sensibilidad")
+def seccion_mapa_sensibilidad(operacion):
+    st.subheader("🌡️ Mapa de Sensibilidad: Precio de Venta × Coste de Reforma")
+    superficie = obtener_superficie(operacion)
+    ejes = superficie.ejes
+
+    col1, col2, col3 = st.columns(3)
+    metrica = METRICAS_MAPA[col1.selectbox("Métrica", list(METRICAS_MAPA))]
+    interes = col2.slider("Interés del préstamo (%)", 0.0, float(ejes["interes"][-1]),
+                          float(operacion["interes_prestamo"]), step=0.25)
+    plazo = col3.slider("Plazo (años)", 1, int(ejes["plazo"][-1]), int(operacion["plazo_anios"]))
+
+    import plotly.graph_objects as go
+
+    mapa = superficie.corte(metrica, interes=interes, plazo=plazo)
+    fig = go.Figure(go.Heatmap(x=ejes["precio"], y=ejes["reforma"], z=mapa.T, colorscale="RdYlGn", zmid=0,
+                               colorbar=dict(title=metrica),
+                               hovertemplate="Precio %{x:+.1f}% · Reforma %{y:+.0f}%<br>%{z:,.2f}<extra></extra>"))
+    for nombre, metrica_eq, objetivo, estilo in [
+        ("Sin pérdidas", "ganancia_neta", 0.0, "solid"),
+        (f"ROI {ROI_SUGERIDO:.0f}%", "roi", ROI_SUGERIDO, "dash"),
+    ]:
+        curva = superficie.equilibrio(metrica_eq, objetivo, interes=interes, plazo=plazo)
+        fig.add_scatter(x=curva["precio"], y=curva["reforma"], mode="lines", name=nombre,
+                        line=dict(color="black", dash=estilo))
+    fig.update_layout(xaxis_title="Variación precio de venta (%)", yaxis_title="Variación coste de reforma (%)",
+                      margin=dict(l=20, r=20, t=20, b=20), legend=dict(orientation="h", y=-0.2))
+    st.plotly_chart(fig, use_container_width=True)
+    st.caption(f"Superficie precalculada de {superficie.tamano:,} escenarios "
+               f"({superficie.datos.nbytes / 1e6:.1f} MB): cambiar la métrica, el interés o el plazo no recalcula.")
+
+
+# --- OBJETIVOS DE INVERSIÓN ---
+@st.fragment
+@medido("seccion.objetivos")
+def seccion_objetivos(operacion):
+    st.subheader("🎯 Objetivos de Inversión")
+
+    colo1, colo2, colo3 = st.columns(3)
+    roi_objetivo = colo1.number_input("ROI objetivo (%)", value=ROI_SUGERIDO)
+    prestamo_maximo = colo2.number_input("Préstamo máximo (% de la inversión)", value=80.0)
+    intereses_maximos = colo3.number_input("Intereses máximos (€)", value=0, help="0 = sin límite")
+
+    o = calcular_objetivos(operacion, roi_objetivo, prestamo_maximo, intereses_maximos or None)
+    colp1, colp2 = st.columns(2)
+    colp1.metric("🏠 Precio de compra máximo", f"{o['precio_compra_maximo']:,.0f} €" if pd.notna(o["precio_compra_maximo"]) else "n/d")
+    colp2.metric("⚖️ Precio de venta de equilibrio", f"{o['precio_venta_equilibrio']:,.0f} €" if pd.notna(o["precio_venta_equilibrio"]) else "n/d")
+    colp1.metric("🛠️ Presupuesto máximo de reforma", f"{o['presupuesto_reforma_maximo']:,.0f} €" if pd.notna(o["presupuesto_reforma_maximo"]) else "n/d")
+    colp2.metric("🏦 Préstamo que maximiza la TIR", f"{o['porcentaje_prestamo_optimo']:.0f}%")
+    st.caption(
+        f"Con {o['porcentaje_prestamo_optimo']:.0f}% de préstamo: TIR {formatear_tir(o['tir_optimo'], '%')}, "
+        f"ROI {o['roi_optimo']:.2f}%, intereses {o['intereses_totales_optimo']:,.0f} €"
+    )
+
+
+# --- SIMULACIÓN MONTE CARLO ---
+@st.fragment
+@medido("seccion.montecarlo")
+def seccion_montecarlo(operacion):
+    st.subheader("🎲 Simulación Monte Carlo")
+
+    with st.expander("⚙️ Parámetros de la simulación"):
+        colm1, colm2 = st.columns(2)
+        with colm1:
+            n_tiradas = st.selectbox("Número de tiradas", [10_000, 100_000, 1_000_000], index=1)
+            semilla = st.number_input("Semilla", value=42, step=1)
+        with colm2:
+            dispersion_venta = st.number_input("Desviación precio de venta (%)", value=10.0)
+            dispersion_reforma = st.number_input("Sobrecoste máximo de reforma (%)", value=15.0)
+        mensual = st.checkbox("Evaluar también el flujo mensual (XIRR)", value=False)
+
+    if st.button("▶️ Ejecutar simulación"):
+        inicio_simulacion = time.perf_counter()
+        simulacion = simulacion_montecarlo(
+            operacion, dispersion_venta, dispersion_reforma, n_tiradas, int(semilla), mensual
+        )
+        duracion_simulacion = time.perf_counter() - inicio_simulacion
+
+        colr1, colr2, colr3 = st.columns(3)
+        colr1.metric("Probabilidad de pérdida", f"{simulacion['prob_perdida'] * 100:.1f}%")
+        colr2.metric("ROI medio", f"{simulacion['roi_medio']:.2f}%")
+        colr3.metric("TIR media", formatear_tir(simulacion["tir_medio"], "%"))
+        if mensual:
+            st.metric("XIRR media (flujo mensual)", formatear_tir(simulacion["xirr_medio"], "%"))
+        st.table(simulacion["percentiles"].round(2))
+        st.image(grafico_tornado(simulacion["tornado"]))
+        submuestra = (f"; XIRR sobre las primeras {simulacion['tiradas_xirr']:,}"
+                      if mensual and simulacion["tiradas_xirr"] < n_tiradas else "")
+        st.caption(f"{n_tiradas:,} tiradas en {duracion_simulacion * 1000:.0f} ms (semilla {int(semilla)}{submuestra})")
+
+
+# --- INFORME DE INVERSIÓN ---
+@st.fragment
+@medido("seccion.informe")
+def seccion_informe(operacion, fecha_compra):
+    st.subheader("📄 Informe para inversores")
+    st.caption("Resumen, escenarios, flujo mensual y comparables de la subzona en PDF o Excel.")
+
+    subzona = None if subzona_piso == "Toda la zona" else subzona_piso
+    titulo = st.text_input("Título del informe", value=f"Piso en {subzona or zona} – {superficie} m²")
+    formatos = {"PDF": ("pdf", "application/pdf")}
+    try:
+        import openpyxl  # noqa: F401
+        formatos["Excel"] = ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+    except ImportError:
+        st.caption("Instala openpyxl para exportar también a Excel.")
+
+    # Los ficheros generados solo se ofrecen mientras no cambien las entradas
+    entradas = (tuple(operacion.items()), titulo, fecha_compra, almacen.version(), zona, subzona)
+    if st.button("🖨️ Generar informe"):
+        st.session_state["informe"] = (entradas, {
+            nombre: generar_informe(operacion, titulo, fecha_compra, almacen.version(), zona, subzona, formato)
+            for nombre, (formato, _) in formatos.items()
+        })
+    generado, informe = st.session_state.get("informe", (None, None))
+    if informe and generado == entradas:
+        columnas = st.columns(len(informe))
+        for columna, (nombre, contenido) in zip(columnas, informe.items()):
+            formato, tipo = formatos[nombre]
+            columna.download_button(f"⬇️ Descargar {nombre}", contenido, file_name=f"informe_adco.{formato}", mime=tipo)
+
+
+seccion_escenarios(operacion, fecha_compra)
+seccion_mapa_sensibilidad(operacion)
+seccion_objetivos(operacion)
+seccion_montecarlo(operacion)
+seccion_informe(operacion, fecha_compra)
+
+
+# --- COMPARADOR DE SUBZONAS ---
+@st.cache_resource
+def cola_trabajos():
+    """Cola de trabajos de scraping; el scraping lo hace el proceso trabajador, no la página."""
+    from trabajos_scraping import ColaTrabajos
+
+    return ColaTrabajos()
+
+
+def mostrar_rechazados(rechazados):
+    """Resumen de los anuncios descartados por el parser y su motivo."""
+    if rechazados is None or rechazados.empty:
+        st.caption("Ningún anuncio descartado en este trabajo.")
+        return
+    st.markdown(f"🚫 **{len(rechazados)} anuncios descartados**")
+    st.dataframe(rechazados[["Subzona", "Título", "Precio (€)", "Superficie (m²)", "Motivo"]], hide_index=True)
+
+
+@st.fragment(run_every=5)
+@medido("seccion.trabajos")
+def panel_trabajos():
+    """Estado de la cola en segundo plano; se refresca solo cada pocos segundos."""
+    cola = cola_trabajos()
+    resumen = cola.resumen()
+    activos = cola.trabajadores_activos()
+
+    colt1, colt2, colt3, colt4 = st.columns(4)
+    colt1.metric("Trabajadores activos", len(activos))
+    colt2.metric("En cola", resumen["pendiente"])
+    colt3.metric("En curso", resumen["en_curso"])
+    colt4.metric("Con error", resumen["error"])
+    if activos.empty:
+        st.warning("No hay ningún trabajador en marcha: los trabajos encolados esperarán hasta que se inicie.")
+        if st.button("▶️ Iniciar trabajador"):
+            from trabajos_scraping import iniciar_proceso
+            st.toast(f"Trabajador iniciado (PID {iniciar_proceso()})")
+
+    # El scraping ocurre en el trabajador: la caché se mide por trabajo, no en este proceso
+    tasas = cola.tasas_cache()
+    colc1, colc2, colc3 = st.columns(3)
+    colc1.metric("Aciertos de caché (24 h)", tasas["aciertos"])
+    colc2.metric("Fallos de caché (24 h)", tasas["fallos"])
+    colc3.metric("Tasa de acierto", f"{tasas['tasa_acierto'] * 100:.0f}%")
+
+    tabla = cola.tabla(limite=20)
+    if not tabla.empty:
+        with st.expander("🗂️ Trabajos de scraping", expanded=bool(resumen["pendiente"] or resumen["en_curso"])):
+            seleccion = st.dataframe(
+                tabla[["id", "zona", "subzona", "estado", "progreso", "intentos", "filas", "nuevos",
+                       "cambios_precio", "rechazados", "aciertos_cache", "fallos_cache", "fin", "error"]],
+                column_config={"progreso": st.column_config.ProgressColumn("progreso", min_value=0, max_value=1)},
+                hide_index=True, on_select="rerun", selection_mode="single-row", key="tabla_trabajos",
+            )
+            filas = seleccion.selection.rows
+            if filas:
+                mostrar_rechazados(cola.rechazados(tabla["id"].iloc[filas[0]]))
+            else:
+                st.caption("Selecciona un trabajo para ver los anuncios descartados por el parser.")
+            if resumen["pendiente"] and st.button("✖️ Cancelar pendientes"):
+                cola.cancelar()
+
+    # Al terminar un trabajo hay datos nuevos en el almacén: se recarga la página entera
+    if st.session_state.setdefault("trabajos_hechos", resumen["hecho"]) != resumen["hecho"]:
+        st.session_state["trabajos_hechos"] = resumen["hecho"]
+        st.rerun()
+
+
+@st.fragment
+@medido("seccion.comparables")
+def seccion_comparables():
+    st.title("🏘️ Comparador de Subzonas – Idealista + ADCO")
+    st.caption("Obtén datos precisos de comparables reales por subzona")
+
+    # Selección dinámica
+    zona = st.selectbox("Selecciona zona", list(SUBZONAS_M30.keys()))
+    subzona = st.selectbox("Selecciona subzona", list(SUBZONAS_M30[zona].keys()))
+    paginas = st.number_input("Páginas por subzona", value=2, min_value=1, max_value=60)
+
+    # Los botones solo encolan: el trabajador scrapea en segundo plano y la página lee el almacén
+    col_b1, col_b2 = st.columns(2)
+    if col_b1.button("🔍 Obtener comparables de la subzona"):
+        cola_trabajos().encolar(zona, subzona, int(paginas))
+        st.toast(f"{subzona} en cola")
+    if col_b2.button("🗺️ Actualizar toda la M-30"):
+        st.toast(f"{len(cola_trabajos().encolar_m30(int(paginas)))} subzonas en cola")
+    panel_trabajos()
+
+    stats_cache = cache.estadisticas()
+    st.caption(f"Caché de scraping: {stats_cache['paginas']} páginas ({stats_cache['tamano_bytes'] / 1e6:.1f} MB)")
+
+    # Importar exportaciones grandes (CSV/Parquet) por bloques directamente al almacén
+    with st.expander("📂 Importar exportación de comparables"):
+        fichero = st.file_uploader("CSV o Parquet de comparables", type=["csv", "parquet"])
+        sin_descripcion = st.checkbox("No guardar las descripciones", value=False)
+        if fichero is not None and st.button("⬆️ Importar en el almacén"):
+            from ingesta_comparables import ingerir
+
+            barra = st.progress(0.0, text="Importando...")
+            tamano = max(fichero.size, 1)
+            _, resumen = ingerir(
+                fichero, almacen, zona=zona, formato="parquet" if fichero.name.endswith(".parquet") else "csv",
+                sin_descripcion=sin_descripcion,
+                progreso=lambda filas: barra.progress(min(fichero.tell() / tamano, 1.0), text=f"{filas:,} filas leídas"),
+            )
+            indice.actualizar()
+            st.session_state["resumen_ingesta"] = resumen
+            st.rerun()
+        if "resumen_ingesta" in st.session_state:
+            resumen = st.session_state.pop("resumen_ingesta")
+            st.success(
+                f"{resumen['validas']:,} anuncios válidos ({resumen['nuevos']:,} nuevos, "
+                f"{resumen['rechazados']:,} rechazados) en {resumen['segundos']:.0f} s"
+            )
 
-df_escenarios = pd.DataFrame(escenarios_resultados)
-st.table(df_escenarios)
-
-
-st.title("🏘️ Comparador de Subzonas – Idealista + ADCO")
-st.caption("Obtén datos precisos de comparables reales por subzona")
-
-# Subzonas y URLs
-SUBZONAS_M30 = {
-    "Chamberí": {
-        "Almagro": "https://www.idealista.com/venta-viviendas/madrid/chamberi/almagro/",
-        "Trafalgar": "https://www.idealista.com/venta-viviendas/madrid/chamberi/trafalgar/",
-        "Ríos Rosas": "https://www.idealista.com/venta-viviendas/madrid/chamberi/rios-rosas/",
-        "Arapiles": "https://www.idealista.com/venta-viviendas/madrid/chamberi/arapiles/",
-        "Vallehermoso": "https://www.idealista.com/venta-viviendas/madrid/chamberi/vallehermoso/",
-        "Gaztambide": "https://www.idealista.com/venta-viviendas/madrid/chamberi/gaztambide/"
-    },
-    "Salamanca": {
-        "Recoletos": "https://www.idealista.com/venta-viviendas/madrid/barrio-de-salamanca/recoletos/",
-        "Castellana": "https://www.idealista.com/venta-viviendas/madrid/barrio-de-salamanca/castellana/",
-        "Lista": "https://www.idealista.com/venta-viviendas/madrid/barrio-de-salamanca/lista/",
-        "Goya": "https://www.idealista.com/venta-viviendas/madrid/barrio-de-salamanca/goya/",
-        "Fuente del Berro": "https://www.idealista.com/venta-viviendas/madrid/barrio-de-salamanca/fuente-del-berro/",
-        "Guindalera": "https://www.idealista.com/venta-viviendas/madrid/barrio-de-salamanca/guindalera/"
-    },
-    "Centro": {
-        "Sol": "https://www.idealista.com/venta-viviendas/madrid/centro/sol/",
-        "Chueca Justicia": "https://www.idealista.com/venta-viviendas/madrid/centro/chueca-justicia/",
-        "Malasaña-Universidad": "https://www.idealista.com/venta-viviendas/madrid/centro/malasana-universidad/",
-        "Lavapiés Embajadores": "https://www.idealista.com/venta-viviendas/madrid/centro/lavapies-embajadores/",
-        "Huertas Cortes": "https://www.idealista.com/venta-viviendas/madrid/centro/huertas-cortes/",
-         "Palacio": "https://www.idealista.com/venta-viviendas/madrid/centro/palacio/"
-        
-    }
-}
+    # --- Análisis de la subzona con los datos del almacén (filtrado y paginado en SQLite)
+    # Mediana, media recortada y vallas de atípicos: un anuncio mal parseado no mueve el filtro
+    resumen_subzona = estadisticas_subzona(almacen.version(), zona, subzona)
+    if resumen_subzona["n"]:
+        with st.expander("📊 Análisis de Comparables", expanded=True):
+            colr1, colr2, colr3 = st.columns(3)
+            colr1.metric("📍 Mediana €/m²", f"{resumen_subzona['mediana']:,.0f} €",
+                         help=f"MAD {resumen_subzona['mad']:,.0f} €/m²")
+            colr2.metric("✂️ Media recortada €/m²", f"{resumen_subzona['media_recortada']:,.0f} €")
+            colr3.metric("↔️ P25 – P75 €/m²", f"{resumen_subzona['p25']:,.0f} – {resumen_subzona['p75']:,.0f} €")
+            st.caption(
+                f"{resumen_subzona['n']:,} anuncios · media simple {resumen_subzona['media']:,.0f} €/m² · "
+                f"mínimo {resumen_subzona['minimo']:,.0f} · máximo {resumen_subzona['maximo']:,.0f} · "
+                f"{resumen_subzona['n_atipicos']:,} atípicos fuera de "
+                f"[{resumen_subzona['limite_inferior']:,.0f}, {resumen_subzona['limite_superior']:,.0f}] €/m²"
+            )
 
-# Selección dinámica
-zona = st.selectbox("Selecciona zona", list(SUBZONAS_M30.keys()))
-subzona = st.selectbox("Selecciona subzona", list(SUBZONAS_M30[zona].keys()))
-
-def scrapear_subzona(nombre, url_base):
-    scraperapi_key = "c21a8e492547f96ed694f796c0355091"
-    headers_list = [
-        "Mozilla/5.0 (Windows NT 10.0; Win64; x64)",
-        "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7)",
-        "Mozilla/5.0 (X11; Linux x86_64)"
-    ]
-    propiedades = []
-
-    for page in range(1, 3):
-        time.sleep(random.uniform(1.5, 3.0))
-        params = {
-            "api_key": scraperapi_key,
-            "url": f"{url_base}pagina-{page}.htm"
-        }
-        headers = {
-            "User-Agent": random.choice(headers_list),
-            "Accept-Language": "es-ES,es;q=0.9"
-        }
-        try:
-            response = requests.get("http://api.scraperapi.com", params=params, headers=headers, timeout=20)
-            soup = BeautifulSoup(response.text, "html.parser")
-            items = soup.select(".item-info-container")
-            for item in items:
-                title = item.select_one("a.item-link").get_text(strip=True)
-                price_tag = item.select_one(".item-price")
-                price = price_tag.get_text(strip=True).replace("€", "").replace(".", "") if price_tag else "0"
-                details = item.select(".item-detail")
-                m2 = "0"
-                for detail in details:
-                    text = detail.get_text(strip=True)
-                    if "m²" in text:
-                        m2 = text.split("m²")[0].strip().replace(",", ".")
-                        break
-                link = "https://www.idealista.com" + item.select_one("a.item-link")["href"]
-                try:
-                    m2_val = float(m2) if m2.replace('.', '', 1).isdigit() else 0
-                    price_val = float(price)
-                    eur_m2 = price_val / m2_val if m2_val else 0
-                except:
-                    eur_m2 = 0
-                propiedades.append({
-                    "Subzona": nombre,
-                    "Título": title,
-                    "Precio (€)": price,
-                    "Superficie (m²)": m2,
-                    "€/m²": f"{eur_m2:,.0f}",
-                    "Link": link
-                })
-        except Exception as e:
-            st.warning(f"Error al scrapear {nombre}: {e}")
-
-    return pd.DataFrame(propiedades)
-
-# Botón para lanzar el scraping
-if st.button("🔍 Obtener comparables de la subzona"):
-    with st.spinner("Consultando Idealista..."):
-        url = SUBZONAS_M30[zona][subzona]
-        df = scrapear_subzona(subzona, url)
-        if not df.empty:
-            df["Link"] = df["Link"].apply(lambda x: f"[Ver anuncio]({x})")
-            st.session_state["df_subzona"] = df
-            st.success(f"Se obtuvieron {len(df)} propiedades en {subzona}")
-        else:
-            st.warning("No se encontraron resultados.")
-
-# --- Mostrar análisis si ya hay datos
-# --- Mostrar análisis si ya hay datos
-if "df_subzona" in st.session_state:
-    df_subzona = st.session_state["df_subzona"]
-    
-    with st.expander("📊 Análisis de Comparables", expanded=True):
-        try:
-            df_subzona["€/m²"] = df_subzona["€/m²"].astype(str).str.replace(",", "").astype(float)
-            df_subzona["Superficie (m²)"] = df_subzona["Superficie (m²)"].astype(str).str.replace(",", ".").astype(float)
-
-            promedio = df_subzona["€/m²"].mean()
-            minimo = df_subzona["€/m²"].min()
-            maximo = df_subzona["€/m²"].max()
-
-            st.metric("📍 Promedio €/m²", f"{promedio:,.0f} €")
-            st.metric("📉 Mínimo €/m²", f"{minimo:,.0f} €")
-            st.metric("📈 Máximo €/m²", f"{maximo:,.0f} €")
+            stats_subzona = indice.obtener(zona, subzona)
+            if stats_subzona:
+                st.caption(
+                    f"Índice de mercado {subzona}: mediana {stats_subzona['mediana']:,.0f} €/m², "
+                    f"reformado {stats_subzona['eur_m2_reformado']:,.0f} €/m², "
+                    f"a reformar {stats_subzona['eur_m2_a_reformar']:,.0f} €/m² ({stats_subzona['n']} anuncios)"
+                )
 
             st.subheader("🎛️ Filtro de comparables por €/m²")
+            incluir_atipicos = st.checkbox("Incluir atípicos (rango completo)", value=False)
+            (minimo, maximo), defecto = limites_filtro(resumen_subzona, incluir_atipicos)
             rango = st.slider(
                 "Selecciona el rango €/m²",
                 min_value=int(minimo),
-                max_value=int(maximo),
-                value=(int(minimo), int(maximo)),
-                key="slider_comparables"
+                max_value=int(maximo) + 1,
+                value=(int(defecto[0]), int(defecto[1]) + 1),
+                key=f"slider_comparables_{zona}_{subzona}_{incluir_atipicos}"
             )
+            filtro = {"zona": zona, "subzona": subzona, "eur_m2_min": rango[0], "eur_m2_max": rango[1]}
+            n_filtrados = almacen.resumen_eur_m2(**filtro)["n"]
+
+            colp1, colp2, colp3 = st.columns(3)
+            orden = colp1.selectbox("Ordenar por", ["€/m² ↑", "€/m² ↓", "Precio ↑", "Precio ↓", "Más recientes"])
+            por_pagina = colp2.selectbox("Filas por página", [25, 50, 100], index=1)
+            paginas_tabla = max(1, -(-n_filtrados // por_pagina))
+            pagina = colp3.number_input("Página", value=1, min_value=1, max_value=paginas_tabla)
+
+            columna_orden = {"€/m² ↑": "eur_m2", "€/m² ↓": "-eur_m2", "Precio ↑": "precio",
+                             "Precio ↓": "-precio", "Más recientes": "-primera_vez"}[orden]
+            df_tabla = almacen.consultar(
+                **filtro, orden=columna_orden, limite=por_pagina, desplazamiento=(pagina - 1) * por_pagina,
+                columnas=["titulo", "precio", "superficie", "eur_m2", "habitaciones", "banos", "estado", "link"],
+            )
+            df_tabla["Link"] = df_tabla["Link"].apply(lambda x: f"[Ver anuncio]({x})")
 
-            df_filtrado = df_subzona[(df_subzona["€/m²"] >= rango[0]) & (df_subzona["€/m²"] <= rango[1])]
-            df_filtrado["Link"] = df_filtrado["Link"].apply(lambda x: f"[Ver anuncio]({x})")
-
-            st.write(f"🔎 Se muestran {len(df_filtrado)} propiedades dentro del rango seleccionado.")
-            st.write(df_filtrado.to_markdown(index=False), unsafe_allow_html=True)
-
-        except Exception as e:
-            st.error(f"Error procesando comparables: {e}")
+            st.write(f"🔎 {n_filtrados:,} propiedades dentro del rango seleccionado (página {pagina} de {paginas_tabla}).")
+            st.write(df_tabla.to_markdown(index=False, floatfmt=",.0f"), unsafe_allow_html=True)
 
 
 # --- DASHBOARD DE OPORTUNIDADES INTELIGENTES ---
-st.markdown("## 📊 Captación Inmobiliaria Inteligente")
-
-# Panel superior
-col1, col2, col3 = st.columns(3)
-col1.metric("Oportunidades actuales", len(df_filtrado) if "df_filtrado" in locals() and not df_filtrado.empty else "0")
-col2.metric("Analizadas hoy", 50)
-col3.metric("Precisión del modelo", "92%")
-
-st.markdown("---")
-
-# Gráfico evolución ficticia
-import plotly.express as px
-import pandas as pd
-
-evolucion = pd.DataFrame({
-    "Día": ["L", "M", "X", "J", "V", "S", "D"],
-    "Oportunidades": [5, 10, 8, 11, 12, 11, 13]
-})
-fig = px.line(evolucion, x="Día", y="Oportunidades", markers=True, title="Evolución de oportunidades")
-fig.update_layout(margin=dict(l=20, r=20, t=40, b=20))
-st.plotly_chart(fig, use_container_width=True)
-
-# Filtros inteligentes
-st.subheader("🔍 Oportunidades detectadas")
-colf1, colf2, colf3, colf4 = st.columns(4)
-
-zonas = ["Todas"] + sorted(df_filtrado["Zona"].dropna().unique().tolist()) if "df_filtrado" in locals() and "Zona" in df_filtrado.columns else ["Todas"]
-zona_sel = colf1.selectbox("Zona", zonas)
-
-precios = ["Todas"] + sorted(df_filtrado["Precio"].dropna().unique().tolist()) if "df_filtrado" in locals() and "Precio" in df_filtrado.columns else ["Todas"]
-precio_sel = colf2.selectbox("Precio", precios)
-
-tamanos = ["Todos"] + sorted(df_filtrado["Superficie"].dropna().unique().tolist()) if "df_filtrado" in locals() and "Superficie" in df_filtrado.columns else ["Todos"]
-tamano_sel = colf3.selectbox("Tamaño", tamanos)
-
-rentabilidades = ["Todas"] + sorted(df_filtrado["Rentabilidad"].dropna().unique().tolist()) if "df_filtrado" in locals() and "Rentabilidad" in df_filtrado.columns else ["Todas"]
-rentabilidad_sel = colf4.selectbox("Rentabilidad", rentabilidades)
-
-# Aplicar filtros
-df_oportunidades = df_filtrado.copy() if "df_filtrado" in locals() and not df_filtrado.empty else pd.DataFrame()
-if zona_sel != "Todas" and "Zona" in df_oportunidades.columns:
-    df_oportunidades = df_oportunidades[df_oportunidades["Zona"] == zona_sel]
-if precio_sel != "Todas" and "Precio" in df_oportunidades.columns:
-    df_oportunidades = df_oportunidades[df_oportunidades["Precio"] == precio_sel]
-if tamano_sel != "Todos" and "Superficie" in df_oportunidades.columns:
-    df_oportunidades = df_oportunidades[df_oportunidades["Superficie"] == tamano_sel]
-if rentabilidad_sel != "Todas" and "Rentabilidad" in df_oportunidades.columns:
-    df_oportunidades = df_oportunidades[df_oportunidades["Rentabilidad"] == rentabilidad_sel]
-
-# Exportar y mostrar tabla
-st.download_button("📥 Exportar CSV", df_oportunidades.to_csv(index=False), "oportunidades.csv", "text/csv")
+@st.fragment
+@medido("seccion.oportunidades")
+def seccion_oportunidades(supuestos):
+    st.markdown("## 📊 Captación Inmobiliaria Inteligente")
+
+    # Cribado de todo el almacén con los supuestos del proyecto
+    ranking = cribar_almacen(almacen.version(), indice.version(), supuestos)
+    roi_objetivo = st.number_input("ROI mínimo para considerar oportunidad (%)", value=20.0)
+    oportunidades = ranking[ranking["ROI (%)"] >= roi_objetivo]
+
+    # Panel superior
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Oportunidades actuales", len(oportunidades))
+    col2.metric("Anuncios analizados", len(ranking))
+    col3.metric("ROI mediano", f"{ranking['ROI (%)'].median():.1f}%" if not ranking.empty else "–")
+
+    st.markdown("---")
+
+    # Evolución: anuncios nuevos por día de primera aparición y cuántos son oportunidad
+    if not ranking.empty:
+        import plotly.express as px
+
+        evolucion = pd.DataFrame({
+            "Día": ranking["Primera vez"],
+            "Oportunidad": ranking["ROI (%)"] >= roi_objetivo,
+        }).groupby("Día").agg(Anuncios=("Oportunidad", "size"), Oportunidades=("Oportunidad", "sum")).reset_index()
+        fig = px.line(evolucion, x="Día", y=["Anuncios", "Oportunidades"], markers=True, title="Evolución de oportunidades")
+        fig.update_layout(margin=dict(l=20, r=20, t=40, b=20))
+        st.plotly_chart(fig, use_container_width=True)
+
+    # Filtros inteligentes
+    st.subheader("🔍 Oportunidades detectadas")
+    colf1, colf2, colf3, colf4 = st.columns(4)
+
+    zonas = ["Todas"] + sorted(oportunidades["Zona"].dropna().unique().tolist())
+    zona_sel = colf1.selectbox("Zona", zonas)
+    precio_max = colf2.number_input("Precio máximo (€)", value=0, help="0 = sin límite")
+    superficie_min = colf3.number_input("Superficie mínima (m²)", value=0)
+    rentabilidad_min = colf4.number_input("ROI mínimo (%)", value=float(roi_objetivo))
+
+    # Aplicar filtros
+    df_oportunidades = oportunidades[oportunidades["ROI (%)"] >= rentabilidad_min]
+    if zona_sel != "Todas":
+        df_oportunidades = df_oportunidades[df_oportunidades["Zona"] == zona_sel]
+    if precio_max:
+        df_oportunidades = df_oportunidades[df_oportunidades["Precio compra (€)"] <= precio_max]
+    if superficie_min:
+        df_oportunidades = df_oportunidades[df_oportunidades["Superficie (m²)"] >= superficie_min]
+
+    # Exportar y mostrar tabla
+    st.download_button("📥 Exportar CSV", df_oportunidades.to_csv(index=False), "oportunidades.csv", "text/csv")
+
+    st.dataframe(df_oportunidades.round(2), hide_index=True)
+
+
+# --- CARTERA DE OPERACIONES ---
+@st.fragment
+@medido("seccion.cartera")
+def seccion_cartera(supuestos, fecha_compra):
+    st.markdown("## 💼 Cartera de Operaciones")
+    st.caption("Varias operaciones en paralelo con capital y línea de crédito compartidos: "
+               "el optimizador elige y calendariza las candidatas bajo el tope de capital.")
+
+    origen = st.radio("Candidatas", ["Mejores oportunidades del almacén", "Subir CSV de operaciones"], horizontal=True)
+    if origen == "Subir CSV de operaciones":
+        archivo = st.file_uploader("CSV con una operación por fila (campos del simulador, meses_venta, mes_inicio, zona, nombre)",
+                                   type="csv")
+        if archivo is None:
+            return
+        candidatas = pd.read_csv(archivo)
+    else:
+        from cartera_operaciones import desde_ranking
+
+        colc1, colc2, colc3 = st.columns(3)
+        n_candidatas = colc1.number_input("Nº de candidatas", value=100, min_value=1, max_value=2000)
+        meses_venta = colc2.number_input("Meses hasta la venta", value=12, min_value=1)
+        meses_reforma = colc3.number_input("Meses de obra", value=6, min_value=1)
+        ranking = cribar_almacen(almacen.version(), indice.version(), supuestos)
+        if ranking.empty:
+            st.info("No hay oportunidades en el almacén todavía.")
+            return
+        candidatas = desde_ranking(ranking.head(int(n_candidatas)), supuestos, meses_venta, meses_reforma)
+
+    col1, col2, col3, col4 = st.columns(4)
+    tope_capital = col1.number_input("Tope de capital (€)", value=3_000_000, min_value=0, step=100_000)
+    retraso_maximo = col2.number_input("Retraso máximo (meses)", value=6, min_value=0)
+    linea_credito = col3.number_input("Línea de crédito (€)", value=0, step=50_000)
+    interes_linea = col4.number_input("Interés línea (%)", value=6.0)
+
+    fondos_propios = st.number_input("Fondos propios disponibles (€, 0 = el inversor aporta lo que falte)",
+                                     value=0, step=100_000)
+    resultado = planificar_cartera(candidatas, float(tope_capital), int(retraso_maximo), float(linea_credito),
+                                   interes_linea, fecha_compra, float(fondos_propios) or None)
+    plan, cartera = resultado["plan"], resultado["cartera"]
+    if cartera is None:
+        st.warning("Ninguna candidata cabe bajo el tope de capital.")
+        return
+
+    resumen = cartera["resumen"]
+    if resumen["deficit_maximo"] > 0:
+        st.error(f"Cartera no financiable: faltan hasta €{resumen['deficit_maximo']:,.0f} en el mes "
+                 f"{resumen['mes_deficit']} con los fondos propios y la línea de crédito indicados.")
+    colm1, colm2, colm3, colm4 = st.columns(4)
+    colm1.metric("Operaciones", f"{resumen['operaciones']} de {len(plan)}")
+    colm2.metric("Pico de capital", f"€{resumen['capital_comprometido_maximo']:,.0f}",
+                 help=f"Mes {resumen['mes_pico']} ({resumen['fecha_pico']})")
+    colm3.metric("Ganancia neta", f"€{resumen['ganancia_neta']:,.0f}")
+    colm4.metric("TIR cartera", formatear_tir(resumen["tir"], "%"))
+    if linea_credito or fondos_propios:
+        st.caption(f"Línea de crédito: máximo dispuesto €{resumen['linea_maxima']:,.0f} · intereses "
+                   f"€{resumen['intereses_linea']:,.0f} · TIR del capital propio {formatear_tir(resumen['tir_inversor'], '%')}")
+
+    import plotly.express as px
+
+    mensual = cartera["mensual"]
+    fig = px.area(mensual, x="fecha", y="capital_comprometido", title="Capital comprometido por mes",
+                  labels={"fecha": "Mes", "capital_comprometido": "€"})
+    fig.add_hline(y=tope_capital, line_dash="dash", line_color="red", annotation_text="Tope")
+    fig.update_layout(margin=dict(l=20, r=20, t=40, b=20))
+    st.plotly_chart(fig, use_container_width=True)
+
+    colz1, colz2 = st.columns([2, 1])
+    colz1.dataframe(cartera["operaciones"].round(2), hide_index=True)
+    colz2.dataframe(cartera["zonas"].round(2), hide_index=True)
+    st.caption(f"Concentración por zona (Herfindahl del capital): {resumen['hhi_zonas']:.2f}")
+    st.download_button("📥 Exportar plan CSV", plan.to_csv(index=False), "plan_cartera.csv", "text/csv")
+
+
+supuestos = {
+    "coste_reforma_m2": coste_reforma_m2,
+    "porcentaje_superficie_reforma": superficie_reforma / superficie * 100 if superficie else 100,
+    "costes_adicionales": costes_adicionales,
+    "iva_reforma": iva_reforma,
+    "comision_compra": comision_compra,
+    "gastos_legales": gastos_legales,
+    "gastos_administrativos": gastos_administrativos,
+    "itp": itp,
+    "ibi": ibi,
+    "comision_venta": comision_venta,
+    "porcentaje_prestamo": porcentaje_prestamo,
+    "interes_prestamo": interes_prestamo,
+    "plazo_anios": plazo_anios,
+}
 
-st.dataframe(df_oportunidades)
+seccion_comparables()
+seccion_oportunidades(supuestos)
+seccion_cartera(supuestos, fecha_compra)
 
+# --- TIEMPOS DE EJECUCIÓN ---
+duracion_rerun = (time.perf_counter() - INICIO_RERUN) * 1000
+st.session_state.setdefault("primer_rerun_ms", duracion_rerun)
+st.caption(
+    f"⏱️ Página completa en {duracion_rerun:.0f} ms · primera carga de la sesión "
+    f"{st.session_state['primer_rerun_ms']:.0f} ms (las secciones con controles propios se recalculan por separado)"
+)
 
+if st.sidebar.checkbox("⚙️ Panel de rendimiento"):
+    mostrar_panel(captura)
@@ -8,12 +8,19 @@ import numpy as np
 import matplotlib.pyplot as plt
 import os
 
+from almacen_comparables import AlmacenComparables
+from calculo_tir import tir_flujo_simple
+from instrumentacion import iniciar_captura, mostrar_panel, tramo
+from superficie_escenarios import obtener_superficie
+
+captura = iniciar_captura()
+
 st.set_page_config(page_title="Simulador Pro ADCO", layout="centered")
 st.title("🏘️ Simulador de Flipping Inmobiliario – Versión Avanzada")
 st.caption("Desarrollado por ADCO Investments – andres@adco.es")
 
 # Logo
-st.image("ADCO_LOGO_SIMPLE.png", width=150)
+st.image("ADCO LOGO SIMPLE.png", width=150)
 
 st.header("📥 Datos del Proyecto")
 
@@ -65,48 +72,109 @@ ganancia_neta = precio_venta - comision_venta_eur - inversion_total
 roi = ganancia_neta / inversion_total * 100
 
 # TIR (aproximada solo con flujo neto)
-flujo_neto = [ -inversion_total ] + [ precio_venta - comision_venta_eur ]
-tir = np.irr(flujo_neto) * 100 if flujo_neto[1] > 0 else 0
+tir, tir_convergida = tir_flujo_simple(inversion_total, precio_venta - comision_venta_eur)
+tir = float(tir) * 100
 
 st.metric("ROI total", f"{roi:.2f}%")
-st.metric("TIR estimada", f"{tir:.2f}%")
+st.metric("TIR estimada", f"{tir:.2f}%" if tir_convergida else "n/d")
 
 
 # --- ANÁLISIS DE SENSIBILIDAD ---
 st.subheader("📈 Análisis de Sensibilidad")
 
-variaciones_precio = [-0.15, -0.1, -0.05, 0, 0.05, 0.1, 0.15]
-variaciones_reforma = [-0.1, -0.05, 0, 0.05, 0.1]
-
-resultados = []
-for vp in variaciones_precio:
-    for vr in variaciones_reforma:
-        nuevo_precio_venta = precio_venta * (1 + vp)
-        nuevo_coste_reforma = coste_reforma * (1 + vr)
-        nuevo_total = gastos_total_compra + nuevo_coste_reforma * (1 + iva_reforma / 100)
-        nuevo_ganancia = nuevo_precio_venta - nuevo_precio_venta * comision_venta / 100 - nuevo_total
-        nuevo_roi = nuevo_ganancia / nuevo_total * 100
-        flujo = [ -nuevo_total, nuevo_precio_venta - nuevo_precio_venta * comision_venta / 100 ]
-        nuevo_tir = np.irr(flujo) * 100 if flujo[1] > 0 else 0
-        resultados.append([f"{int(vp*100)}%", f"{int(vr*100)}%", round(nuevo_roi, 2), round(nuevo_tir, 2)])
-
-df_sens = pd.DataFrame(resultados, columns=["ΔPrecio Venta", "ΔCoste Reforma", "ROI (%)", "TIR (%)"])
-st.dataframe(df_sens)
+# Superficie densa precio × reforma (precalculada una vez por conjunto de entradas y cacheada
+# por su hash): el mapa de calor y la tabla son lecturas, no recálculos. Mismo criterio que
+# el ROI de arriba: sin préstamo y TIR a un periodo.
+operacion = {
+    "superficie": superficie, "superficie_reforma": superficie_reforma, "coste_reforma_m2": coste_reforma_m2,
+    "costes_adicionales": costes_adicionales, "iva_reforma": iva_reforma, "precio_compra": precio_compra,
+    "comision_compra": comision_compra, "gastos_legales": gastos_legales,
+    "gastos_administrativos": gastos_administrativos, "itp": itp, "ibi": ibi, "precio_venta": precio_venta,
+    "comision_venta": comision_venta, "porcentaje_prestamo": 0.0, "interes_prestamo": 0.0, "plazo_anios": 1,
+}
+sensibilidad = obtener_superficie(operacion, ejes={
+    "precio": np.arange(-15, 15.1, 0.25), "reforma": np.arange(-10, 10.1, 0.25),
+    "interes": np.array([0.0]), "plazo": np.array([1.0]),
+})
+metrica_mapa = st.radio("Métrica", ["ROI (%)", "TIR (%)"], horizontal=True)
+with tramo("grafico.mapa_sensibilidad"):
+    mapa = sensibilidad.corte("roi" if metrica_mapa == "ROI (%)" else "tir")
+    fig, ax = plt.subplots()
+    ejes = sensibilidad.ejes
+    malla = ax.pcolormesh(ejes["precio"], ejes["reforma"], mapa.T, cmap="RdYlGn", shading="auto")
+    equilibrio = sensibilidad.equilibrio("ganancia_neta", 0.0)
+    ax.plot(equilibrio["precio"], equilibrio["reforma"], color="black", label="Sin pérdidas")
+    ax.set_xlabel("Δ Precio de venta (%)")
+    ax.set_ylabel("Δ Coste de reforma (%)")
+    fig.colorbar(malla, ax=ax, label=metrica_mapa)
+    if equilibrio["precio"].notna().any():
+        ax.legend(loc="upper left")
+    st.pyplot(fig)
+
+with st.expander("Tabla de escenarios"):
+    variaciones_precio = np.array([-0.15, -0.1, -0.05, 0, 0.05, 0.1, 0.15])
+    variaciones_reforma = np.array([-0.1, -0.05, 0, 0.05, 0.1])
+    vp, vr = np.meshgrid(variaciones_precio, variaciones_reforma, indexing="ij")
+    vp, vr = vp.ravel(), vr.ravel()
+    df_sens = pd.DataFrame({
+        "ΔPrecio Venta": [f"{int(round(v * 100))}%" for v in vp],
+        "ΔCoste Reforma": [f"{int(round(v * 100))}%" for v in vr],
+        "ROI (%)": np.round(sensibilidad.valor("roi", precio=vp * 100, reforma=vr * 100), 2),
+        "TIR (%)": np.round(sensibilidad.valor("tir", precio=vp * 100, reforma=vr * 100), 2),
+    })
+    st.dataframe(df_sens)
 
 # --- GRÁFICO BARRAS ---
 st.subheader("📊 Comparación de Costes vs Ganancia")
-fig, ax = plt.subplots()
-ax.bar(["Inversión Total", "Ganancia Neta"], [inversion_total, ganancia_neta], color=["gray", "green"])
-st.pyplot(fig)
+with tramo("grafico.barras"):
+    fig, ax = plt.subplots()
+    ax.bar(["Inversión Total", "Ganancia Neta"], [inversion_total, ganancia_neta], color=["gray", "green"])
+    st.pyplot(fig)
 
-# --- COMPARABLES (CSV dinámico) ---
+# --- COMPARABLES (almacén de comparables) ---
+almacen = AlmacenComparables()
 csv_path = f"comparables_{zona.lower()}.csv"
-if os.path.exists(csv_path):
+if almacen.contar(zona) == 0 and os.path.exists(csv_path):
+    # Migración única del formato anterior (un CSV por zona)
+    almacen.importar_csv(csv_path, zona)
+
+n_comparables = almacen.contar(zona)
+if n_comparables:
     st.subheader(f"🏘️ Comparables en {zona}")
-    df_comp = pd.read_csv(csv_path)
+    # Solo se lee de SQLite la página visible
+    por_pagina = 50
+    total_paginas = max(1, -(-n_comparables // por_pagina))
+    pagina = st.number_input(f"Página (de {total_paginas})", value=1, min_value=1, max_value=total_paginas)
+    df_comp = almacen.consultar(zona=zona, orden="-ultima_vez", limite=por_pagina,
+                                desplazamiento=(pagina - 1) * por_pagina, columnas=[
+        "titulo", "precio", "superficie", "eur_m2", "habitaciones", "banos", "estado", "link", "ultima_vez"
+    ])
     df_comp["Link"] = df_comp["Link"].apply(lambda x: f"<a href='{x}' target='_blank'>Ver anuncio</a>")
     st.write(df_comp.to_html(index=False, escape=False), unsafe_allow_html=True)
 else:
     st.warning(f"No hay comparables para {zona}. Haz scraping o súbelos.")
 
-# Aquí irá el botón de exportación a PDF en versión final
+# --- EXPORTACIÓN ---
+st.subheader("📄 Informe para inversores")
+st.caption("Calculado con el motor completo (incluye la financiación indicada arriba).")
+if st.button("🖨️ Generar informe"):
+    from informes_inversion import GENERADORES, MAX_FILAS_COMPARABLES, datos_informe
+
+    with tramo("informe.datos"):
+        comparables = almacen.consultar(zona=zona, orden="-ultima_vez", limite=MAX_FILAS_COMPARABLES)
+        datos = datos_informe(
+            dict(operacion, porcentaje_prestamo=porcentaje_prestamo, interes_prestamo=interes_prestamo,
+                 plazo_anios=plazo_anios),
+            f"Piso en {zona} – {superficie} m²", comparables=comparables if not comparables.empty else None,
+        )
+    informe = {"pdf": GENERADORES["pdf"](datos)}
+    try:
+        informe["xlsx"] = GENERADORES["xlsx"](datos)
+    except ImportError:
+        st.caption("Instala openpyxl para exportar también a Excel.")
+    columnas = st.columns(len(informe))
+    for columna, (formato, contenido) in zip(columnas, informe.items()):
+        columna.download_button(f"⬇️ Descargar {formato.upper()}", contenido, file_name=f"informe_adco.{formato}")
+
+if st.sidebar.checkbox("⚙️ Panel de rendimiento"):
+    mostrar_panel(captura)
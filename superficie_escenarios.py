@@ -0,0 +1,227 @@
+# ADCO - Superficie de escenarios precalculada
+# Evalúa una sola vez por conjunto de entradas la rejilla densa variación del precio de venta ×
+# variación del coste de reforma × interés × plazo con el motor vectorizado, y la guarda como
+# array NumPy bajo el hash de las entradas (en memoria y en disco, mapeada en memoria si es
+# grande). Sliders, mapas de calor y curvas de equilibrio leen o interpolan la superficie
+# en vez de recalcular.
+
+import hashlib
+import itertools
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from cache_scraping import RUTA_CACHE
+from instrumentacion import contar, medido
+from motor_financiero import CAMPOS_ENTRADA, VALORES_POR_DEFECTO, calcular, preparar_operaciones
+
+RUTA_SUPERFICIES = os.environ.get("ADCO_SUPERFICIES", os.path.join(RUTA_CACHE, "superficies"))
+METRICAS = ("roi", "tir", "ganancia_neta")
+# Cambiarla invalida las superficies guardadas (p. ej. si cambia el motor financiero)
+VERSION = 1
+UMBRAL_MMAP = 32 * 1024 * 1024        # a partir de aquí se lee del disco con np.load(mmap_mode="r")
+TAMANO_MAXIMO_DISCO = 512 * 1024 * 1024
+MAX_EN_MEMORIA = 8
+
+
+def _base(operacion):
+    """Entradas del motor de una operación como floats (sin pasar por pandas si es un dict)."""
+    if not isinstance(operacion, dict):
+        return preparar_operaciones(operacion).iloc[0][CAMPOS_ENTRADA].astype(float).to_dict()
+    base = {campo: float(valor if (valor := operacion.get(campo)) is not None else defecto)
+            for campo, defecto in VALORES_POR_DEFECTO.items()}
+    base["plazo_anios"] = float(max(round(base["plazo_anios"]), 1))
+    return base
+
+
+def ejes_por_defecto(operacion):
+    """
+    Rejilla fina alrededor de la operación: precio de venta y coste de reforma de -30% a +30%
+    (pasos de 0,5 y 1 puntos), interés de 0% a 8% (o el de la operación + 4) en pasos de 0,25
+    y plazo de 1 a 5 años (o el de la operación).
+    """
+    base = _base(operacion)
+    return {
+        "precio": np.arange(-30, 30.25, 0.5),
+        "reforma": np.arange(-30, 31, 1.0),
+        "interes": np.arange(0, max(8.0, base["interes_prestamo"] + 4) + 0.125, 0.25),
+        "plazo": np.arange(1, max(5, int(base["plazo_anios"])) + 1, dtype=float),
+    }
+
+
+def clave(operacion, ejes):
+    """Hash de las entradas del motor y de la rejilla (los campos del modelo mensual no influyen)."""
+    base = _base(operacion)
+    contenido = {
+        "version": VERSION,
+        "operacion": {campo: round(float(base[campo]), 6) for campo in CAMPOS_ENTRADA},
+        "ejes": {eje: np.round(valores, 6).tolist() for eje, valores in ejes.items()},
+    }
+    return hashlib.sha256(json.dumps(contenido, sort_keys=True).encode()).hexdigest()[:24]
+
+
+@medido("superficie.calcular", filas=lambda s: s.tamano)
+def calcular_superficie(operacion, ejes=None):
+    """Evalúa el motor en todos los puntos de la rejilla de una vez (rejillas dispersas + broadcasting)."""
+    ejes = ejes or ejes_por_defecto(operacion)
+    base = _base(operacion)
+    precio, reforma, interes, plazo = np.meshgrid(*ejes.values(), indexing="ij", sparse=True)
+
+    c = {campo: np.float64(base[campo]) for campo in CAMPOS_ENTRADA}
+    c["precio_venta"] = base["precio_venta"] * (1 + precio / 100)
+    c["coste_reforma_m2"] = base["coste_reforma_m2"] * (1 + reforma / 100)
+    c["costes_adicionales"] = base["costes_adicionales"] * (1 + reforma / 100)
+    c["interes_prestamo"] = interes
+    c["plazo_anios"] = plazo
+    r = calcular(c)
+
+    forma = tuple(len(valores) for valores in ejes.values())
+    datos = np.stack([np.broadcast_to(r[metrica], forma).astype(np.float32) for metrica in METRICAS])
+    referencia = {"interes": float(base["interes_prestamo"]), "plazo": float(base["plazo_anios"])}
+    return SuperficieEscenarios(ejes, datos, referencia, clave(operacion, ejes))
+
+
+class SuperficieEscenarios:
+    """Métricas del motor (METRICAS × precio × reforma × interés × plazo) con interpolación multilineal."""
+
+    def __init__(self, ejes, datos, referencia=None, clave=None):
+        self.ejes = {eje: np.asarray(valores, dtype=float) for eje, valores in ejes.items()}
+        self.datos = datos
+        self.referencia = {"precio": 0.0, "reforma": 0.0, **(referencia or {})}
+        self.clave = clave
+
+    @property
+    def tamano(self):
+        return int(np.prod(self.datos.shape[1:]))
+
+    def _posicion(self, eje, valores):
+        """Índice inferior y peso del superior de cada valor en el eje (fuera de rango se satura)."""
+        x = self.ejes[eje]
+        valores = np.asarray(valores, dtype=float)
+        if len(x) == 1:
+            return np.zeros(valores.shape, dtype=int), np.zeros(valores.shape)
+        i = np.clip(np.searchsorted(x, valores) - 1, 0, len(x) - 2)
+        peso = np.clip((valores - x[i]) / (x[i + 1] - x[i]), 0.0, 1.0)
+        return i, peso
+
+    def valor(self, metrica, **puntos):
+        """
+        Métrica interpolada en los puntos dados (escalares o arrays que se combinan por
+        broadcasting). Los ejes no indicados toman el valor de la operación: variación 0
+        de precio y reforma y su interés y plazo.
+        """
+        datos = self.datos[METRICAS.index(metrica)]
+        valores = np.broadcast_arrays(*[np.asarray(puntos.get(eje, self.referencia[eje]), dtype=float)
+                                        for eje in self.ejes])
+        posiciones = [self._posicion(eje, v) for eje, v in zip(self.ejes, valores)]
+        resultado = np.zeros(valores[0].shape)
+        for esquina in itertools.product((0, 1), repeat=len(posiciones)):
+            indices, peso = [], 1.0
+            for arriba, (i, w), n in zip(esquina, posiciones, datos.shape):
+                indices.append(np.minimum(i + arriba, n - 1))
+                peso = peso * (w if arriba else 1 - w)
+            resultado += peso * datos[tuple(indices)]
+        return resultado
+
+    def corte(self, metrica, **fijos):
+        """Mapa precio × reforma (filas × columnas) con interés y plazo fijos, para mapas de calor."""
+        return self.valor(metrica, precio=self.ejes["precio"][:, None], reforma=self.ejes["reforma"][None, :],
+                          **{eje: v for eje, v in fijos.items() if eje in ("interes", "plazo")})
+
+    def equilibrio(self, metrica="ganancia_neta", objetivo=0.0, **fijos):
+        """
+        Curva de equilibrio: para cada variación de reforma, la variación del precio de venta
+        (interpolada) con la que la métrica alcanza el objetivo. NaN si no se alcanza en la rejilla.
+        """
+        mapa = self.corte(metrica, **fijos)
+        precio = self.ejes["precio"]
+        encima = mapa >= objetivo
+        k = np.argmax(encima, axis=0)
+        columnas = np.arange(mapa.shape[1])
+        anterior = np.maximum(k - 1, 0)
+        y0, y1 = mapa[anterior, columnas], mapa[k, columnas]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            cruce = precio[anterior] + (objetivo - y0) / (y1 - y0) * (precio[k] - precio[anterior])
+        cruce = np.where(encima.any(axis=0) & (k > 0), cruce, np.nan)
+        return pd.DataFrame({"reforma": self.ejes["reforma"], "precio": cruce})
+
+    # --- PERSISTENCIA ---
+
+    def guardar(self, carpeta=RUTA_SUPERFICIES):
+        """Guarda datos (.npy) y ejes (.json) con reemplazo atómico."""
+        os.makedirs(carpeta, exist_ok=True)
+        base = os.path.join(carpeta, self.clave)
+        temporal = f"{base}.{os.getpid()}.tmp.npy"
+        np.save(temporal, np.ascontiguousarray(self.datos))
+        os.replace(temporal, f"{base}.npy")
+        with open(f"{base}.json.tmp", "w", encoding="utf-8") as f:
+            json.dump({"ejes": {eje: v.tolist() for eje, v in self.ejes.items()}, "metricas": METRICAS,
+                       "referencia": self.referencia}, f)
+        os.replace(f"{base}.json.tmp", f"{base}.json")
+
+    @classmethod
+    def cargar(cls, clave, carpeta=RUTA_SUPERFICIES):
+        """Lee una superficie guardada (mapeada en memoria si supera UMBRAL_MMAP) o None."""
+        base = os.path.join(carpeta, clave)
+        try:
+            with open(f"{base}.json", encoding="utf-8") as f:
+                meta = json.load(f)
+            grande = os.path.getsize(f"{base}.npy") > UMBRAL_MMAP
+            datos = np.load(f"{base}.npy", mmap_mode="r" if grande else None)
+        except (OSError, ValueError):
+            return None
+        if tuple(meta["metricas"]) != METRICAS:
+            return None
+        os.utime(f"{base}.npy")
+        return cls(meta["ejes"], datos, meta["referencia"], clave)
+
+
+def limpiar(carpeta=RUTA_SUPERFICIES, tamano_maximo=TAMANO_MAXIMO_DISCO):
+    """Borra las superficies usadas hace más tiempo hasta quedar por debajo de tamano_maximo."""
+    if not os.path.isdir(carpeta):
+        return
+    ficheros = [os.path.join(carpeta, f) for f in os.listdir(carpeta) if f.endswith(".npy")]
+    ficheros.sort(key=os.path.getmtime, reverse=True)
+    total = 0
+    for ruta in ficheros:
+        total += os.path.getsize(ruta)
+        if total > tamano_maximo:
+            for extension in (".npy", ".json"):
+                try:
+                    os.remove(ruta[:-4] + extension)
+                except OSError:
+                    pass
+
+
+_memoria = OrderedDict()
+_lock = threading.Lock()
+
+
+def obtener_superficie(operacion, ejes=None, carpeta=RUTA_SUPERFICIES):
+    """
+    Superficie de la operación: de memoria (últimas MAX_EN_MEMORIA), del disco o calculada
+    y guardada. Cuenta "cache.superficie.llamadas/fallos" para el panel de rendimiento.
+    """
+    ejes = ejes or ejes_por_defecto(operacion)
+    k = clave(operacion, ejes)
+    contar("cache.superficie.llamadas")
+    with _lock:
+        if k in _memoria:
+            _memoria.move_to_end(k)
+            return _memoria[k]
+    superficie = SuperficieEscenarios.cargar(k, carpeta) if carpeta else None
+    if superficie is None:
+        contar("cache.superficie.fallos")
+        superficie = calcular_superficie(operacion, ejes)
+        if carpeta:
+            superficie.guardar(carpeta)
+            limpiar(carpeta)
+    with _lock:
+        _memoria[k] = superficie
+        while len(_memoria) > MAX_EN_MEMORIA:
+            _memoria.popitem(last=False)
+    return superficie
@@ -0,0 +1,25 @@
+# ADCO - Pruebas de la búsqueda de objetivos
+
+import pandas as pd
+
+from busqueda_objetivos import precio_compra_maximo, precio_venta_equilibrio
+from motor_financiero import VALORES_POR_DEFECTO, evaluar_operaciones
+
+
+def operaciones():
+    return pd.DataFrame([
+        dict(VALORES_POR_DEFECTO),
+        dict(VALORES_POR_DEFECTO, precio_venta=600_000.0, porcentaje_prestamo=70.0, interes_prestamo=4.0, plazo_anios=2),
+    ])
+
+
+def test_precio_compra_maximo_da_el_roi_objetivo():
+    df = operaciones()
+    df["precio_compra"] = precio_compra_maximo(df, roi_objetivo=20.0)
+    assert (evaluar_operaciones(df)["roi"] - 20.0).abs().max() < 0.01
+
+
+def test_precio_venta_de_equilibrio_sin_ganancia():
+    df = operaciones()
+    df["precio_venta"] = precio_venta_equilibrio(df)
+    assert evaluar_operaciones(df)["ganancia_neta"].abs().max() < 2.0
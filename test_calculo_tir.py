@@ -0,0 +1,41 @@
+# ADCO - Pruebas de la TIR y la XIRR vectorizadas
+
+import numpy as np
+
+from calculo_tir import tir, tir_flujo_simple, tir_vectorizada, xirr_vectorizada
+
+
+def test_tir_cerrada_coincide_con_newton():
+    capital = np.array([100_000.0, 250_000.0, 80_000.0])
+    ingreso = np.array([130_000.0, 240_000.0, 200_000.0])
+    periodos = 3
+    cerrada, convergida = tir_flujo_simple(capital, ingreso, periodos)
+
+    flujos = np.zeros((len(capital), periodos + 1))
+    flujos[:, 0], flujos[:, -1] = -capital, ingreso
+    newton, convergida_newton = tir_vectorizada(flujos)
+
+    assert convergida.all() and convergida_newton.all()
+    np.testing.assert_allclose(cerrada, newton, rtol=1e-8)
+
+    valor, convergida = tir([-100.0, 0.0, 121.0])
+    assert convergida and abs(valor - 0.1) < 1e-12
+
+
+def test_tir_sin_cambio_de_signo_no_converge():
+    valor, convergida = tir_vectorizada([[-100.0, -10.0, -5.0]])
+    assert np.isnan(valor[0]) and not convergida[0]
+
+
+def test_xirr_de_un_flujo_conocido():
+    # Ejemplo de la documentación de XIRR de Excel: 0,373362535
+    fechas = ["2008-01-01", "2008-03-01", "2008-10-30", "2009-02-15", "2009-04-01"]
+    flujos = [[-10_000.0, 2_750.0, 4_250.0, 3_250.0, 2_750.0]]
+    xirr, convergida = xirr_vectorizada(flujos, fechas)
+    assert convergida[0]
+    assert abs(xirr[0] - 0.373362535) < 1e-8
+
+
+def test_xirr_de_un_anio_exacto_es_la_rentabilidad():
+    xirr, _ = xirr_vectorizada([[-1_000.0, 1_100.0]], ["2023-01-01", "2024-01-01"])
+    assert abs(xirr[0] - 0.10) < 1e-10
@@ -0,0 +1,34 @@
+# ADCO - Pruebas de la optimización de cartera
+
+from itertools import combinations
+
+import numpy as np
+
+from cartera_operaciones import mochila
+
+
+def fuerza_bruta(valores, pesos, capacidad):
+    mejor = 0.0
+    for k in range(len(valores) + 1):
+        for elegidos in combinations(range(len(valores)), k):
+            if sum(pesos[i] for i in elegidos) <= capacidad:
+                mejor = max(mejor, sum(valores[i] for i in elegidos))
+    return mejor
+
+
+def test_mochila_coincide_con_fuerza_bruta():
+    rng = np.random.default_rng(7)
+    for _ in range(20):
+        n = int(rng.integers(1, 11))
+        valores = rng.uniform(-10, 100, n).round(2)
+        pesos = rng.integers(1, 60, n)
+        capacidad = 100
+        # Con resolución = capacidad y pesos enteros el redondeo no pierde nada
+        elegidos = mochila(valores, pesos, capacidad, resolucion=capacidad)
+        assert pesos[elegidos].sum() <= capacidad
+        assert abs(valores[elegidos].sum() - fuerza_bruta(valores, pesos, capacidad)) < 1e-9
+
+
+def test_mochila_sin_capacidad_no_elige_nada():
+    for capacidad in (0, -1_000):
+        assert not mochila([10.0, 5.0], [1.0, 2.0], capacidad).any()
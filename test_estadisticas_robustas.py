@@ -0,0 +1,51 @@
+# ADCO - Pruebas de las estadísticas robustas de €/m²
+
+import numpy as np
+import pandas as pd
+
+from estadisticas_robustas import RECORTE, agregar_robusto, marcar_atipicos
+
+
+def datos(semilla=3):
+    rng = np.random.default_rng(semilla)
+    n = 2_000
+    df = pd.DataFrame({
+        "zona": rng.choice(["Centro", "Retiro", "Salamanca"], n),
+        "subzona": rng.choice(["A", "B", "C", "D"], n),
+        "eur_m2": rng.lognormal(8.5, 0.3, n),
+    })
+    df.loc[rng.choice(n, 20, replace=False), "eur_m2"] = 2_066_666.0  # anuncios mal parseados
+    df.loc[rng.choice(n, 10, replace=False), "eur_m2"] = np.nan
+    # Grupos pequeños, donde el recorte por cola es 0 o 1 valor
+    pequenos = pd.DataFrame({"zona": "Usera", "subzona": ["E"] * 7 + ["F"] * 13, "eur_m2": np.arange(20) * 100.0 + 2_000})
+    return pd.concat([df, pequenos], ignore_index=True)
+
+
+def recortada(valores):
+    ordenados = np.sort(valores.to_numpy())
+    k = int(np.floor(RECORTE * len(ordenados) + 1e-9))
+    return ordenados[k:len(ordenados) - k].mean()
+
+
+def test_estadisticos_coinciden_con_pandas():
+    df = datos()
+    stats = agregar_robusto(df).set_index(["zona", "subzona"]).sort_index()
+    grupos = df.dropna(subset=["eur_m2"]).groupby(["zona", "subzona"])["eur_m2"]
+
+    np.testing.assert_array_equal(stats["n"], grupos.size())
+    np.testing.assert_allclose(stats["media"], grupos.mean())
+    np.testing.assert_allclose(stats["mediana"], grupos.median())
+    np.testing.assert_allclose(stats["p25"], grupos.quantile(0.25))
+    np.testing.assert_allclose(stats["p90"], grupos.quantile(0.90))
+    np.testing.assert_allclose(stats["mad"], grupos.apply(lambda v: (v - v.median()).abs().median()))
+    np.testing.assert_allclose(stats["media_recortada"], grupos.apply(recortada))
+
+
+def test_atipicos_fuera_de_las_vallas_de_tukey():
+    df = datos()
+    marcas = marcar_atipicos(df)
+    grupos = df.groupby(["zona", "subzona"])["eur_m2"]
+    p25, p75 = grupos.transform(lambda v: v.quantile(0.25)), grupos.transform(lambda v: v.quantile(0.75))
+    esperadas = (df["eur_m2"] < p25 - 1.5 * (p75 - p25)) | (df["eur_m2"] > p75 + 1.5 * (p75 - p25))
+    pd.testing.assert_series_equal(marcas, esperadas, check_names=False)
+    assert marcas[df["eur_m2"] == 2_066_666.0].all()
@@ -0,0 +1,33 @@
+# ADCO - Pruebas del índice de mercado
+
+import pandas as pd
+
+from almacen_comparables import AlmacenComparables
+from indice_mercado import IndiceMercado
+
+
+def anuncios(n, precio):
+    return pd.DataFrame({
+        "Título": [f"Piso en Almagro, Madrid {i}" for i in range(n)],
+        "Precio (€)": [precio + 1000 * i for i in range(n)],
+        "Superficie (m²)": [80] * n,
+        "Estado": ["Reformado"] * n,
+        "Descripción": [""] * n,
+        "Link": [f"https://www.idealista.com/inmueble/{precio + i}/" for i in range(n)],
+        "Subzona": ["Almagro"] * n,
+    })
+
+
+def test_el_indice_se_recarga_si_lo_actualiza_otro_proceso(tmp_path):
+    ruta = str(tmp_path / "almacen.sqlite")
+    servidor = IndiceMercado(AlmacenComparables(ruta))
+    assert servidor.obtener("Chamberí") is None
+
+    # El trabajador tiene su propia instancia sobre el mismo fichero
+    trabajador = IndiceMercado(AlmacenComparables(ruta))
+    trabajador.almacen.actualizar(anuncios(5, 400_000), zona="Chamberí")
+    trabajador.actualizar()
+
+    assert servidor.obtener("Chamberí")["n"] == 5
+    assert servidor.obtener("Chamberí", "Almagro")["n"] == 5
+    assert servidor.version() == trabajador.version() == 1
@@ -0,0 +1,35 @@
+# ADCO - Pruebas de la cola de trabajos de scraping
+
+import time
+
+from scraper_idealista import SUBZONAS_M30
+from trabajos_scraping import CANCELADO, ERROR, MAX_INTENTOS, ColaTrabajos
+
+TOTAL_SUBZONAS = sum(len(urls) for urls in SUBZONAS_M30.values())
+
+
+def test_cancelados_no_se_reprograman(tmp_path):
+    cola = ColaTrabajos(str(tmp_path / "trabajos.sqlite"))
+    assert len(cola.programar_refrescos()) == TOTAL_SUBZONAS
+    assert cola.cancelar() == TOTAL_SUBZONAS
+
+    assert cola.programar_refrescos() == []
+    assert cola.resumen()["pendiente"] == 0
+    assert cola.resumen()[CANCELADO] == TOTAL_SUBZONAS
+
+    # Pasado el intervalo vuelven a programarse
+    assert len(cola.programar_refrescos(ahora=time.time() + 25 * 3600)) == TOTAL_SUBZONAS
+
+
+def test_errores_no_se_reintentan_sin_fin(tmp_path):
+    cola = ColaTrabajos(str(tmp_path / "trabajos.sqlite"))
+    zona, urls = next(iter(SUBZONAS_M30.items()))
+    subzona = next(iter(urls))
+    id_trabajo = cola.encolar(zona, subzona)
+    with cola._conectar() as con:
+        con.execute("UPDATE trabajos SET intentos = ? WHERE id = ?", (MAX_INTENTOS, id_trabajo))
+    assert cola.fallar(id_trabajo, "sin respuesta") == ERROR
+
+    assert subzona not in set(cola.tabla(limite=1000, estados=["pendiente"])["subzona"])
+    cola.programar_refrescos()
+    assert subzona not in set(cola.tabla(limite=1000, estados=["pendiente"])["subzona"])
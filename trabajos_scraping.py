@@ -0,0 +1,503 @@
+# ADCO - Cola de trabajos de scraping en segundo plano
+# Cola en SQLite con un trabajo por subzona (estado, progreso, reintentos y errores), un
+# programador que encola el refresco periódico de todas las subzonas de la M-30 y un
+# trabajador que corre en su propio proceso, de modo que las páginas solo leen resultados.
+#
+# Uso:
+#   python trabajos_scraping.py trabajar --intervalo-horas 24 --ventana 1-7   # proceso trabajador
+#   python trabajos_scraping.py encolar --m30 --paginas 5
+#   python trabajos_scraping.py encolar --zona Chamberí --subzona Almagro
+#   python trabajos_scraping.py estado
+
+import argparse
+import os
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+import pandas as pd
+
+from almacen_comparables import RUTA_ALMACEN
+
+RUTA_TRABAJOS = os.environ.get("ADCO_TRABAJOS", os.path.join(os.path.dirname(RUTA_ALMACEN), "trabajos.sqlite"))
+
+PENDIENTE = "pendiente"
+EN_CURSO = "en_curso"
+HECHO = "hecho"
+ERROR = "error"
+CANCELADO = "cancelado"
+ACTIVOS = (PENDIENTE, EN_CURSO)
+
+MAX_INTENTOS = 3
+ESPERA_REINTENTO = 60.0          # segundos antes del primer reintento (se duplica en cada uno)
+LATIDO_CADUCADO = 120.0          # un trabajo en curso sin latido en este tiempo se da por perdido
+INTERVALO_REFRESCO_HORAS = 24.0
+PAGINAS_POR_DEFECTO = 2
+
+
+def _fecha_local(segundos):
+    """Marcas de tiempo (segundos epoch) como fechas locales sin zona horaria."""
+    return pd.to_datetime(segundos.map(lambda t: datetime.fromtimestamp(t) if pd.notna(t) else None))
+
+
+class ColaTrabajos:
+    """Cola persistente de trabajos de scraping compartida por el trabajador y las páginas."""
+
+    def __init__(self, ruta=None):
+        self.ruta = ruta or RUTA_TRABAJOS
+        os.makedirs(os.path.dirname(self.ruta) or ".", exist_ok=True)
+        with self._conectar() as con:
+            con.executescript("""
+                CREATE TABLE IF NOT EXISTS trabajos (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    lote TEXT,
+                    origen TEXT NOT NULL,
+                    zona TEXT,
+                    subzona TEXT NOT NULL,
+                    paginas INTEGER NOT NULL,
+                    estado TEXT NOT NULL,
+                    creado REAL NOT NULL,
+                    programado REAL NOT NULL,
+                    inicio REAL,
+                    fin REAL,
+                    latido REAL,
+                    progreso REAL NOT NULL DEFAULT 0,
+                    intentos INTEGER NOT NULL DEFAULT 0,
+                    trabajador TEXT,
+                    filas INTEGER,
+                    nuevos INTEGER,
+                    cambios_precio INTEGER,
+                    rechazados INTEGER,
+                    errores_pagina INTEGER,
+                    aciertos_cache INTEGER,
+                    fallos_cache INTEGER,
+                    error TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_trabajos_estado ON trabajos (estado, programado);
+                CREATE INDEX IF NOT EXISTS idx_trabajos_subzona ON trabajos (subzona, estado, fin);
+                CREATE TABLE IF NOT EXISTS rechazados (
+                    id_trabajo INTEGER NOT NULL,
+                    subzona TEXT,
+                    titulo TEXT,
+                    precio REAL,
+                    superficie REAL,
+                    motivo TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_rechazados_trabajo ON rechazados (id_trabajo);
+                CREATE TABLE IF NOT EXISTS trabajadores (
+                    nombre TEXT PRIMARY KEY,
+                    pid INTEGER,
+                    inicio REAL NOT NULL,
+                    latido REAL NOT NULL,
+                    trabajo INTEGER
+                );
+            """)
+            columnas = {fila[1] for fila in con.execute("PRAGMA table_info(trabajos)")}
+            for columna in ("aciertos_cache", "fallos_cache"):
+                if columna not in columnas:
+                    con.execute(f"ALTER TABLE trabajos ADD COLUMN {columna} INTEGER")
+
+    @contextmanager
+    def _conectar(self):
+        con = sqlite3.connect(self.ruta, timeout=30)
+        con.row_factory = sqlite3.Row
+        try:
+            con.execute("PRAGMA journal_mode=WAL")
+            with con:
+                yield con
+        finally:
+            con.close()
+
+    # --- ENCOLAR ---
+
+    def encolar(self, zona, subzona, paginas=PAGINAS_POR_DEFECTO, origen="manual", lote=None, cuando=None):
+        """
+        Encola el scraping de una subzona y devuelve el ID del trabajo. Si ya hay uno
+        pendiente o en curso para la subzona se devuelve ese (no se duplican trabajos).
+        """
+        ahora = time.time()
+        with self._conectar() as con:
+            fila = con.execute(
+                f"SELECT id FROM trabajos WHERE subzona = ? AND estado IN ({', '.join('?' * len(ACTIVOS))})",
+                (subzona, *ACTIVOS),
+            ).fetchone()
+            if fila is not None:
+                return fila["id"]
+            cursor = con.execute(
+                "INSERT INTO trabajos (lote, origen, zona, subzona, paginas, estado, creado, programado) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (lote, origen, zona, subzona, int(paginas), PENDIENTE, ahora, cuando or ahora),
+            )
+            return cursor.lastrowid
+
+    def encolar_m30(self, paginas=PAGINAS_POR_DEFECTO, subzonas=None, origen="manual"):
+        """Encola todas las subzonas de la M-30 (o las de {zona: {subzona: url}}) en un mismo lote."""
+        from scraper_idealista import SUBZONAS_M30
+
+        lote = uuid.uuid4().hex[:8]
+        return [
+            self.encolar(zona, subzona, paginas, origen=origen, lote=lote)
+            for zona, urls in (subzonas or SUBZONAS_M30).items() for subzona in urls
+        ]
+
+    def programar_refrescos(self, intervalo_horas=INTERVALO_REFRESCO_HORAS, paginas=PAGINAS_POR_DEFECTO,
+                            ventana=None, ahora=None):
+        """
+        Encola las subzonas de la M-30 cuyo último trabajo terminado (hecho, cancelado o
+        con error) tiene más de intervalo_horas. Con ventana=(hora_inicio, hora_fin) solo se programa dentro de
+        esa franja horaria local (p. ej. (1, 7) para refrescar de madrugada).
+        Devuelve los IDs encolados.
+        """
+        from scraper_idealista import SUBZONAS_M30
+
+        ahora = ahora or time.time()
+        if ventana is not None:
+            hora = datetime.fromtimestamp(ahora).hour
+            inicio, fin = ventana
+            dentro = inicio <= hora < fin if inicio <= fin else (hora >= inicio or hora < fin)
+            if not dentro:
+                return []
+        limite = ahora - intervalo_horas * 3600
+        # Tampoco se reprograma lo cancelado a mano ni lo que agotó sus reintentos dentro del
+        # intervalo: si no, "Cancelar pendientes" se deshace en la siguiente vuelta del trabajador
+        # y una subzona que siempre falla gasta créditos de ScraperAPI sin fin
+        terminados = (HECHO, CANCELADO, ERROR)
+        with self._conectar() as con:
+            recientes = {
+                fila["subzona"] for fila in con.execute(
+                    f"SELECT DISTINCT subzona FROM trabajos WHERE (estado IN ({', '.join('?' * len(terminados))}) "
+                    f"AND fin >= ?) OR estado IN ({', '.join('?' * len(ACTIVOS))})",
+                    (*terminados, limite, *ACTIVOS),
+                )
+            }
+        lote = uuid.uuid4().hex[:8]
+        return [
+            self.encolar(zona, subzona, paginas, origen="programado", lote=lote, cuando=ahora)
+            for zona, urls in SUBZONAS_M30.items() for subzona in urls if subzona not in recientes
+        ]
+
+    # --- CICLO DE VIDA DE UN TRABAJO (lo usa el trabajador) ---
+
+    def tomar(self, trabajador):
+        """Reserva el siguiente trabajo pendiente para el trabajador (dict) o None si no hay."""
+        ahora = time.time()
+        with self._conectar() as con:
+            # Trabajos de trabajadores caídos: vuelven a la cola
+            con.execute(
+                "UPDATE trabajos SET estado = ?, trabajador = NULL WHERE estado = ? AND latido < ?",
+                (PENDIENTE, EN_CURSO, ahora - LATIDO_CADUCADO),
+            )
+            fila = con.execute(
+                "UPDATE trabajos SET estado = ?, trabajador = ?, inicio = ?, latido = ?, progreso = 0, "
+                "intentos = intentos + 1 WHERE id = (SELECT id FROM trabajos WHERE estado = ? AND programado <= ? "
+                "ORDER BY origen = 'programado', programado, id LIMIT 1) RETURNING *",
+                (EN_CURSO, trabajador, ahora, ahora, PENDIENTE, ahora),
+            ).fetchone()
+        return dict(fila) if fila is not None else None
+
+    def avanzar(self, id_trabajo, progreso):
+        """Actualiza el progreso (0-1) y el latido de un trabajo en curso."""
+        with self._conectar() as con:
+            con.execute("UPDATE trabajos SET progreso = ?, latido = ? WHERE id = ?",
+                        (float(progreso), time.time(), id_trabajo))
+
+    def terminar(self, id_trabajo, resultado):
+        """Marca un trabajo como hecho con su resumen (filas, nuevos, cambios_precio...)."""
+        with self._conectar() as con:
+            con.execute(
+                "UPDATE trabajos SET estado = ?, fin = ?, latido = ?, progreso = 1, filas = ?, nuevos = ?, "
+                "cambios_precio = ?, rechazados = ?, errores_pagina = ?, aciertos_cache = ?, fallos_cache = ?, "
+                "error = ? WHERE id = ?",
+                (HECHO, time.time(), time.time(), resultado.get("filas", 0), resultado.get("nuevos", 0),
+                 resultado.get("cambios_precio", 0), resultado.get("rechazados", 0),
+                 resultado.get("errores_pagina", 0), resultado.get("aciertos_cache", 0),
+                 resultado.get("fallos_cache", 0), resultado.get("error"), id_trabajo),
+            )
+
+    def fallar(self, id_trabajo, error):
+        """
+        Registra el error de un trabajo. Si le quedan intentos vuelve a la cola con espera
+        exponencial; si no, queda en estado error. Devuelve el nuevo estado.
+        """
+        ahora = time.time()
+        with self._conectar() as con:
+            intentos = con.execute("SELECT intentos FROM trabajos WHERE id = ?", (id_trabajo,)).fetchone()["intentos"]
+            if intentos < MAX_INTENTOS:
+                estado, fin = PENDIENTE, None
+                programado = ahora + ESPERA_REINTENTO * 2 ** (intentos - 1)
+            else:
+                estado, fin, programado = ERROR, ahora, ahora
+            con.execute(
+                "UPDATE trabajos SET estado = ?, fin = ?, programado = ?, trabajador = NULL, error = ? WHERE id = ?",
+                (estado, fin, programado, str(error), id_trabajo),
+            )
+        return estado
+
+    def cancelar(self, id_trabajo=None):
+        """Cancela un trabajo pendiente (o todos los pendientes). Devuelve cuántos se cancelaron."""
+        with self._conectar() as con:
+            if id_trabajo is None:
+                cursor = con.execute("UPDATE trabajos SET estado = ?, fin = ? WHERE estado = ?",
+                                     (CANCELADO, time.time(), PENDIENTE))
+            else:
+                cursor = con.execute("UPDATE trabajos SET estado = ?, fin = ? WHERE estado = ? AND id = ?",
+                                     (CANCELADO, time.time(), PENDIENTE, id_trabajo))
+            return cursor.rowcount
+
+    def limpiar(self, dias=30):
+        """Borra los trabajos terminados hace más de `dias` días (y sus anuncios rechazados)."""
+        with self._conectar() as con:
+            borrados = con.execute(
+                f"DELETE FROM trabajos WHERE estado NOT IN ({', '.join('?' * len(ACTIVOS))}) AND fin < ?",
+                (*ACTIVOS, time.time() - dias * 86400),
+            ).rowcount
+            con.execute("DELETE FROM rechazados WHERE id_trabajo NOT IN (SELECT id FROM trabajos)")
+            return borrados
+
+    def guardar_rechazados(self, id_trabajo, rechazados):
+        """Guarda los anuncios descartados por el parser en un trabajo, con su motivo."""
+        columnas = ["Subzona", "Título", "Precio (€)", "Superficie (m²)", "Motivo"]
+        rechazados = rechazados.reindex(columns=columnas).astype(object)
+        filas = rechazados.where(rechazados.notna(), None).itertuples(index=False)
+        with self._conectar() as con:
+            # Un reintento sustituye lo guardado por el intento anterior
+            con.execute("DELETE FROM rechazados WHERE id_trabajo = ?", (id_trabajo,))
+            con.executemany("INSERT INTO rechazados VALUES (?, ?, ?, ?, ?, ?)",
+                            [(id_trabajo, *fila) for fila in filas])
+
+    def rechazados(self, id_trabajo):
+        """Anuncios descartados en un trabajo (columnas de la app y "Motivo")."""
+        with self._conectar() as con:
+            return pd.read_sql_query(
+                'SELECT subzona AS "Subzona", titulo AS "Título", precio AS "Precio (€)", '
+                'superficie AS "Superficie (m²)", motivo AS "Motivo" FROM rechazados WHERE id_trabajo = ?',
+                con, params=[int(id_trabajo)],
+            )
+
+    # --- TRABAJADORES ---
+
+    def latido_trabajador(self, nombre, trabajo=None):
+        ahora = time.time()
+        with self._conectar() as con:
+            con.execute(
+                "INSERT INTO trabajadores (nombre, pid, inicio, latido, trabajo) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (nombre) DO UPDATE SET latido = excluded.latido, trabajo = excluded.trabajo",
+                (nombre, os.getpid(), ahora, ahora, trabajo),
+            )
+
+    def baja_trabajador(self, nombre):
+        with self._conectar() as con:
+            con.execute("DELETE FROM trabajadores WHERE nombre = ?", (nombre,))
+
+    def trabajadores_activos(self):
+        """Trabajadores con latido reciente (DataFrame)."""
+        with self._conectar() as con:
+            return pd.read_sql_query(
+                "SELECT * FROM trabajadores WHERE latido >= ?", con, params=[time.time() - LATIDO_CADUCADO]
+            )
+
+    # --- LECTURA (páginas y CLI) ---
+
+    def resumen(self):
+        """Número de trabajos por estado."""
+        with self._conectar() as con:
+            conteo = dict(con.execute("SELECT estado, COUNT(*) FROM trabajos GROUP BY estado").fetchall())
+        return {estado: conteo.get(estado, 0) for estado in (PENDIENTE, EN_CURSO, HECHO, ERROR, CANCELADO)}
+
+    def tabla(self, limite=50, estados=None):
+        """Últimos trabajos (los activos primero) como DataFrame con fechas legibles."""
+        where, params = "", []
+        if estados:
+            where = f" WHERE estado IN ({', '.join('?' * len(estados))})"
+            params = list(estados)
+        with self._conectar() as con:
+            df = pd.read_sql_query(
+                f"SELECT * FROM trabajos{where} ORDER BY estado NOT IN ('{EN_CURSO}', '{PENDIENTE}'), "
+                f"COALESCE(fin, programado) DESC, id DESC LIMIT ?", con, params=params + [int(limite)],
+            )
+        for columna in ["creado", "programado", "inicio", "fin", "latido"]:
+            df[columna] = _fecha_local(df[columna])
+        return df
+
+    def tasas_cache(self, horas=24.0):
+        """Aciertos y fallos de la caché de scraping en los trabajos terminados en las últimas `horas`."""
+        with self._conectar() as con:
+            aciertos, fallos = con.execute(
+                "SELECT COALESCE(SUM(aciertos_cache), 0), COALESCE(SUM(fallos_cache), 0) FROM trabajos "
+                "WHERE estado = ? AND fin >= ?", (HECHO, time.time() - horas * 3600),
+            ).fetchone()
+        consultas = aciertos + fallos
+        return {"aciertos": aciertos, "fallos": fallos, "tasa_acierto": aciertos / consultas if consultas else 0.0}
+
+    def ultimos_refrescos(self):
+        """Fecha del último scraping correcto de cada subzona."""
+        with self._conectar() as con:
+            df = pd.read_sql_query(
+                "SELECT zona, subzona, MAX(fin) AS fin, COUNT(*) AS trabajos FROM trabajos "
+                "WHERE estado = ? GROUP BY zona, subzona ORDER BY zona, subzona", con, params=[HECHO],
+            )
+        df["fin"] = _fecha_local(df["fin"])
+        return df
+
+
+class Trabajador:
+    """Ejecuta los trabajos de la cola: scraping, almacén e índice de mercado."""
+
+    def __init__(self, cola=None, almacen=None, cache=None, nombre=None):
+        from almacen_comparables import AlmacenComparables
+        from cache_scraping import obtener_cache
+        from indice_mercado import IndiceMercado
+
+        self.cola = cola or ColaTrabajos()
+        self.almacen = almacen or AlmacenComparables()
+        self.indice = IndiceMercado(self.almacen)
+        self.cache = cache or obtener_cache()
+        self.nombre = nombre or f"{socket.gethostname()}:{os.getpid()}"
+
+    def _avanzar(self, trabajo, progreso):
+        self.cola.avanzar(trabajo["id"], progreso)
+        self.cola.latido_trabajador(self.nombre, trabajo["id"])
+
+    def ejecutar(self, trabajo):
+        """Scrapea la subzona del trabajo y guarda los anuncios; devuelve el resumen."""
+        from scraper_idealista import SUBZONAS_M30, scrapear
+
+        url = SUBZONAS_M30.get(trabajo["zona"], {}).get(trabajo["subzona"])
+        if url is None:
+            raise ValueError(f"Subzona desconocida: {trabajo['zona']} / {trabajo['subzona']}")
+        # Los contadores de la caché son del proceso trabajador: se guarda lo de cada trabajo
+        aciertos, fallos = self.cache.aciertos, self.cache.fallos
+        df, errores = scrapear(
+            [(trabajo["zona"], trabajo["subzona"], url)], paginas=trabajo["paginas"], cache=self.cache,
+            # La última décima queda para guardar en el almacén
+            progreso=lambda hechas, total: self._avanzar(trabajo, 0.9 * hechas / total),
+        )
+        if df.empty and errores:
+            raise RuntimeError(f"{len(errores)} páginas con error: {errores[0][2]}")
+        rechazados = df.attrs.get("rechazados")
+        if rechazados is not None and not rechazados.empty:
+            self.cola.guardar_rechazados(trabajo["id"], rechazados)
+        resultado = {"filas": len(df), "errores_pagina": len(errores),
+                     "rechazados": len(df.attrs.get("rechazados", ())),
+                     "aciertos_cache": self.cache.aciertos - aciertos, "fallos_cache": self.cache.fallos - fallos,
+                     "error": f"Página {errores[0][1]}: {errores[0][2]}" if errores else None}
+        if not df.empty:
+            cambios = self.almacen.actualizar(df)
+            resultado.update(nuevos=cambios["nuevos"], cambios_precio=cambios["cambios_precio"])
+            self.indice.actualizar()
+        return resultado
+
+    def ejecutar_uno(self):
+        """Toma y ejecuta un trabajo. Devuelve el trabajo (dict) o None si la cola está vacía."""
+        trabajo = self.cola.tomar(self.nombre)
+        if trabajo is None:
+            return None
+        self.cola.latido_trabajador(self.nombre, trabajo["id"])
+        try:
+            self.cola.terminar(trabajo["id"], self.ejecutar(trabajo))
+            trabajo["estado"] = HECHO
+        except Exception as e:
+            trabajo["estado"] = self.cola.fallar(trabajo["id"], e)
+        return trabajo
+
+    def bucle(self, espera=5.0, intervalo_horas=INTERVALO_REFRESCO_HORAS, paginas=PAGINAS_POR_DEFECTO,
+              ventana=None, programar=True, una_vez=False, registro=print):
+        """
+        Bucle del proceso trabajador: programa los refrescos vencidos, ejecuta los
+        pendientes y espera cuando no hay nada que hacer. Con una_vez termina al vaciar la cola.
+        """
+        registro(f"Trabajador {self.nombre} en {self.cola.ruta}")
+        try:
+            while True:
+                self.cola.latido_trabajador(self.nombre)
+                if programar:
+                    nuevos = self.cola.programar_refrescos(intervalo_horas, paginas, ventana)
+                    if nuevos:
+                        registro(f"{len(nuevos)} subzonas programadas para refresco")
+                trabajo = self.ejecutar_uno()
+                if trabajo is not None:
+                    registro(f"Trabajo {trabajo['id']} ({trabajo['subzona']}): {trabajo['estado']}")
+                elif una_vez:
+                    return
+                else:
+                    time.sleep(espera)
+        finally:
+            self.cola.baja_trabajador(self.nombre)
+
+
+def iniciar_proceso(argumentos=(), registro=None):
+    """
+    Lanza el trabajador como proceso independiente (sobrevive a la sesión de Streamlit)
+    y devuelve su PID. La salida va a trabajos_scraping.log junto a la cola.
+    """
+    registro = registro or os.path.join(os.path.dirname(RUTA_TRABAJOS) or ".", "trabajos_scraping.log")
+    with open(registro, "a", encoding="utf-8") as salida:
+        proceso = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "trabajar", *argumentos],
+            stdout=salida, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL, start_new_session=True,
+        )
+    return proceso.pid
+
+
+def _ventana(texto):
+    inicio, fin = (int(h) for h in texto.split("-"))
+    return inicio, fin
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cola de trabajos de scraping en segundo plano (ADCO)")
+    parser.add_argument("--cola", help="Base de datos de la cola (por defecto junto al almacén)")
+    sub = parser.add_subparsers(dest="orden", required=True)
+
+    trabajar = sub.add_parser("trabajar", help="Proceso trabajador")
+    trabajar.add_argument("--espera", type=float, default=5.0, help="Segundos entre consultas con la cola vacía")
+    trabajar.add_argument("--intervalo-horas", type=float, default=INTERVALO_REFRESCO_HORAS,
+                          help="Antigüedad a partir de la que se refresca una subzona")
+    trabajar.add_argument("--paginas", type=int, default=PAGINAS_POR_DEFECTO, help="Páginas por subzona en los refrescos")
+    trabajar.add_argument("--ventana", type=_ventana, help="Franja horaria de los refrescos programados, p. ej. 1-7")
+    trabajar.add_argument("--sin-programar", action="store_true", help="Solo ejecutar lo encolado a mano")
+    trabajar.add_argument("--una-vez", action="store_true", help="Terminar cuando la cola quede vacía")
+
+    encolar = sub.add_parser("encolar", help="Encolar subzonas")
+    encolar.add_argument("--zona")
+    encolar.add_argument("--subzona")
+    encolar.add_argument("--m30", action="store_true", help="Todas las subzonas de la M-30")
+    encolar.add_argument("--paginas", type=int, default=PAGINAS_POR_DEFECTO)
+
+    sub.add_parser("estado", help="Resumen y últimos trabajos")
+    cancelar = sub.add_parser("cancelar", help="Cancelar trabajos pendientes")
+    cancelar.add_argument("id", nargs="?", type=int, help="ID del trabajo (todos los pendientes si se omite)")
+    args = parser.parse_args(argv)
+
+    cola = ColaTrabajos(args.cola)
+    if args.orden == "trabajar":
+        # kill/parada del servicio: salir por el finally del bucle para darse de baja
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        Trabajador(cola).bucle(args.espera, args.intervalo_horas, args.paginas, args.ventana,
+                               programar=not args.sin_programar, una_vez=args.una_vez,
+                               registro=lambda mensaje: print(f"{datetime.now():%Y-%m-%d %H:%M:%S} {mensaje}", flush=True))
+    elif args.orden == "encolar":
+        if args.m30:
+            ids = cola.encolar_m30(args.paginas)
+        elif args.subzona:
+            ids = [cola.encolar(args.zona, args.subzona, args.paginas)]
+        else:
+            parser.error("Indica --m30 o --zona y --subzona")
+        print(f"{len(ids)} trabajos en cola: {ids}")
+    elif args.orden == "estado":
+        print(cola.resumen())
+        print("Caché de scraping (24 h):", cola.tasas_cache())
+        columnas = ["id", "zona", "subzona", "estado", "progreso", "intentos", "filas", "nuevos", "fin", "error"]
+        print(cola.tabla(20)[columnas].to_string(index=False))
+    elif args.orden == "cancelar":
+        print(f"{cola.cancelar(args.id)} trabajos cancelados")
+
+
+if __name__ == "__main__":
+    main()
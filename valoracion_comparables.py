@@ -0,0 +1,217 @@
+# ADCO - Valoración automática por comparables
+# Índice de vecinos más cercanos sobre el almacén (posición de la subzona, superficie,
+# habitaciones, baños y estado) que devuelve los k anuncios más parecidos a un inmueble
+# y un €/m² ponderado con su banda de confianza, para un inmueble o para lotes enteros.
+
+import numpy as np
+import pandas as pd
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # scipy es opcional: sin él se usa búsqueda exhaustiva por bloques
+    cKDTree = None
+
+from almacen_comparables import AlmacenComparables, COLUMNAS
+from instrumentacion import medido
+from parser_anuncios import enlace_anuncio
+from scraper_idealista import SUBZONAS_M30
+
+# Centro aproximado de cada subzona (latitud, longitud)
+CENTROIDES_SUBZONA = {
+    "Almagro": (40.4330, -3.6930),
+    "Trafalgar": (40.4320, -3.7020),
+    "Ríos Rosas": (40.4420, -3.6990),
+    "Arapiles": (40.4340, -3.7090),
+    "Vallehermoso": (40.4430, -3.7110),
+    "Gaztambide": (40.4330, -3.7170),
+    "Recoletos": (40.4240, -3.6870),
+    "Castellana": (40.4330, -3.6850),
+    "Lista": (40.4300, -3.6760),
+    "Goya": (40.4240, -3.6760),
+    "Fuente del Berro": (40.4250, -3.6640),
+    "Guindalera": (40.4370, -3.6690),
+    "Sol": (40.4170, -3.7040),
+    "Chueca Justicia": (40.4240, -3.6970),
+    "Malasaña-Universidad": (40.4250, -3.7070),
+    "Lavapiés Embajadores": (40.4090, -3.7030),
+    "Huertas Cortes": (40.4140, -3.6980),
+    "Palacio": (40.4150, -3.7130),
+}
+CENTROIDES_ZONA = {
+    zona: tuple(np.mean([CENTROIDES_SUBZONA[s] for s in subzonas], axis=0))
+    for zona, subzonas in SUBZONAS_M30.items()
+}
+ORIGEN = (40.4168, -3.7038)  # Puerta del Sol
+KM_GRADO_LAT = 111.2
+KM_GRADO_LON = 111.2 * np.cos(np.radians(ORIGEN[0]))
+
+# Peso de cada atributo en la distancia: 1 unidad = 1 km de separación
+PESOS = {
+    "x_km": 1.0,
+    "y_km": 1.0,
+    "log_superficie": 3.0,   # ±30 % de superficie ≈ 0,8 km
+    "habitaciones": 0.3,
+    "banos": 0.3,
+    "reformado": 1.5,        # a reformar frente a reformado ≈ 1,5 km
+}
+ATRIBUTOS = list(PESOS)
+
+# Estado como nivel de acabado: 0 = a reformar, 1 = reformado/obra nueva
+NIVEL_ESTADO = {"A reformar": 0.0, "Reformado": 1.0, "Obra nueva": 1.0}
+
+K_POR_DEFECTO = 10
+CUANTILES_BANDA = (0.1, 0.9)
+# Elementos máximos de la matriz de distancias en la búsqueda exhaustiva
+BLOQUE_DISTANCIAS = 20_000_000
+
+
+def posicion(zona, subzona):
+    """Coordenadas en km (este, norte) respecto a Sol del centro de la subzona o, si no, de la zona."""
+    zona = pd.Series(zona, dtype=object).reset_index(drop=True)
+    subzona = pd.Series(subzona, dtype=object).reset_index(drop=True)
+    centro = subzona.map(CENTROIDES_SUBZONA)
+    centro = centro.where(centro.notna(), zona.map(CENTROIDES_ZONA))
+    lat = centro.map(lambda c: c[0] if isinstance(c, tuple) else np.nan).to_numpy(dtype=float)
+    lon = centro.map(lambda c: c[1] if isinstance(c, tuple) else np.nan).to_numpy(dtype=float)
+    return (lon - ORIGEN[1]) * KM_GRADO_LON, (lat - ORIGEN[0]) * KM_GRADO_LAT
+
+
+def atributos(df):
+    """Matriz de atributos ponderados (n × ATRIBUTOS) de un DataFrame en el esquema del almacén."""
+    x, y = posicion(df["zona"], df.get("subzona", pd.Series(None, index=df.index)))
+    columnas = {
+        "x_km": x,
+        "y_km": y,
+        "log_superficie": np.log(pd.to_numeric(df["superficie"], errors="coerce").to_numpy(dtype=float)),
+        "habitaciones": pd.to_numeric(df.get("habitaciones"), errors="coerce"),
+        "banos": pd.to_numeric(df.get("banos"), errors="coerce"),
+        "reformado": df["estado"].map(NIVEL_ESTADO) if "estado" in df.columns else None,
+    }
+    matriz = np.column_stack([
+        np.full(len(df), np.nan) if valor is None else np.asarray(valor, dtype=float) * PESOS[nombre]
+        for nombre, valor in columnas.items()
+    ])
+    return matriz
+
+
+def _cuantil_ponderado(valores, pesos, q):
+    """Cuantil q de cada fila de valores con sus pesos (n × k)."""
+    orden = np.argsort(valores, axis=1)
+    valores = np.take_along_axis(valores, orden, axis=1)
+    pesos = np.take_along_axis(pesos, orden, axis=1)
+    acumulado = np.cumsum(pesos, axis=1)
+    acumulado /= acumulado[:, -1:]
+    posicion_q = (acumulado < q).sum(axis=1).clip(max=valores.shape[1] - 1)
+    return valores[np.arange(len(valores)), posicion_q]
+
+
+class ValoradorComparables:
+    """Índice de vecinos sobre los comparables; se construye una vez y se consulta muchas."""
+
+    def __init__(self, comparables):
+        comparables = comparables.dropna(subset=["eur_m2", "superficie"]).reset_index(drop=True)
+        matriz = atributos(comparables)
+        con_posicion = ~np.isnan(matriz[:, :2]).any(axis=1)
+        self.comparables = comparables[con_posicion].reset_index(drop=True)
+        self.matriz = matriz[con_posicion]
+        # Atributos que faltan en los comparables: la media de su columna (no aporta distancia)
+        huecos = np.isnan(self.matriz)
+        if huecos.any():
+            conocidos = (~huecos).sum(axis=0)
+            medias = np.divide(np.nansum(self.matriz, axis=0), conocidos,
+                               out=np.zeros(self.matriz.shape[1]), where=conocidos > 0)
+            self.matriz[huecos] = medias[np.nonzero(huecos)[1]]
+        self.eur_m2 = self.comparables["eur_m2"].to_numpy(dtype=float)
+        self._arboles = {}
+
+    @classmethod
+    def desde_almacen(cls, almacen=None, zona=None):
+        """Valorador sobre la instantánea compacta del almacén (sin descripciones ni enlaces)."""
+        almacen = almacen or AlmacenComparables()
+        df = almacen.cargar_compacto(zona=zona).reset_index()
+        return cls(df.rename(columns={v: k for k, v in COLUMNAS.items()}))
+
+    def __len__(self):
+        return len(self.comparables)
+
+    def _buscar(self, consultas, columnas, k):
+        """(distancias, índices) de los k vecinos usando solo las columnas indicadas."""
+        puntos = self.matriz[:, columnas]
+        if cKDTree is not None:
+            clave = tuple(columnas)
+            if clave not in self._arboles:
+                self._arboles[clave] = cKDTree(puntos)
+            distancias, indices = self._arboles[clave].query(consultas, k=k)
+            return distancias.reshape(len(consultas), k), indices.reshape(len(consultas), k)
+
+        distancias = np.empty((len(consultas), k))
+        indices = np.empty((len(consultas), k), dtype=int)
+        normas = (puntos ** 2).sum(axis=1)
+        paso = max(1, BLOQUE_DISTANCIAS // max(len(puntos), 1))
+        for inicio in range(0, len(consultas), paso):
+            q = consultas[inicio:inicio + paso]
+            d2 = np.maximum((q ** 2).sum(axis=1)[:, None] + normas[None, :] - 2 * q @ puntos.T, 0.0)
+            cercanos = np.argpartition(d2, k - 1, axis=1)[:, :k] if k < len(puntos) else np.tile(np.arange(len(puntos)), (len(q), 1))
+            d2_cercanos = np.take_along_axis(d2, cercanos, axis=1)
+            orden = np.argsort(d2_cercanos, axis=1)
+            indices[inicio:inicio + paso] = np.take_along_axis(cercanos, orden, axis=1)
+            distancias[inicio:inicio + paso] = np.sqrt(np.take_along_axis(d2_cercanos, orden, axis=1))
+        return distancias, indices
+
+    def buscar(self, sujetos, k=K_POR_DEFECTO):
+        """
+        k vecinos de cada inmueble (DataFrame con zona, subzona, superficie y, si se conocen,
+        habitaciones, banos y estado). Los atributos desconocidos del inmueble no cuentan en
+        la distancia. Devuelve (distancias, índices) de forma n × k.
+        """
+        k = min(k, len(self))
+        consultas = atributos(sujetos)
+        distancias = np.full((len(sujetos), k), np.nan)
+        indices = np.full((len(sujetos), k), -1)
+        conocidos = ~np.isnan(consultas)
+        validas = conocidos[:, :3].all(axis=1)
+        # Un grupo por combinación de atributos conocidos (normalmente uno o dos)
+        patrones, grupo = np.unique(conocidos, axis=0, return_inverse=True)
+        for g, patron in enumerate(patrones):
+            filas = np.flatnonzero((grupo.ravel() == g) & validas)
+            if len(filas) and k:
+                columnas = np.flatnonzero(patron)
+                distancias[filas], indices[filas] = self._buscar(consultas[np.ix_(filas, columnas)], columnas, k)
+        return distancias, indices
+
+    @medido("valoracion.valorar", filas=len)
+    def valorar(self, sujetos, k=K_POR_DEFECTO):
+        """
+        €/m² estimado de cada inmueble como media de sus k vecinos ponderada por la inversa
+        de la distancia, con banda P10-P90 ponderada. Añade el precio estimado si hay superficie.
+        """
+        sujetos = sujetos.reset_index(drop=True)
+        distancias, indices = self.buscar(sujetos, k)
+        encontrado = indices[:, 0] >= 0 if indices.size else np.zeros(len(sujetos), dtype=bool)
+        resultado = pd.DataFrame({
+            "eur_m2_estimado": np.nan, "eur_m2_bajo": np.nan, "eur_m2_alto": np.nan,
+            "n_comparables": 0, "distancia_media": np.nan,
+        }, index=sujetos.index)
+        if encontrado.any():
+            valores = self.eur_m2[indices[encontrado]]
+            pesos = 1 / (distancias[encontrado] + 0.05)
+            resultado.loc[encontrado, "eur_m2_estimado"] = (valores * pesos).sum(axis=1) / pesos.sum(axis=1)
+            resultado.loc[encontrado, "eur_m2_bajo"] = _cuantil_ponderado(valores, pesos, CUANTILES_BANDA[0])
+            resultado.loc[encontrado, "eur_m2_alto"] = _cuantil_ponderado(valores, pesos, CUANTILES_BANDA[1])
+            resultado.loc[encontrado, "n_comparables"] = indices.shape[1]
+            resultado.loc[encontrado, "distancia_media"] = distancias[encontrado].mean(axis=1)
+        superficie = pd.to_numeric(sujetos["superficie"], errors="coerce")
+        resultado["precio_estimado"] = resultado["eur_m2_estimado"] * superficie
+        resultado["precio_bajo"] = resultado["eur_m2_bajo"] * superficie
+        resultado["precio_alto"] = resultado["eur_m2_alto"] * superficie
+        return resultado
+
+    def vecinos(self, sujeto, k=K_POR_DEFECTO):
+        """Los k comparables más parecidos a un inmueble (dict), con su distancia."""
+        distancias, indices = self.buscar(pd.DataFrame([sujeto]), k)
+        if not indices.size or indices[0, 0] < 0:
+            return self.comparables.iloc[0:0].assign(distancia=[])
+        vecinos = self.comparables.iloc[indices[0]].assign(distancia=distancias[0]).reset_index(drop=True)
+        if "link" not in vecinos.columns and "id_anuncio" in vecinos.columns:
+            vecinos["link"] = vecinos["id_anuncio"].map(enlace_anuncio)
+        return vecinos